@@ -4,7 +4,7 @@ from logging.handlers import RotatingFileHandler
 from datetime import timedelta
 import pytz
 
-from flask import Flask
+from flask import Flask, appcontext_pushed
 from dotenv import load_dotenv
 
 # 載入 .env 檔案中的環境變數
@@ -13,6 +13,9 @@ load_dotenv()
 # 導入資料庫模組，我們將在 create_app 中初始化它
 import database as db
 
+def _hold_db_connection(_sender, **_extra):
+    db.hold_connection()
+
 def create_app(start_scheduler=True):
     """
     建立並設定 Flask 應用程式的工廠函式。
@@ -44,6 +47,28 @@ def create_app(start_scheduler=True):
     app.config['LINE_LOGIN_CHANNEL_SECRET'] = os.getenv("LINE_LOGIN_CHANNEL_SECRET")
     app.config['TAIPEI_TZ'] = pytz.timezone('Asia/Taipei')
     app.config['ADMIN_API_TOKEN'] = os.getenv("ADMIN_API_TOKEN")
+    # Webhook 事件改由背景佇列處理；設為 false 時在請求中同步處理
+    app.config['WEBHOOK_ASYNC'] = os.getenv("WEBHOOK_ASYNC", "true").lower() != "false"
+    app.config['WEBHOOK_WORKERS'] = int(os.getenv("WEBHOOK_WORKERS", "4"))
+    app.config['WEBHOOK_MAX_PENDING'] = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+    # 佇列已滿時等待空位的秒數，逾時則回應 503 讓 LINE 重送
+    app.config['WEBHOOK_SUBMIT_TIMEOUT'] = float(os.getenv("WEBHOOK_SUBMIT_TIMEOUT", "2"))
+    # 提醒等批次推播的並行數（送出速率另由 LINE_PUSH_RATE 限制）
+    app.config['PUSH_WORKERS'] = int(os.getenv("PUSH_WORKERS", "8"))
+    # 管理介面發送提醒時最多等待的秒數，超過則先回應，推播繼續在背景發送
+    app.config['REMINDER_RESPONSE_WAIT'] = float(os.getenv("REMINDER_RESPONSE_WAIT", "3"))
+
+    # --- Webhook 背景佇列 ---
+    from .utils.webhook_queue import webhook_queue
+    webhook_queue.configure(app.config['WEBHOOK_WORKERS'], app.config['WEBHOOK_MAX_PENDING'])
+
+    # --- 資料庫連線池 ---
+    # 在 app context（每個請求或排程任務）期間，同一執行緒重複使用同一條連線，結束時歸還連線池
+    appcontext_pushed.connect(_hold_db_connection, app, weak=False)
+
+    @app.teardown_appcontext
+    def release_db_connection(_exception=None):
+        db.release_connection()
 
     # --- 初始化資料庫 ---
     with app.app_context():
@@ -69,6 +94,11 @@ def create_app(start_scheduler=True):
         # 將檔案處理器加入到 app 的 logger 中
         app.logger.addHandler(file_handler)
 
+    # --- 預載注音字典 ---
+    # pypinyin 的字典在第一次轉換時才載入，啟動時先載入，避免由第一位新用戶的請求承擔
+    warm_up_seconds = db.warm_up_zhuyin()
+    app.logger.info(f"注音字典預載完成（{warm_up_seconds * 1000:.0f} ms）")
+
     # --- 註冊藍圖 (Blueprints) ---
     from .routes.auth import auth_bp
     from .routes.auth_api import auth_api_bp
@@ -30,6 +30,62 @@ def set_admin_command():
         except (ValueError, IndexError):
             print("輸入無效，請輸入數字編號。")
 
+@click.command('check-indexes')
+@with_appcontext
+def check_indexes_command():
+    """建立索引並以 EXPLAIN QUERY PLAN 檢查熱門查詢是否都有使用索引。"""
+    db.init_database()
+    results = db.check_hot_query_plans()
+    for result in results:
+        mark = "❌" if result['full_scan'] else "✅"
+        print(f"{mark} {result['name']}")
+        for detail in result['plan']:
+            print(f"      {detail}")
+    full_scans = [result['name'] for result in results if result['full_scan']]
+    if full_scans:
+        print(f"以下查詢仍有全表掃描: {', '.join(full_scans)}")
+        raise SystemExit(1)
+    print(f"索引版本 {db.INDEX_SET_VERSION}，所有熱門查詢皆使用索引。")
+
+@click.command('rebuild-message-stats')
+@with_appcontext
+def rebuild_message_stats_command():
+    """由 message_log 重新計算發送統計日彙總表（message_stats_daily）。"""
+    row_count = db.rebuild_message_stats_daily()
+    print(f"✅ 已重建發送統計彙總，共 {row_count} 筆（日期 × 類型 × 狀態）。")
+
+@click.command('archive-message-log')
+@click.option('--days', type=int, default=None, help='保存天數，預設讀取 message_log_retention_days 設定')
+@with_appcontext
+def archive_message_log_command(days):
+    """封存並刪除超過保存期限的發送紀錄，然後整理資料庫空間。"""
+    if days is None:
+        days = int(db.get_config('message_log_retention_days', '180') or '180')
+    if days <= 0:
+        print("保存期限設為 0（永久保存），不封存任何紀錄。")
+    else:
+        result = db.archive_message_log(days)
+        print(f"已封存 {result['archived']} 筆 {result['cutoff']} (UTC) 之前的發送紀錄。")
+        if result['archive_file']:
+            print(f"封存檔: {result['archive_file']}")
+    compact = db.compact_database()
+    print(f"✅ 資料庫整理完成（{compact['mode']}），釋放 {compact['freed_pages']} 頁。")
+
+@click.command('regenerate-zhuyin')
+@click.option('--only-missing', is_flag=True, help='只處理尚未有注音的用戶')
+@with_appcontext
+def regenerate_zhuyin_command(only_missing):
+    """重新計算所有用戶的注音，並以單一交易批次寫回。"""
+    result = db.regenerate_all_zhuyin(only_missing=only_missing)
+    print(f"處理 {result['users']} 位用戶（{result['names']} 個不重複姓名），更新 {result['updated']} 筆。")
+    print(f"計算 {result['compute_seconds'] * 1000:.1f} ms、寫入 {result['write_seconds'] * 1000:.1f} ms，"
+          f"每秒 {result['users_per_second']:.0f} 位用戶。")
+    print("✅ 注音重新計算完成。")
+
 def init_commands(app):
     """向 Flask app 註冊所有自訂指令。"""
-    app.cli.add_command(set_admin_command)
\ No newline at end of file
+    app.cli.add_command(set_admin_command)
+    app.cli.add_command(check_indexes_command)
+    app.cli.add_command(rebuild_message_stats_command)
+    app.cli.add_command(archive_message_log_command)
+    app.cli.add_command(regenerate_zhuyin_command)
\ No newline at end of file
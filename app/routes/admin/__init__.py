@@ -7,4 +7,4 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 api_admin_bp = Blueprint('api_admin', __name__, url_prefix='/api/admin')
 
 # Import the routes to register them with the blueprints
-from . import pages, user_api, appointment_api, config_api, schedule_api, test_api
\ No newline at end of file
+from . import pages, user_api, appointment_api, config_api, schedule_api, test_api, metrics_api, events_api
\ No newline at end of file
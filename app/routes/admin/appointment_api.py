@@ -2,12 +2,14 @@ from flask import (
     request, jsonify, current_app
 )
 import json
+from collections import defaultdict
 from datetime import datetime
 
 import database as db
 from app.utils.decorators import admin_required, api_error_handler
-from app.utils.helpers import get_week_dates, generate_time_slots
-from app.scheduler.jobs import _do_send_reminders # 導入新的提醒函式
+from app.utils.helpers import get_week_dates
+from app.scheduler.jobs import _build_reminder_pushes
+from app.utils.push_dispatcher import push_jobs
 from . import api_admin_bp
 
 def _truncate_name(name, limit=7):
@@ -21,32 +23,39 @@ def _truncate_name(name, limit=7):
 def get_week_appointments():
     week_offset = int(request.args.get('offset', 0))
     week_dates = get_week_dates(week_offset)
-    
-    # 取得所有用戶並預先截斷名稱
-    all_users_raw = db.get_all_users()
-    all_users = []
-    for user in all_users_raw:
-        processed_user = user.copy()
-        # 在此處截斷用戶列表中的名稱
-        if 'name' in processed_user and processed_user['name']:
-            processed_user['name'] = _truncate_name(processed_user['name'])
-        processed_user['user_id'] = str(user.get('user_id', '')) if user.get('user_id') is not None else ''
-        processed_user['line_user_id'] = str(user.get('user_id', '')) if user.get('user_id') is not None else ''
-        processed_user['id'] = processed_user['user_id']
-        all_users.append(processed_user)
+
+    # 用戶列表改由 /api/admin/users/sync 增量同步，新版前端以 users=0 省略；
+    # 預設仍附上用戶列表，讓尚未重新打包的前端繼續運作
+    include_users = request.args.get('users', '1') != '0'
+
+    # 以資料版本產生 ETag：資料沒有變動時直接回傳 304，不重新組裝整週資料
+    etag = f"week-{week_dates[0]['date']}-s{db.get_data_version('schedule')}"
+    if include_users:
+        etag += f"-u{db.get_data_version('users')}"
+    if request.if_none_match.contains(etag):
+        not_modified = current_app.response_class(status=304)
+        not_modified.set_etag(etag)
+        not_modified.headers['Cache-Control'] = 'no-cache'
+        return not_modified
 
     week_schedule = {}
-    waiting_lists = db.get_waiting_lists_by_date_range(week_dates[0]['date'], week_dates[-1]['date'])
-    all_closed_days = {day['date'] for day in db.get_all_closed_days()}
+    # 一次取得整週的預約、休診日與備取名單，之後全部在記憶體中組裝
+    snapshot = db.get_week_snapshot(week_dates[0]['date'], week_dates[-1]['date'])
+    waiting_lists = snapshot['waiting_lists']
+    all_closed_days = snapshot['closed_days']
+
+    appointments_by_date = defaultdict(list)
+    for apt in snapshot['appointments']:
+        appointments_by_date[apt['date']].append(apt)
     
     for date_info in week_dates:
         date_str = date_info['date']
         weekday = date_info['weekday']
         
-        time_slots_consultation = generate_time_slots(weekday, 'consultation')
-        time_slots_massage = generate_time_slots(weekday, 'massage')
+        time_slots_consultation = db.get_slot_template(weekday, 'consultation')
+        time_slots_massage = db.get_slot_template(weekday, 'massage')
         
-        appointments = db.get_appointments_by_date_range(date_str, date_str)
+        appointments = appointments_by_date[date_str]
         
         # 根據 type 區分預約
         appointments_map_consultation = {apt['time']: apt for apt in appointments if apt['status'] == 'confirmed' and apt.get('type', 'consultation') == 'consultation'}
@@ -91,10 +100,24 @@ def get_week_appointments():
         
     response_data = {
         'week_schedule': week_schedule,
-        'users': all_users,
         'week_offset': week_offset
     }
-    return jsonify(response_data)
+    if include_users:
+        response_data['users'] = [
+            {
+                'id': user.user_id,
+                'user_id': user.user_id,
+                'line_user_id': user.user_id,
+                'name': _truncate_name(user.name),
+                'zhuyin': user.zhuyin,
+                'is_admin': user.is_admin,
+            }
+            for user in db.get_user_directory()
+        ]
+    response = jsonify(response_data)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @api_admin_bp.route("/save_appointment", methods=["POST"])
 @admin_required
@@ -157,9 +180,32 @@ def send_appointment_reminders():
         appointments = db.get_appointments_by_date_range(start_date, end_date)
         reminder_type = 'week'
     appointments = [apt for apt in appointments if apt['status'] == 'confirmed']
-    # 直接使用 _do_send_reminders，並傳入當前的 app 物件
-    sent_count, failed_count = _do_send_reminders(current_app, appointments, reminder_type)
-    return jsonify({"status": "success", "sent_count": sent_count, "failed_count": failed_count})
+    # 推播在背景執行緒中發送，必須傳入實際的 app 物件而不是 current_app 代理
+    app = current_app._get_current_object()
+    pushes = _build_reminder_pushes(app, appointments, reminder_type)
+    job = push_jobs.start(app, pushes, app.config.get('PUSH_WORKERS'))
+    # 少量提醒通常很快送完，直接回傳結果；否則先回傳 202，之後由 /reminder_jobs/<job_id> 查詢結果
+    job = push_jobs.get(job['id'], wait=app.config.get('REMINDER_RESPONSE_WAIT', 3.0))
+    return _reminder_job_response(job)
+
+def _reminder_job_response(job):
+    if job['done']:
+        return jsonify({"status": "success", "job_id": job['id'], "done": True,
+                        "sent_count": job['sent'], "failed_count": job['failed']})
+    # 舊版前端只讀 sent_count，尚未完成時以已排入發送的數量回報
+    return jsonify({"status": "accepted", "job_id": job['id'], "done": False, "total": job['total'],
+                    "sent_count": job['total'], "failed_count": 0}), 202
+
+@api_admin_bp.route("/reminder_jobs/<job_id>", methods=["GET"])
+@admin_required
+@api_error_handler
+def get_reminder_job(job_id):
+    """查詢背景提醒任務的結果；wait 參數可等待最多 10 秒"""
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 10)
+    job = push_jobs.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"status": "error", "message": "找不到此提醒任務"}), 404
+    return _reminder_job_response(job)
 
 @api_admin_bp.route("/appointments/<int:appointment_id>/confirm_reply", methods=["POST"])
 @admin_required
@@ -4,12 +4,16 @@ from flask import (
 
 import database as db
 from app.utils.decorators import admin_required, api_error_handler
+from app.utils.helpers import get_stats_month
 from . import api_admin_bp
 
 @api_admin_bp.route("/message_stats")
 @admin_required
 def message_stats_api():
     month = request.args.get('month')
+    # 未指定月份時統計全部；格式不正確時改用本月，避免 500
+    if month:
+        month = get_stats_month(month)
     message_type = request.args.get('type')
     user_id = request.args.get('user')
     stats_data = db.get_message_stats(month, user_id, message_type)
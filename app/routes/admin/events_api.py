@@ -0,0 +1,61 @@
+import json
+import queue
+import time
+
+from flask import Response, request
+
+from app.utils.change_feed import change_feed
+from app.utils.decorators import admin_required
+
+from . import api_admin_bp
+
+# 沒有事件時，每隔多久送出一次心跳，避免反向代理切斷閒置連線
+SSE_HEARTBEAT_SECONDS = 15
+# 單一串流的最長秒數，到期後由瀏覽器的 EventSource 自動重連（帶上 Last-Event-ID），釋放 worker 執行緒
+SSE_MAX_STREAM_SECONDS = 300
+
+def _format_sse(event):
+    data = json.dumps({"event_id": event['id'], "scope": event['scope'], **event['payload']}, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+@api_admin_bp.route("/events")
+@admin_required
+def stream_admin_events():
+    """
+    以 Server-Sent Events 推播排程變更（預約儲存/取消、回覆狀態、備取名單、休診日等），
+    取代管理介面每 15 秒一次的輪詢。
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    subscription = change_feed.subscribe(last_event_id)
+
+    def generate():
+        sent_id = last_event_id or 0
+        deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+        try:
+            # 通知瀏覽器斷線後 3 秒重連
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    events = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                for event in events:
+                    # 補送的事件可能與廣播重疊，依 ID 去除重複
+                    if event['id'] <= sent_id:
+                        continue
+                    sent_id = event['id']
+                    yield _format_sse(event)
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    # 注意：不使用 stream_with_context，串流期間不佔用 app context 與資料庫連線
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # 關閉 Nginx 緩衝，事件才能即時送達
+    })
@@ -0,0 +1,28 @@
+from flask import jsonify
+
+import database as db
+from app.utils.availability import horizon_cache
+from app.utils.change_feed import change_feed
+from app.utils.decorators import admin_required, api_error_handler
+from app.utils.line_client import line_client
+from app.utils.webhook_queue import webhook_queue
+
+from . import api_admin_bp
+
+
+@api_admin_bp.route("/metrics")
+@admin_required
+@api_error_handler
+def get_metrics():
+    """回傳目前 worker 進程的效能指標，用於觀察 gunicorn 負載下的資源使用情形。"""
+    return jsonify({
+        "status": "success",
+        "db_pool": db.get_pool_stats(),
+        "sse_subscribers": change_feed.subscriber_count(),
+        "webhook_queue": webhook_queue.stats(),
+        "line_api": line_client.stats(),
+        "message_log_buffer": db.get_message_log_stats(),
+        "bookings": db.get_booking_stats(),
+        "caches": db.get_cache_stats(),
+        "availability_horizon": horizon_cache.stats()
+    })
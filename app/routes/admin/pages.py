@@ -1,13 +1,12 @@
 from flask import (
     request, render_template, flash, redirect, url_for,
-    session, current_app
+    session
 )
-from datetime import datetime
 import json
 
 import database as db
 from app.utils.decorators import admin_required
-from app.utils.helpers import get_vue_assets
+from app.utils.helpers import get_stats_month, get_vue_assets
 from . import admin_bp
 
 @admin_bp.route("/")
@@ -47,11 +46,10 @@ def closed_days_page():
 @admin_required
 def stats_page():
     user = session.get('user')
-    TAIPEI_TZ = current_app.config['TAIPEI_TZ']
-    current_month = request.args.get('month', datetime.now(TAIPEI_TZ).strftime('%Y-%m'))
+    current_month = get_stats_month(request.args.get('month'))
     message_type = request.args.get('type', '')
     user_id = request.args.get('user', '')
-    all_users = db.get_all_users()
+    all_users = db.get_user_directory()
     stats_data = db.get_message_stats(
         month=current_month,
         message_type=message_type or None,
@@ -83,13 +81,14 @@ def configs_page():
     configs_dict.setdefault('auto_reminder_weekly_enabled', 'false')
     configs_dict.setdefault('auto_reminder_weekly_day', 'sun')
     configs_dict.setdefault('auto_reminder_weekly_time', '21:00')
+    configs_dict.setdefault('message_log_retention_days', '180')
     default_reminder_template = (
         "您好，提醒您{date_keyword} ({date}) 有預約以下時段：\n\n"
         "{time_slots}\n\n"
         "如果需要更改或取消，請與我們聯繫，謝謝。")
     configs_dict.setdefault('message_template_reminder', default_reminder_template)
 
-    admins = [u for u in db.get_all_users() if u.get('is_admin')]
+    admins = [u for u in db.get_user_directory() if u.is_admin]
     return render_template("configs.html", user=user, configs=configs_dict, admins=admins)
 
 @admin_bp.route('/set_admin_status', methods=['POST'])
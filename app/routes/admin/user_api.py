@@ -51,24 +51,45 @@ def generate_zhuyin_route(user_id):
 @admin_required
 @api_error_handler
 def api_get_users():
-    users = db.get_all_users()
     current_admin_id = session.get('user', {}).get('user_id')
     users_data = [
         {
-            "id": str(user.get('user_id', '')) if user.get('user_id') is not None else '',
-            "name": user.get('name', ''),
-            "line_user_id": str(user.get('user_id', '')) if user.get('user_id') is not None else '',
-            "is_admin": user.get('is_admin', False),
-            "zhuyin": user.get('zhuyin', ''),
-            "phone": user.get('phone', ''),
-            "phone2": user.get('phone2', ''),
-            "reminder_schedule": user.get('reminder_schedule', 'weekly')
+            "id": user.user_id,
+            "name": user.name or '',
+            "line_user_id": user.user_id,
+            "is_admin": user.is_admin,
+            "zhuyin": user.zhuyin or '',
+            "phone": user.phone or '',
+            "phone2": user.phone2 or '',
+            "reminder_schedule": user.reminder_schedule or 'weekly'
         } 
-        for user in users
+        for user in db.get_user_directory()
     ]
     allow_deletion = db.get_config('allow_user_deletion', 'false') == 'true'
     return jsonify({"status": "success", "users": users_data, "current_admin_id": current_admin_id, "allow_user_deletion": allow_deletion})
 
+@api_admin_bp.route('/users/sync', methods=['GET'])
+@admin_required
+@api_error_handler
+def api_sync_users():
+    """
+    用戶目錄的增量同步（週排程不再內嵌用戶列表）。
+    帶上次回傳的 sync_token 作為 since 參數，只回傳之後新增或修改的用戶與已刪除的 user_id；
+    未帶 since 時回傳完整列表（full 為 true）。
+    """
+    changes = db.get_user_changes(request.args.get('since') or None)
+    users = [
+        {"id": user['user_id'], "name": user['name'] or '', "zhuyin": user['zhuyin'] or '', "is_admin": user['is_admin']}
+        for user in changes['users']
+    ]
+    return jsonify({
+        "status": "success",
+        "users": users,
+        "deleted": changes['deleted'],
+        "sync_token": changes['sync_token'],
+        "full": changes['full'],
+    })
+
 @api_admin_bp.route('/users/<string:user_id>/toggle_admin', methods=['POST'])
 @admin_required
 @api_error_handler
@@ -1,9 +1,9 @@
 import os
 import uuid
-import requests
 from flask import Blueprint, request, session, redirect, url_for, flash, current_app
 
 import database as db
+from app.utils.line_client import line_client
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -44,8 +44,6 @@ def callback():
         return redirect(url_for('booking_page')) # 之後會改成 booking_bp.booking_page
 
     # 換取 Access Token
-    token_url = "https://api.line.me/oauth2/v2.1/token"
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
     data = {
         "grant_type": "authorization_code",
         "code": code,
@@ -53,15 +51,13 @@ def callback():
         "client_id": current_app.config.get('LINE_LOGIN_CHANNEL_ID'),
         "client_secret": current_app.config.get('LINE_LOGIN_CHANNEL_SECRET'),
     }
-    response = requests.post(token_url, headers=headers, data=data)
+    response = line_client.issue_access_token(data)
     if response.status_code != 200:
         flash("無法從 LINE 獲取 Token，請稍後再試。", "danger")
         return redirect(url_for('booking.booking_page'))
 
     # 獲取使用者資料
-    profile_url = "https://api.line.me/v2/profile"
-    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
-    profile_response = requests.get(profile_url, headers=headers)
+    profile_response = line_client.get_login_profile(response.json()['access_token'])
     if profile_response.status_code != 200:
         flash("無法獲取 LINE 使用者資料。", "danger")
         return redirect(url_for('booking.booking_page'))
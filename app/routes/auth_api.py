@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify, session, current_app
-import requests
 import database as db
+from app.utils.line_client import line_client
 
 auth_api_bp = Blueprint('auth_api', __name__)
 
@@ -22,14 +22,8 @@ def liff_login():
     if not channel_id:
         return jsonify({'status': 'error', 'message': 'Server configuration error: LINE_LOGIN_CHANNEL_ID not set'}), 500
 
-    verify_url = 'https://api.line.me/oauth2/v2.1/verify'
-    payload = {
-        'id_token': id_token,
-        'client_id': channel_id
-    }
-
     try:
-        response = requests.post(verify_url, data=payload)
+        response = line_client.verify_id_token(id_token, channel_id)
         
         if response.status_code != 200:
             current_app.logger.error(f"LIFF ID Token verification failed: {response.text}")
@@ -1,12 +1,16 @@
-from flask import Blueprint, request, session, render_template, jsonify
+from flask import Blueprint, request, session, render_template, jsonify, current_app
 from datetime import datetime
 import pytz
 
 import database as db
-from app.utils.helpers import get_week_dates, generate_time_slots, api_response
+from app.utils.helpers import get_week_dates, api_response
+from app.utils.availability import get_availability, build_horizon, horizon_cache
 
 booking_bp = Blueprint('booking', __name__)
 
+# 預約頁與 /api/book_appointment 只處理看診；可預約狀態必須用同一類型計算
+BOOKING_PAGE_TYPE = 'consultation'
+
 @booking_bp.route("/", methods=["GET"])
 def booking_page():
     if db.get_config('feature_booking_enabled') == 'false':
@@ -33,35 +37,58 @@ def booking_page():
         start_date = week_dates[0]['date']
         end_date = week_dates[-1]['date']
         
-        appointments_this_week = db.get_appointments_by_date_range(start_date, end_date)
-        booked_slots = {(apt['date'], apt['time']): apt['user_name'] for apt in appointments_this_week if apt['status'] == 'confirmed'}
-        closed_days = {day['date'] for day in db.get_all_closed_days()}
-
-        schedule_data = []
+        # 整週的可預約狀態以位元遮罩一次算好（已預約、休診、已過時段都已遮掉）。
+        # 只有同類型的預約會佔用時段（與唯一索引一致），過去的日期與今天已過的時段同樣不可預約
         TAIPEI_TZ = pytz.timezone('Asia/Taipei')
-        now = datetime.now(TAIPEI_TZ)
+        availability = get_availability(start_date, end_date, datetime.now(TAIPEI_TZ), BOOKING_PAGE_TYPE)
 
+        schedule_data = []
         for day in week_dates:
-             day['is_closed'] = day['date'] in closed_days
-             all_slots = generate_time_slots(day['weekday'])
-             day['slots'] = []
-             for slot in all_slots:                 
-                 is_available = (day['date'], slot) not in booked_slots and not day['is_closed']
-                 
-                 if is_available:
-                     try:
-                         slot_datetime = datetime.strptime(f"{day['date']} {slot}", '%Y-%m-%d %H:%M').replace(tzinfo=TAIPEI_TZ)
-                         if slot_datetime <= now:
-                             is_available = False
-                     except ValueError:
-                         pass
-                 day['slots'].append({'time': slot, 'available': is_available, 'user_name': booked_slots.get((day['date'], slot))})
-             schedule_data.append(day)
+            day_availability = availability[day['date']]
+            day['is_closed'] = day_availability.closed
+            mask = day_availability.mask
+            day['slots'] = [
+                {'time': slot, 'available': bool(mask >> bit & 1)}
+                for bit, slot in enumerate(day_availability.times)
+            ]
+            schedule_data.append(day)
     else:
         user = None
 
     return render_template("booking.html", user=user, schedule=schedule_data, week_offset=week_offset, max_weeks=max_weeks)
 
+@booking_bp.route("/api/availability", methods=["GET"])
+def api_availability():
+    """
+    一次回傳 booking_window_weeks 週內、所有預約類型的可預約狀態（格式見 availability.build_horizon），
+    供預約頁與 LIFF 預先載入並在各週之間切換，不必每週重新請求。
+    """
+    if db.get_config('feature_booking_enabled') == 'false':
+        return api_response(error="Feature disabled", status_code=404)
+
+    try:
+        max_weeks = int(db.get_config('booking_window_weeks', '2') or '2')
+    except (ValueError, TypeError):
+        max_weeks = 2
+    max_weeks = max(1, max_weeks)
+
+    # 預約、休診與時段異動都會遞增 schedule 版本；今天已過的時段每分鐘變化一次
+    now = datetime.now(current_app.config['TAIPEI_TZ'])
+    etag = f"avail-s{db.get_data_version('schedule')}-w{max_weeks}-{now.strftime('%Y%m%d%H%M')}"
+    if request.if_none_match.contains(etag):
+        not_modified = current_app.response_class(status=304)
+        not_modified.set_etag(etag)
+        not_modified.headers['Cache-Control'] = 'no-cache'
+        return not_modified
+
+    horizon = horizon_cache.get(
+        (db.DB_FILE, etag), lambda: build_horizon([get_week_dates(week_offset) for week_offset in range(max_weeks)], now)
+    )
+    response = jsonify({"status": "success", "max_weeks": max_weeks, **horizon})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @booking_bp.route("/history", methods=["GET"])
 def booking_history_page():
     user = session.get('user')
@@ -117,27 +144,17 @@ def api_book_appointment():
     user = session['user']
     user_id = user['user_id']
     
-    # 在新增之前，先檢查該時段是否已被預約（避免重複提交或競態條件）
-    existing_apt = db.get_appointment_by_date_and_time(date, time)
-    if existing_apt:
-        print(f"[BOOKING API] 時段衝突：user_id={user_id} 試圖預約 {date} {time}，但已被 {existing_apt.get('user_name')} 預約。")
-        return api_response(error=f"抱歉，{date} {time} 的時段已被預約，請選擇其他時段。", status_code=409)
-    
-    # 嘗試新增預約
-    success = db.add_appointment(
-        user_id=user_id,
-        user_name=user['name'],
-        date=date,
-        time=time
-    )
+    # 檢查時段與新增預約在同一個交易中完成，同時搶同一時段的請求只會有一筆成功
+    result = db.book_appointment(user_id, date, time, BOOKING_PAGE_TYPE, user_name=user['name'])
 
-    if success:
-        print(f"[BOOKING API] 預約成功：user_id={user_id}, {date} {time}")
+    if result['status'] == db.BOOKING_BOOKED:
         return api_response(data={"message": f"恭喜！您已成功預約 {date} {time} 的時段。"})
-    else:
-        # 新增失敗，可能是唯一性約束或其他原因
-        print(f"[BOOKING API] 預約失敗：user_id={user_id}, {date} {time} (可能是重複或系統錯誤)")
-        return api_response(error=f"預約失敗，{date} {time} 的時段可能已被預約或系統發生錯誤。請重新整理頁面後重試。", status_code=409)
+    if result['status'] == db.BOOKING_CONFLICT:
+        return api_response(error=f"抱歉，{date} {time} 的時段已被預約，請選擇其他時段。", status_code=409)
+    if result['status'] == db.BOOKING_UNKNOWN_USER:
+        return api_response(error="找不到您的用戶資料，請重新登入後再試。", status_code=404)
+    current_app.logger.error(f"[BOOKING API] 預約失敗：user_id={user_id}, {date} {time}: {result['error']}")
+    return api_response(error="預約失敗，系統發生錯誤。請重新整理頁面後重試。", status_code=500)
 
 @booking_bp.route("/api/cancel_my_appointment", methods=["POST"])
 def api_cancel_my_appointment():
@@ -4,8 +4,9 @@ from datetime import datetime
 
 import database as db
 import line_flex_messages as flex
-from app.utils.line_api import validate_signature, get_line_profile, send_line_message
+from app.utils.line_api import validate_signature, get_cached_line_profile, send_line_message
 from app.utils.helpers import get_week_dates, get_available_slots
+from app.utils.webhook_queue import webhook_queue
 
 webhook_bp = Blueprint('webhook', __name__)
 
@@ -21,76 +22,90 @@ def webhook():
     body = request.get_json()
     events = body.get("events", [])
 
+    app = current_app._get_current_object()
+    if not app.config.get('WEBHOOK_ASYNC', True):
+        # 停用非同步處理時在請求中依序處理
+        for event in events:
+            handle_event(event)
+        return jsonify({"status": "ok"})
+
+    # 簽名驗證通過後只把事件放入背景佇列並立即回應 200，避免超過 LINE 的 Webhook 逾時
     for event in events:
-        if event["type"] == "follow":
-            user_id = event["source"]["userId"]
-            current_app.logger.info(f"用戶加入好友 - 用戶ID: {user_id}")
-            user_info = get_line_profile(user_id)
-            db.add_user(user_id, user_info['name'], user_info['picture_url'])
+        if not webhook_queue.submit(app, event, handle_event, timeout=app.config.get('WEBHOOK_SUBMIT_TIMEOUT', 2.0)):
+            # 佇列已滿：不在請求中直接處理（會比同一用戶仍在佇列中的事件先執行），回應 503 讓 LINE 重送；
+            # 本次已放入佇列的事件在重送時依 webhookEventId 略過
+            current_app.logger.warning(f"Webhook 佇列已滿，要求 LINE 重送: {event.get('type')}")
+            return jsonify({"status": "error", "message": "Webhook queue is full"}), 503
+
+    return jsonify({"status": "ok"})
+
+def handle_event(event):
+    """處理單一 Webhook 事件（由背景佇列在 app context 中呼叫）"""
+    if event["type"] == "follow":
+        user_id = event["source"]["userId"]
+        current_app.logger.info(f"用戶加入好友 - 用戶ID: {user_id}")
+        # 加入好友時一律向 LINE 取得最新資料
+        get_cached_line_profile(user_id, force_refresh=True)
+    
+    elif event["type"] == "message":
+        user_id = event["source"]["userId"]
+        message_type = event["message"]["type"]
+        current_app.logger.info(f"收到訊息 - 用戶ID: {user_id}, 類型: {message_type}")
         
-        elif event["type"] == "message":
-            user_id = event["source"]["userId"]
-            message_type = event["message"]["type"]
-            current_app.logger.info(f"收到訊息 - 用戶ID: {user_id}, 類型: {message_type}")
-            
-            user_info = get_line_profile(user_id)
-            db.add_user(user_id, user_info['name'], user_info['picture_url'], address=None)
-            
-            # 統一處理所有需要記錄回覆的訊息類型
-            if message_type in ["text", "image", "sticker"]:
-                upcoming_appointment = db.get_closest_future_appointment(user_id)
-                if not upcoming_appointment:
-                    # 如果沒有未來預約，則不處理回覆
-                    pass
-                else:
-                    reply_obj = {
-                        "type": "",
-                        "content": "",
-                        "confirmed": False
-                    }
-                    
-                    if message_type == "text":
-                        reply_obj["type"] = "text"
-                        reply_obj["content"] = event["message"]["text"].strip()
-                    
-                    elif message_type == "image":
-                        reply_obj["type"] = "image"
-                        reply_obj["content"] = "用戶傳來一張圖片"
-                    
-                    elif message_type == "sticker":
-                        reply_obj["type"] = "sticker"
-                        # 優先使用貼圖關鍵字，若無則使用通用文字
-                        keywords = event["message"].get("keywords", [])
-                        reply_obj["content"] = keywords[0] if keywords else "用戶傳來一張貼圖"
-
-                    db.update_appointment_reply_status(
-                        appointment_id=upcoming_appointment['id'],
-                        status='已回覆',
-                        last_reply=json.dumps(reply_obj, ensure_ascii=False)
-                    )
-
-            # 處理文字指令
-            if message_type == "text":
-                user_message = event["message"]["text"].strip()
-                if user_message in ['預約', '预约', '訂位', '订位']:
-                    handle_booking_start(user_id)
-                elif user_message in ['查詢', '查询', '我的預約', '我的预约']:
-                    handle_query_appointments(user_id)
-                elif user_message in ['取消', '取消預約', '取消预约']:
-                    handle_cancel_booking(user_id)
-
-        elif event["type"] == "postback":
-            user_id = event["source"]["userId"]
-            data = event["postback"]["data"]
-            
-            user_info = get_line_profile(user_id)
-            if user_info:
-                db.add_user(user_id, user_info['name'], user_info['picture_url'])
+        # 使用快取的用戶資料，過期時在背景更新，不阻塞事件處理
+        get_cached_line_profile(user_id)
+        
+        # 統一處理所有需要記錄回覆的訊息類型
+        if message_type in ["text", "image", "sticker"]:
+            upcoming_appointment = db.get_closest_future_appointment(user_id)
+            if not upcoming_appointment:
+                # 如果沒有未來預約，則不處理回覆
+                pass
+            else:
+                reply_obj = {
+                    "type": "",
+                    "content": "",
+                    "confirmed": False
+                }
+                
+                if message_type == "text":
+                    reply_obj["type"] = "text"
+                    reply_obj["content"] = event["message"]["text"].strip()
+                
+                elif message_type == "image":
+                    reply_obj["type"] = "image"
+                    reply_obj["content"] = "用戶傳來一張圖片"
+                
+                elif message_type == "sticker":
+                    reply_obj["type"] = "sticker"
+                    # 優先使用貼圖關鍵字，若無則使用通用文字
+                    keywords = event["message"].get("keywords", [])
+                    reply_obj["content"] = keywords[0] if keywords else "用戶傳來一張貼圖"
 
-            current_app.logger.info(f"收到 Postback - 用戶ID: {user_id}, Data: {data}")
-            handle_postback(user_id, data)
+                db.update_appointment_reply_status(
+                    appointment_id=upcoming_appointment['id'],
+                    status='已回覆',
+                    last_reply=json.dumps(reply_obj, ensure_ascii=False)
+                )
 
-    return jsonify({"status": "ok"})
+        # 處理文字指令
+        if message_type == "text":
+            user_message = event["message"]["text"].strip()
+            if user_message in ['預約', '预约', '訂位', '订位']:
+                handle_booking_start(user_id)
+            elif user_message in ['查詢', '查询', '我的預約', '我的预约']:
+                handle_query_appointments(user_id)
+            elif user_message in ['取消', '取消預約', '取消预约']:
+                handle_cancel_booking(user_id)
+
+    elif event["type"] == "postback":
+        user_id = event["source"]["userId"]
+        data = event["postback"]["data"]
+        
+        get_cached_line_profile(user_id)
+
+        current_app.logger.info(f"收到 Postback - 用戶ID: {user_id}, Data: {data}")
+        handle_postback(user_id, data)
 
 # ============ LINE 预约流程处理 ============ 
 
@@ -126,11 +141,8 @@ def handle_postback(user_id, data):
         
         if not date or not day_name: return
         
-        date_obj = datetime.strptime(date, '%Y-%m-%d')
-        weekday = date_obj.weekday()
-        
         is_closed = db.is_closed_day(date)
-        available_slots = get_available_slots(date, weekday)
+        available_slots = get_available_slots(date)
         
         time_card = flex.generate_time_selection_card(date, day_name, available_slots, is_closed)
         send_line_message(user_id, [time_card], message_type="time_selection")
@@ -157,9 +169,9 @@ def handle_postback(user_id, data):
         user = db.get_user_by_id(user_id)
         user_name = user['name'] if user else '未知'
         
-        success = db.add_appointment(user_id, user_name, date, time)
+        result = db.book_appointment(user_id, date, time, user_name=user_name)
         
-        if success:
+        if result['status'] == db.BOOKING_BOOKED:
             date_obj = datetime.strptime(date, '%Y-%m-%d')
             weekday_names = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
             weekday_name = weekday_names[date_obj.weekday()]
@@ -4,7 +4,8 @@ import pytz
 from .jobs import (
     send_daily_reminders_job,
     send_weekly_reminders_job,
-    send_custom_schedules_job
+    send_custom_schedules_job,
+    message_log_maintenance_job
 )
 import database as db
 
@@ -41,6 +42,13 @@ def init_scheduler(app):
             trigger="interval", id='custom_schedules_job',
             minutes=1, replace_existing=True
         )
+        # 發送紀錄封存與資料庫整理：每天凌晨 3:30（離峰時段）
+        scheduler.add_job(
+            func=lambda: message_log_maintenance_job(app),
+            trigger="cron", id='message_log_maintenance_job',
+            hour=3, minute=30,
+            replace_existing=True
+        )
 
         if not scheduler.running:
             scheduler.start()
@@ -3,13 +3,11 @@ from collections import defaultdict
 import pytz
 
 import database as db
-from app.utils.line_api import send_line_message
+from app.utils.push_dispatcher import dispatch_pushes, send_pushes
 from .utils import get_week_dates_for_scheduler
 
-def _do_send_reminders(app, appointments: list, reminder_type: str = 'daily') -> tuple[int, int]:
-    sent_count = 0
-    failed_count = 0
-
+def _build_reminder_pushes(app, appointments: list, reminder_type: str = 'daily') -> list:
+    """依提醒類型篩選預約並組好每位用戶每天一則的提醒訊息（send_pushes 的格式）"""
     # --- 加強版過濾邏輯 ---
     if reminder_type == 'daily':
         # 每日提醒：嚴格只發送給設定為 'daily' 的用戶
@@ -29,7 +27,7 @@ def _do_send_reminders(app, appointments: list, reminder_type: str = 'daily') ->
         appointments_to_send = appointments
 
     if not appointments_to_send:
-        return 0, 0
+        return []
 
     user_appointments = defaultdict(list)
     for apt in appointments_to_send:
@@ -37,6 +35,16 @@ def _do_send_reminders(app, appointments: list, reminder_type: str = 'daily') ->
         if apt.get('user_id') and apt['user_id'].startswith('U'):
             user_appointments[apt['user_id']].append(apt)
 
+    # 先在目前執行緒組好所有訊息（範本只讀一次），再交給推播引擎並行發送
+    TAIPEI_TZ = app.config['TAIPEI_TZ']
+    today_in_taipei = datetime.now(TAIPEI_TZ).date()
+    # 計算本週日的日期，用來判斷是否為「下週」
+    this_sunday = today_in_taipei - timedelta(days=today_in_taipei.weekday()) + timedelta(days=6)
+    weekday_names = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
+    default_template = ("您好，提醒您{date_keyword} ({date}) 有預約以下時段：\n\n""{time_slots}\n\n""如果需要更改或取消，請與我們聯繫，謝謝。")
+    template = db.get_config('message_template_reminder', default_template) or default_template
+
+    pushes = []
     for user_id, apt_list in user_appointments.items():
         appointments_by_date = defaultdict(list)
         for apt in apt_list:
@@ -45,14 +53,7 @@ def _do_send_reminders(app, appointments: list, reminder_type: str = 'daily') ->
         for date_str, daily_apt_list in appointments_by_date.items():
             daily_apt_list.sort(key=lambda x: x['time'])
             user_name = daily_apt_list[0]['user_name']
-            TAIPEI_TZ = app.config['TAIPEI_TZ']
             apt_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            today_in_taipei = datetime.now(TAIPEI_TZ).date()
-            
-            # 計算本週日的日期，用來判斷是否為「下週」
-            this_sunday = today_in_taipei - timedelta(days=today_in_taipei.weekday()) + timedelta(days=6)
-            
-            weekday_names = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
             weekday_name = weekday_names[apt_date.weekday()]
 
             if apt_date == today_in_taipei:
@@ -70,19 +71,19 @@ def _do_send_reminders(app, appointments: list, reminder_type: str = 'daily') ->
                 time_str = time_obj.strftime('%p %I:%M').replace('AM', '上午').replace('PM', '下午')
                 type_str = " (推拿)" if apt.get('type') == 'massage' else " (看診)"
                 time_slots_str += f"• {time_str}{type_str}\n"
-                
-            default_template = ("您好，提醒您{date_keyword} ({date}) 有預約以下時段：\n\n""{time_slots}\n\n""如果需要更改或取消，請與我們聯繫，謝謝。")
-            template = db.get_config('message_template_reminder', default_template) or default_template
 
             message = template.format(user_name=user_name, date_keyword=date_keyword, date=apt_date.strftime('%m/%d'), weekday=weekday_name, time_slots=time_slots_str.strip())
             
-            success = send_line_message(user_id=user_id, messages=[{"type": "text", "text": message}], message_type=f'reminder_{reminder_type}', target_name=user_name)
-            if success:
-                sent_count += 1
-            else:
-                failed_count += 1
-            
-    return sent_count, failed_count
+            pushes.append({"user_id": user_id, "messages": [{"type": "text", "text": message}], "message_type": f'reminder_{reminder_type}', "target_name": user_name})
+
+    return pushes
+
+def _do_send_reminders(app, appointments: list, reminder_type: str = 'daily') -> tuple[int, int]:
+    """組好提醒訊息並並行發送，回傳 (成功數, 失敗數)"""
+    pushes = _build_reminder_pushes(app, appointments, reminder_type)
+    if not pushes:
+        return 0, 0
+    return dispatch_pushes(app, pushes, app.config.get('PUSH_WORKERS'))
 
 def send_daily_reminders_job(app, fake_today_str=None):
     """每日提醒的排程任務"""
@@ -147,14 +148,32 @@ def send_custom_schedules_job(app):
             return
 
         app.logger.info(f"發現 {len(schedules_to_send)} 個待發送的排程...")
-        for schedule in schedules_to_send:
-            success = send_line_message(
-                user_id=schedule['user_id'],
-                messages=[{"type": "text", "text": schedule['message']}],
-                message_type='custom_schedule',
-                target_name=schedule['user_name']
-            )
-            
+        # 同一則訊息排給多位用戶時（群發），會合併成 multicast 發送
+        pushes = [{
+            "user_id": schedule['user_id'],
+            "messages": [{"type": "text", "text": schedule['message']}],
+            "message_type": 'custom_schedule',
+            "target_name": schedule['user_name']
+        } for schedule in schedules_to_send]
+        results = send_pushes(app, pushes, app.config.get('PUSH_WORKERS'))
+
+        for schedule, success in zip(schedules_to_send, results, strict=True):
             new_status = 'sent' if success else 'failed'
             db.update_schedule_status(schedule['id'], new_status)
-            app.logger.info(f"排程 {schedule['id']} 發送給 {schedule['user_name']}，狀態: {new_status}")
\ No newline at end of file
+            app.logger.info(f"排程 {schedule['id']} 發送給 {schedule['user_name']}，狀態: {new_status}")
+
+def message_log_maintenance_job(app):
+    """離峰時段封存過期的發送紀錄並歸還資料庫空間"""
+    with app.app_context():
+        retention_days = db.get_config('message_log_retention_days', '180') or '180'
+        try:
+            retention_days = int(retention_days)
+        except ValueError:
+            app.logger.warning(f"message_log_retention_days 設定無效: {retention_days}")
+            return
+        if retention_days > 0:
+            result = db.archive_message_log(retention_days)
+            if result['archived']:
+                app.logger.info(f"已封存 {result['archived']} 筆 {result['cutoff']} 之前的發送紀錄至 {result['archive_file']}")
+        compact = db.compact_database()
+        app.logger.info(f"資料庫整理完成（{compact['mode']}），釋放 {compact['freed_pages']} 頁。")
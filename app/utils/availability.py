@@ -0,0 +1,145 @@
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import database as db
+
+
+@lru_cache(maxsize=64)
+def _slot_index(times: tuple) -> dict:
+    # 時段範本在設定異動前都是同一個 tuple，因此時間點 → 位元位置的對照只需建立一次
+    return {time: bit for bit, time in enumerate(times)}
+
+class DayAvailability:
+    """
+    單日、單一類型的可預約狀態。
+
+    times 為當天所有時間點（見 database.get_slot_template），第 i 個時間點對應 mask 的第 i 個位元；
+    位元為 1 表示可預約。booked 為已被預約的位元，closed 表示休診。
+    """
+    __slots__ = ('date', 'type', 'times', 'mask', 'booked', 'closed')
+
+    def __init__(self, date: str, type: str, times: tuple, mask: int, booked: int, closed: bool):
+        self.date = date
+        self.type = type
+        self.times = times
+        self.mask = mask
+        self.booked = booked
+        self.closed = closed
+
+    def is_available(self, time: str) -> bool:
+        bit = _slot_index(self.times).get(time)
+        return bit is not None and bool(self.mask >> bit & 1)
+
+    def available_times(self) -> list:
+        mask = self.mask
+        return [time for bit, time in enumerate(self.times) if mask >> bit & 1]
+
+    def available_count(self) -> int:
+        return bin(self.mask).count('1')
+
+def compute_day_mask(times: tuple, booked_times, closed: bool, date: str, today: str, now_time: str) -> tuple:
+    """以位元運算算出單日的 (可預約遮罩, 已預約遮罩)；休診日與過去的日期整天不可預約，今天則遮掉已過的時間點"""
+    index = _slot_index(times)
+    booked = 0
+    for time in booked_times:
+        bit = index.get(time)
+        if bit is not None:
+            booked |= 1 << bit
+    if closed or date < today:
+        return 0, booked
+    mask = ((1 << len(times)) - 1) & ~booked
+    if date == today:
+        # times 已排序，bisect 的結果就是「時間點 <= 現在」的個數
+        mask &= ~((1 << bisect_right(times, now_time)) - 1)
+    return mask, booked
+
+def get_availability(start_date: str, end_date: str, now: datetime, type: str = 'consultation') -> dict:
+    """
+    計算日期範圍內每一天的可預約狀態，回傳 {日期: DayAvailability}。
+
+    整個範圍只查詢兩次資料庫（已確認的預約、休診日），其餘都是位元運算。
+    """
+    booked_by_date = db.get_booked_times(start_date, end_date, type)
+    closed_days = db.get_closed_days_between(start_date, end_date)
+    today = now.strftime('%Y-%m-%d')
+    now_time = now.strftime('%H:%M')
+
+    result = {}
+    day = datetime.strptime(start_date, '%Y-%m-%d').date()
+    last = datetime.strptime(end_date, '%Y-%m-%d').date()
+    while day <= last:
+        date_str = day.strftime('%Y-%m-%d')
+        times = db.get_slot_template(day.weekday(), type)
+        closed = date_str in closed_days
+        mask, booked = compute_day_mask(times, booked_by_date.get(date_str, ()), closed, date_str, today, now_time)
+        result[date_str] = DayAvailability(date_str, type, times, mask, booked, closed)
+        day += timedelta(days=1)
+    return result
+
+# 預約類型（與 available_slots.type / appointments.type 相同）
+APPOINTMENT_TYPES = ('consultation', 'massage')
+
+def build_horizon(weeks: list, now: datetime, types: tuple = APPOINTMENT_TYPES) -> dict:
+    """
+    將多週的可預約狀態整理成精簡格式。
+
+    weeks 為 get_week_dates 的結果列表（依 week_offset 排序）。時間點只在 templates 中以
+    {type: {weekday: [時間點]}} 出現一次，每一天只帶各類型的遮罩（十六進位字串，第 i 個位元對應
+    templates 中的第 i 個時間點），避免超過 JavaScript 整數的安全範圍。
+    """
+    start_date, end_date = weeks[0][0]['date'], weeks[-1][-1]['date']
+    by_type = {type: get_availability(start_date, end_date, now, type) for type in types}
+    templates = {type: {} for type in types}
+    result_weeks = []
+    for week_offset, week_dates in enumerate(weeks):
+        days = []
+        for date_info in week_dates:
+            date_str = date_info['date']
+            masks = {}
+            for type in types:
+                day = by_type[type][date_str]
+                templates[type].setdefault(str(date_info['weekday']), list(day.times))
+                masks[type] = format(day.mask, 'x')
+            days.append({
+                'date': date_str,
+                'weekday': date_info['weekday'],
+                'day_name': date_info['day_name'],
+                'display': date_info['display'],
+                'closed': by_type[types[0]][date_str].closed,
+                'masks': masks,
+            })
+        result_weeks.append({'week_offset': week_offset, 'days': days})
+    return {'templates': templates, 'weeks': result_weeks}
+
+class HorizonCache:
+    """
+    多週可預約狀態的進程內快取，只保留最新的一份。
+
+    key 由呼叫端以資料版本、預約週數與目前分鐘組成；預約、休診或時段異動後版本改變，
+    或時間前進一分鐘（今天已過的時段需要遮掉）時才重新計算。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._value = None
+        self._stats = {'hits': 0, 'builds': 0}
+
+    def get(self, key, build):
+        with self._lock:
+            if self._key == key:
+                self._stats['hits'] += 1
+                return self._value
+        value = build()
+        with self._lock:
+            self._stats['builds'] += 1
+            self._key, self._value = key, value
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, key=self._key)
+
+horizon_cache = HorizonCache()
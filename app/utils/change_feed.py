@@ -0,0 +1,83 @@
+import os
+import queue
+import threading
+
+import database as db
+
+
+class ChangeFeed:
+    """
+    將 change_events 表中的新事件廣播給所有 SSE 訂閱者。
+
+    每個進程只有一條背景執行緒輪詢資料庫（不論開了多少個管理分頁），
+    因此其他 gunicorn worker 寫入的變更也能在一秒內送達。
+    沒有訂閱者時執行緒會自動結束。
+    """
+
+    def __init__(self, poll_interval: float = 0.5):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._pid = None
+        self._last_id = 0
+
+    def subscribe(self, last_event_id=None) -> queue.Queue:
+        """
+        訂閱變更事件；若提供 last_event_id（斷線重連），會先補送之後的事件。
+
+        先登記訂閱再讀取補送事件，且兩者都在持有鎖時完成：廣播執行緒同樣在鎖內取得訂閱者清單，
+        因此補送事件一定排在之後的廣播之前，讀取期間提交的事件也不會遺漏（重疊部分由呼叫端依 ID 去除）。
+        """
+        subscription = queue.Queue()
+        with self._lock:
+            self._subscribers.add(subscription)
+            self._ensure_thread()
+            if last_event_id is not None:
+                try:
+                    missed = db.get_change_events_since(last_event_id)
+                except Exception:
+                    self._subscribers.discard(subscription)
+                    raise
+                if missed:
+                    subscription.put(missed)
+        return subscription
+
+    def unsubscribe(self, subscription: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _ensure_thread(self) -> None:
+        # 需在持有 self._lock 時呼叫；fork 之後的子進程需要重新啟動自己的執行緒
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._last_id = db.get_latest_change_event_id()
+        self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        stop = threading.Event()
+        while not stop.wait(self.poll_interval):
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                events = db.get_change_events_since(self._last_id)
+            except Exception as e:
+                print(f"讀取變更事件失敗: {e}")
+                continue
+            if not events:
+                continue
+            self._last_id = events[-1]['id']
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for subscription in subscribers:
+                subscription.put(events)
+
+change_feed = ChangeFeed()
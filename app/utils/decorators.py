@@ -34,10 +34,11 @@ def admin_required(f):
                 flash('請先登入以存取此頁面。', 'warning')
                 return redirect(url_for('auth.login', next=request.url))
 
-        user_data = db.get_user_by_id(session['user']['user_id'])
-        is_admin_in_db = user_data and user_data.get('is_admin')
+        # 權限以用戶目錄（進程內快取）為準，不必每個請求都查詢資料庫
+        user_record = db.get_user_record(session['user']['user_id'])
+        is_admin_in_db = bool(user_record and user_record.is_admin)
 
-        if 'is_admin' not in session['user'] or session['user']['is_admin'] != is_admin_in_db:
+        if 'is_admin' not in session['user'] or bool(session['user']['is_admin']) != is_admin_in_db:
             session['user'] = db.get_user_by_id(session['user']['user_id'])
             session.modified = True
 
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from flask import url_for, current_app, jsonify
 
 import database as db
+from app.utils.availability import get_availability
 
 def api_response(data=None, error=None, status_code=200):
     """通用的 API 回應包裝器"""
@@ -65,48 +66,23 @@ def get_week_dates(week_offset=0):
     
     return week_dates
 
+def get_stats_month(month):
+    """
+    驗證統計月份參數（YYYY-MM），格式不正確時改用台北時間的本月
+    """
+    if month:
+        try:
+            return datetime.strptime(month, '%Y-%m').strftime('%Y-%m')
+        except ValueError:
+            current_app.logger.warning(f"統計月份格式不正確: {month!r}，改用本月")
+    return datetime.now(current_app.config['TAIPEI_TZ']).strftime('%Y-%m')
+
 def generate_time_slots(weekday, type='consultation'):
-    """根据星期和類型生成时间段"""
-    active_slots = db.get_active_slots_by_weekday(weekday, type)
-    
-    # 根據類型設定時段間隔：看診15分鐘，推拿30分鐘
-    interval_minutes = 30 if type == 'massage' else 15
-    
-    generated_slots = []
-    for slot_setting in active_slots:
-        start = datetime.strptime(slot_setting['start_time'], '%H:%M')
-        end = datetime.strptime(slot_setting['end_time'], '%H:%M')
-        
-        current = start
-        while current <= end:
-            generated_slots.append(current.strftime('%H:%M'))
-            current += timedelta(minutes=interval_minutes)
-            
-    slots = sorted(list(set(generated_slots)))
-    return slots
+    """根据星期和類型取得时间段（預先展開的時段範本，時段設定異動時才重新計算）"""
+    # 範本為各請求共用的 tuple，回傳副本讓呼叫端可以自由修改
+    return list(db.get_slot_template(weekday, type))
 
-def get_available_slots(date, weekday, type='consultation'):
-    """获取某日期的可用时段（过滤掉已过去的时间）"""
-    all_slots = generate_time_slots(weekday, type)
-    
-    if db.is_closed_day(date):
-        return []
-    
-    appointments = db.get_appointments_by_date_range(date, date)
-    # 修正：過濾時也要考慮 type
-    booked_times = [apt['time'] for apt in appointments if apt['status'] == 'confirmed' and apt.get('type', 'consultation') == type]
-    
-    TAIPEI_TZ = current_app.config['TAIPEI_TZ']
-    now = datetime.now(TAIPEI_TZ)
-    
-    filtered_slots = []
-    for slot in all_slots:
-        if slot not in booked_times:
-            if date == now.strftime('%Y-%m-%d'):
-                slot_time = datetime.strptime(f"{date} {slot}", '%Y-%m-%d %H:%M').replace(tzinfo=TAIPEI_TZ)
-                if slot_time > now:
-                    filtered_slots.append(slot)
-            else:
-                filtered_slots.append(slot)
-    
-    return filtered_slots
\ No newline at end of file
+def get_available_slots(date, type='consultation'):
+    """获取某日期的可用时段（过滤掉已预约、休診与已过去的时间）"""
+    now = datetime.now(current_app.config['TAIPEI_TZ'])
+    return get_availability(date, date, now, type)[date].available_times()
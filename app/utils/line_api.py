@@ -1,10 +1,25 @@
 import hmac
+import json
 import hashlib
 import base64
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import requests
 from flask import current_app, Response, send_from_directory
 
 import database as db
+from .line_client import line_client
+
+# LINE multicast 單次最多可指定的收件人數
+MULTICAST_MAX_RECIPIENTS = 500
+
+# 用戶資料快取的有效秒數與最大筆數
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', str(6 * 3600)))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '2048'))
 
 def validate_signature(body, signature):
     """验证 LINE webhook 签名"""
@@ -25,10 +40,8 @@ def validate_signature(body, signature):
 def get_line_profile(user_id):
     """获取 LINE 用户资料"""
     channel_token = current_app.config.get('LINE_CHANNEL_TOKEN')
-    url = f"https://api.line.me/v2/bot/profile/{user_id}"
-    headers = {"Authorization": f"Bearer {channel_token}"}
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = line_client.get_profile(user_id, channel_token)
         if response.status_code == 200:
             profile = response.json()
             user_info = {
@@ -43,33 +56,130 @@ def get_line_profile(user_id):
         current_app.logger.error(f"獲取用戶資料時發生錯誤: {e}")
     return {'name': '未知', 'picture_url': None}
 
+class _ProfileCache:
+    """LINE 用戶資料的 LRU 快取，每筆記錄取得時間，超過 TTL 視為過期"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """回傳 (profile, is_fresh)，沒有快取時回傳 (None, False)"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(user_id)
+            profile, fetched_at = entry
+        return profile, (time.time() - fetched_at) < self.ttl
+
+    def put(self, user_id, profile, fetched_at=None):
+        with self._lock:
+            self._entries[user_id] = (profile, fetched_at if fetched_at is not None else time.time())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+profile_cache = _ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+_refresh_lock = threading.Lock()
+_refreshing = set()
+_refresh_executor = None
+_refresh_executor_pid = None
+
+def _store_profile(user_id, user_info):
+    """將從 LINE 取得的資料寫回 users 表並更新快取"""
+    db.add_user(user_id, user_info['name'], user_info['picture_url'])
+    profile_cache.put(user_id, user_info)
+
+def _refresh_profile_in_background(user_id):
+    """在背景重新取得過期的用戶資料，同一位用戶同時只會有一個更新任務"""
+    global _refresh_executor, _refresh_executor_pid
+    app = current_app._get_current_object()
+    with _refresh_lock:
+        if user_id in _refreshing:
+            return
+        _refreshing.add(user_id)
+        if _refresh_executor is None or _refresh_executor_pid != os.getpid():
+            _refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='profile-refresh')
+            _refresh_executor_pid = os.getpid()
+        executor = _refresh_executor
+
+    def task():
+        try:
+            with app.app_context():
+                user_info = get_line_profile(user_id)
+                if user_info['name'] != '未知':
+                    _store_profile(user_id, user_info)
+                else:
+                    # 取得失敗時沿用舊資料，並延後到下一個 TTL 再重試
+                    stale_profile, _ = profile_cache.get(user_id)
+                    if stale_profile:
+                        profile_cache.put(user_id, stale_profile)
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(user_id)
+
+    executor.submit(task)
+
+def _parse_db_timestamp(value):
+    """將 SQLite CURRENT_TIMESTAMP（UTC）字串轉為 epoch 秒數"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return 0
+
+def get_cached_line_profile(user_id, force_refresh=False):
+    """
+    取得 LINE 用戶資料並確保 users 表中有此用戶。
+
+    依序使用記憶體快取、users 表（以 updated_at 判斷是否過期），都沒有時才同步呼叫 LINE API。
+    過期的資料會先回傳，再於背景更新，讓 Webhook 事件不必每次都等待外部 API。
+    """
+    if not force_refresh:
+        profile, is_fresh = profile_cache.get(user_id)
+        if profile is None:
+            user = db.get_user_by_id(user_id)
+            if user and user.get('name'):
+                profile = {'name': user['name'], 'picture_url': user.get('picture_url')}
+                profile_cache.put(user_id, profile, _parse_db_timestamp(user.get('updated_at')))
+                profile, is_fresh = profile_cache.get(user_id)
+        if profile is not None:
+            if not is_fresh:
+                _refresh_profile_in_background(user_id)
+            return profile
+
+    user_info = get_line_profile(user_id)
+    if user_info['name'] != '未知' or not db.get_user_by_id(user_id):
+        _store_profile(user_id, user_info)
+    return user_info
+
+def _message_excerpt(messages):
+    if len(messages) > 0:
+        first_message = messages[0]
+        if isinstance(first_message, dict) and first_message.get("type") == "text":
+            return first_message["text"][:100] + "..." if len(first_message["text"]) > 100 else first_message["text"]
+        elif isinstance(first_message, str):
+            return first_message[:100] + "..." if len(first_message) > 100 else first_message
+    return None
+
 def send_line_message(user_id, messages, message_type="message", target_name=None):
     """发送 LINE 消息（支持文本和 Flex Message）"""
     channel_token = current_app.config.get('LINE_CHANNEL_TOKEN')
-    url = "https://api.line.me/v2/bot/message/push"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {channel_token}"
-    }
     
     if not isinstance(messages, list):
         messages = [messages]
     
-    data = {
-        "to": user_id,
-        "messages": messages
-    }
-    
-    message_excerpt = None
-    if len(messages) > 0:
-        first_message = messages[0]
-        if isinstance(first_message, dict) and first_message.get("type") == "text":
-            message_excerpt = first_message["text"][:100] + "..." if len(first_message["text"]) > 100 else first_message["text"]
-        elif isinstance(first_message, str):
-            message_excerpt = first_message[:100] + "..." if len(first_message) > 100 else first_message
+    message_excerpt = _message_excerpt(messages)
     
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
+        response = line_client.push(user_id, messages, channel_token)
         if response.status_code == 200:
             db.log_message_send(
                 user_id=user_id,
@@ -104,6 +214,57 @@ def send_line_message(user_id, messages, message_type="message", target_name=Non
         current_app.logger.error(f"Exception sending message: {error_msg}")
         return False
 
+def group_pushes_by_payload(pushes):
+    """
+    將推播依「訊息內容完全相同」分組，回傳每組在 pushes 中的索引清單。
+
+    pushes 中每一項為 send_line_message 的關鍵字參數；message_type 不同的推播不會併在同一組，
+    以免 message_log 的分類出錯。
+    """
+    groups = {}
+    for index, push in enumerate(pushes):
+        messages = push['messages'] if isinstance(push['messages'], list) else [push['messages']]
+        key = (json.dumps(messages, sort_keys=True, ensure_ascii=False), push.get('message_type', 'message'))
+        groups.setdefault(key, []).append(index)
+    return list(groups.values())
+
+def send_multicast_message(user_ids, messages, message_type="message", target_names=None):
+    """
+    以 multicast 一次發送相同訊息給多位用戶（每次最多 MULTICAST_MAX_RECIPIENTS 位），
+    並為每位收件人各寫一筆 message_log。回傳與 user_ids 對應的成功與否清單。
+    """
+    channel_token = current_app.config.get('LINE_CHANNEL_TOKEN')
+    if not isinstance(messages, list):
+        messages = [messages]
+    target_names = target_names or [None] * len(user_ids)
+    message_excerpt = _message_excerpt(messages)
+
+    results = []
+    log_rows = []
+    for start in range(0, len(user_ids), MULTICAST_MAX_RECIPIENTS):
+        chunk = user_ids[start:start + MULTICAST_MAX_RECIPIENTS]
+        try:
+            response = line_client.multicast(chunk, messages, channel_token)
+            success = response.status_code == 200
+            error_msg = None if success else f"Error {response.status_code}: {response.text}"
+        except Exception as e:
+            success = False
+            error_msg = str(e)
+        if not success:
+            current_app.logger.error(f"Error sending multicast to {len(chunk)} users: {error_msg}")
+        for offset, user_id in enumerate(chunk):
+            results.append(success)
+            log_rows.append({
+                'user_id': user_id,
+                'target_name': target_names[start + offset] or '未知',
+                'message_type': message_type,
+                'status': 'success' if success else 'failed',
+                'error_message': error_msg,
+                'message_excerpt': message_excerpt,
+            })
+    db.log_message_sends(log_rows)
+    return results
+
 def user_avatar(user_id):
     user = db.get_user_by_id(user_id)
     if not user or not user.get('picture_url') or user_id.startswith('manual_'):
@@ -113,7 +274,7 @@ def user_avatar(user_id):
             return send_from_directory(static_folder, 'nohead.png')
         return "Static folder not configured", 500
     try:
-        picture_response = requests.get(user['picture_url'], timeout=5)
+        picture_response = line_client.get(user['picture_url'], 'avatar', timeout=5)
         picture_response.raise_for_status()
         response = Response(picture_response.content, mimetype=picture_response.headers['Content-Type'])
         response.headers['Cache-Control'] = 'public, max-age=3600'
@@ -128,6 +289,6 @@ def user_avatar(user_id):
 def refresh_user_profile(user_id):
     user_info = get_line_profile(user_id)
     if user_info and user_info['name'] != '未知':
-        db.add_user(user_id, user_info['name'], user_info['picture_url'], address=None)
+        _store_profile(user_id, user_info)
         return True
     return False
\ No newline at end of file
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# LINE Messaging / Login API 的位址，可透過環境變數指向本機的模擬伺服器（壓力測試用）
+LINE_API_BASE_URL = os.getenv('LINE_API_BASE_URL', 'https://api.line.me').rstrip('/')
+
+# 延遲分布的區間上限（毫秒）
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 推播的每秒請求上限（LINE 官方上限為 2,000 次/秒，預設保守一些）
+LINE_PUSH_RATE = float(os.getenv('LINE_PUSH_RATE', '100'))
+
+class RateLimiter:
+    """
+    Token bucket 限流器：平均每秒最多 rate 次，瞬間最多 burst 次。
+    acquire() 會阻塞到取得 token 為止，可跨執行緒共用。
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.waited_seconds += wait
+            time.sleep(wait)
+
+class LineClient:
+    """
+    所有 LINE API 呼叫共用的 HTTP 用戶端。
+
+    使用 keep-alive 連線池，避免每次推播都重新進行 TLS 交握；
+    遇到 429 / 5xx 時依 Retry-After 與指數退避自動重試（POST 只有帶 X-Line-Retry-Key 的推播會重試），
+    並依端點記錄延遲分布，供 /api/admin/metrics 觀察。
+    """
+
+    def __init__(self, base_url: str = LINE_API_BASE_URL, pool_size: int = 32, max_retries: int = 3, backoff_factor: float = 0.5, push_rate: float = LINE_PUSH_RATE):
+        self.base_url = base_url
+        self.push_limiter = RateLimiter(push_rate)
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._sessions = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _build_session(self, retry_post: bool) -> requests.Session:
+        retry_options = {
+            'total': self.max_retries,
+            'backoff_factor': self.backoff_factor,
+            'status_forcelist': (429, 500, 502, 503, 504),
+            'respect_retry_after_header': True,
+            'raise_on_status': False,
+        }
+        if retry_post:
+            # 只用於帶 X-Line-Retry-Key 的推播：LINE 以 Retry Key 去除重複，POST 重送也不會重複發送
+            retry_options['allowed_methods'] = None
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=Retry(**retry_options))
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _get_session(self, retry_post: bool = False) -> requests.Session:
+        """
+        取得本進程的 Session。一般請求只重試冪等的方法（GET 等），
+        OAuth 授權碼交換等不可重送的 POST 不會被重試；retry_post 的 Session 連 POST 也會重試。
+        """
+        # 連線池不能跨 fork 共用，每個 gunicorn worker 進程建立自己的 Session
+        if self._sessions is not None and self._session_pid == os.getpid():
+            return self._sessions[retry_post]
+        with self._lock:
+            if self._sessions is None or self._session_pid != os.getpid():
+                self._sessions = {False: self._build_session(False), True: self._build_session(True)}
+                self._session_pid = os.getpid()
+                self._metrics = {}
+        return self._sessions[retry_post]
+
+    def request(self, method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+        """送出請求；url 可為完整網址或以 / 開頭的 API 路徑，endpoint 為統計用名稱"""
+        if url.startswith('/'):
+            url = self.base_url + url
+        kwargs.setdefault('timeout', 10)
+        session = self._get_session(retry_post='X-Line-Retry-Key' in (kwargs.get('headers') or {}))
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = session.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self._record(endpoint, (time.perf_counter() - started) * 1000, failed)
+
+    def get(self, url: str, endpoint: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, endpoint, **kwargs)
+
+    def post(self, url: str, endpoint: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, endpoint, **kwargs)
+
+    # --- Messaging API ---
+
+    def get_profile(self, user_id: str, channel_token: str) -> requests.Response:
+        return self.get(f"/v2/bot/profile/{user_id}", 'profile', headers={"Authorization": f"Bearer {channel_token}"})
+
+    def push(self, to: str, messages: list, channel_token: str) -> requests.Response:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {channel_token}",
+            # 同一個 Retry Key 重送時，LINE 不會重複發送訊息
+            "X-Line-Retry-Key": str(uuid.uuid4()),
+        }
+        self.push_limiter.acquire()
+        return self.post("/v2/bot/message/push", 'push', headers=headers, json={"to": to, "messages": messages})
+
+    def multicast(self, to: list, messages: list, channel_token: str) -> requests.Response:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {channel_token}",
+            "X-Line-Retry-Key": str(uuid.uuid4()),
+        }
+        self.push_limiter.acquire()
+        return self.post("/v2/bot/message/multicast", 'multicast', headers=headers, json={"to": to, "messages": messages})
+
+    # --- LINE Login ---
+
+    def issue_access_token(self, data: dict) -> requests.Response:
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        return self.post("/oauth2/v2.1/token", 'oauth_token', headers=headers, data=data)
+
+    def get_login_profile(self, access_token: str) -> requests.Response:
+        return self.get("/v2/profile", 'login_profile', headers={"Authorization": f"Bearer {access_token}"})
+
+    def verify_id_token(self, id_token: str, client_id: str) -> requests.Response:
+        return self.post("/oauth2/v2.1/verify", 'verify_id_token', data={'id_token': id_token, 'client_id': client_id})
+
+    # --- 指標 ---
+
+    def _record(self, endpoint: str, elapsed_ms: float, failed: bool) -> None:
+        with self._lock:
+            metric = self._metrics.get(endpoint)
+            if metric is None:
+                metric = self._metrics[endpoint] = {
+                    'count': 0,
+                    'errors': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            metric['count'] += 1
+            metric['errors'] += 1 if failed else 0
+            metric['total_ms'] += elapsed_ms
+            metric['max_ms'] = max(metric['max_ms'], elapsed_ms)
+            for index, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    metric['buckets'][index] += 1
+                    break
+            else:
+                metric['buckets'][-1] += 1
+
+    def stats(self) -> dict:
+        """各端點的呼叫次數、錯誤數與延遲分布（le 為區間上限，毫秒）"""
+        labels = [str(bound) for bound in LATENCY_BUCKETS_MS] + ['+Inf']
+        with self._lock:
+            result = {}
+            for endpoint, metric in self._metrics.items():
+                result[endpoint] = {
+                    'count': metric['count'],
+                    'errors': metric['errors'],
+                    'avg_ms': metric['total_ms'] / metric['count'] if metric['count'] else 0.0,
+                    'max_ms': metric['max_ms'],
+                    'histogram': dict(zip(labels, metric['buckets'], strict=True)),
+                }
+        return result
+
+line_client = LineClient()
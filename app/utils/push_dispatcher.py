@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+
+from .line_api import (
+    MULTICAST_MAX_RECIPIENTS,
+    group_pushes_by_payload,
+    send_line_message,
+    send_multicast_message,
+)
+
+# 同時進行的推播數；實際送出速率另受 line_client 的限流器控制
+PUSH_WORKERS = int(os.getenv('PUSH_WORKERS', '8'))
+
+def _send_batch(app, pushes: list) -> list:
+    # 每個工作執行緒各自推入 app context，發送函式需要讀取 app.config 並寫入 message_log
+    with app.app_context():
+        try:
+            if len(pushes) == 1:
+                return [bool(send_line_message(**pushes[0]))]
+            first = pushes[0]
+            return send_multicast_message(
+                [push['user_id'] for push in pushes],
+                first['messages'],
+                message_type=first.get('message_type', 'message'),
+                target_names=[push.get('target_name') for push in pushes],
+            )
+        except Exception:
+            app.logger.exception(f"推播給 {len(pushes)} 位用戶時發生未預期的錯誤")
+            return [False] * len(pushes)
+
+def send_pushes(app, pushes: list, workers: int = None) -> list:
+    """
+    批次發送推播，回傳與 pushes 對應的成功與否清單。
+
+    pushes 中每一項為 send_line_message 的關鍵字參數
+    (user_id, messages, message_type, target_name)。
+    內容完全相同的推播會合併成 multicast（每次最多 500 人），
+    其餘逐一 push；所有請求在執行緒池中並行送出。
+    """
+    if not pushes:
+        return []
+    batches = []
+    for indexes in group_pushes_by_payload(pushes):
+        for start in range(0, len(indexes), MULTICAST_MAX_RECIPIENTS):
+            batches.append(indexes[start:start + MULTICAST_MAX_RECIPIENTS])
+
+    def run(indexes):
+        return _send_batch(app, [pushes[index] for index in indexes])
+
+    workers = max(1, min(workers or PUSH_WORKERS, len(batches)))
+    if workers == 1:
+        batch_results = [run(indexes) for indexes in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='push') as executor:
+            batch_results = list(executor.map(run, batches))
+
+    # 批次結束時把這一輪的發送紀錄一次寫入
+    db.flush_message_log()
+
+    results = [False] * len(pushes)
+    for indexes, outcomes in zip(batches, batch_results, strict=True):
+        for index, ok in zip(indexes, outcomes, strict=True):
+            results[index] = ok
+    return results
+
+def dispatch_pushes(app, pushes: list, workers: int = None) -> tuple[int, int]:
+    """並行發送多則推播並彙整結果，回傳 (成功數, 失敗數)。"""
+    results = send_pushes(app, pushes, workers)
+    sent_count = sum(1 for ok in results if ok)
+    return sent_count, len(results) - sent_count
+
+class PushJobs:
+    """
+    在背景執行緒中發送的推播任務，讓管理介面的請求不必等到所有推播送完。
+    只保留最近 max_jobs 筆任務的結果，供 /api/admin/reminder_jobs/<job_id> 查詢。
+    """
+
+    def __init__(self, max_jobs: int = 50):
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def start(self, app, pushes: list, workers: int = None) -> dict:
+        """建立任務並在背景開始發送；app 必須是實際的 Flask 物件（不可傳入 current_app）"""
+        job = {
+            'id': uuid.uuid4().hex,
+            'total': len(pushes),
+            'sent': 0,
+            'failed': 0,
+            'done': False,
+            'started_at': time.time(),
+            'finished_at': None,
+        }
+        finished = threading.Event()
+        with self._lock:
+            self._jobs[job['id']] = (job, finished)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        def run():
+            try:
+                sent, failed = dispatch_pushes(app, pushes, workers)
+            except Exception:
+                app.logger.exception(f"推播任務 {job['id']} 發生未預期的錯誤")
+                sent, failed = 0, len(pushes)
+            with self._lock:
+                job.update(sent=sent, failed=failed, done=True, finished_at=time.time())
+            finished.set()
+
+        threading.Thread(target=run, name=f"push-job-{job['id'][:8]}", daemon=True).start()
+        return dict(job)
+
+    def get(self, job_id: str, wait: float = 0) -> dict:
+        """取得任務狀態，最多等待 wait 秒讓任務完成；找不到任務時回傳 None"""
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        if entry is None:
+            return None
+        job, finished = entry
+        if wait > 0:
+            finished.wait(wait)
+        with self._lock:
+            return dict(job)
+
+push_jobs = PushJobs()
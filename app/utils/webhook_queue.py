@@ -0,0 +1,156 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+
+class WebhookEventQueue:
+    """
+    LINE Webhook 事件的背景處理佇列。
+
+    事件依 user_id 分配到固定的 worker（每個 worker 各自一條佇列、單一執行緒），
+    因此同一位用戶的事件會依照收到的順序處理，不同用戶之間則可並行。
+    佇列已滿時 submit() 最多等待 timeout 秒，仍無空位則回傳 False，由呼叫端回應 5xx 讓 LINE 重送
+    （不可在請求中直接處理，否則會比同一用戶仍在佇列中的事件先執行）。
+    重送時已放入佇列的事件依 webhookEventId 略過，不會重複處理。
+    """
+
+    # 記住最近放入佇列的 webhookEventId 數量
+    RECENT_EVENT_IDS = 10000
+
+    def __init__(self, workers: int = 4, max_pending: int = 1000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._queues = []
+        self._threads = []
+        self._pid = None
+        self._recent_ids = OrderedDict()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = {
+            'enqueued': 0,
+            'processed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'duplicates': 0,
+        }
+        # 最近的延遲樣本（秒），用來計算平均值與 p95
+        self._wait_samples = deque(maxlen=500)
+        self._run_samples = deque(maxlen=500)
+
+    def configure(self, workers: int, max_pending: int) -> None:
+        """設定 worker 數與佇列上限，只在 worker 尚未啟動前有效。"""
+        with self._lock:
+            if not self._threads:
+                self.workers = max(1, workers)
+                self.max_pending = max(self.workers, max_pending)
+
+    def _ensure_started(self) -> None:
+        # 需在持有 self._lock 時呼叫；gunicorn --preload fork 之後，每個 worker 進程要啟動自己的執行緒
+        if self._threads and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._reset_stats()
+        per_worker = max(1, self.max_pending // self.workers)
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._threads = []
+        for index, work_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(work_queue,), name=f'webhook-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, app, event: dict, handler, timeout: float = 0) -> bool:
+        """將事件放入對應用戶的佇列，成功（或已放入過）回傳 True；等待 timeout 秒後仍已滿回傳 False。"""
+        source = event.get('source', {})
+        key = source.get('userId') or source.get('groupId') or source.get('roomId') or ''
+        event_id = event.get('webhookEventId')
+        with self._lock:
+            self._ensure_started()
+            if event_id and event_id in self._recent_ids:
+                self._stats['duplicates'] += 1
+                return True
+            work_queue = self._queues[zlib.crc32(key.encode('utf-8')) % len(self._queues)]
+        try:
+            item = (app, event, handler, time.perf_counter())
+            if timeout > 0:
+                work_queue.put(item, timeout=timeout)
+            else:
+                work_queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+        with self._lock:
+            self._stats['enqueued'] += 1
+            if event_id:
+                self._recent_ids[event_id] = True
+                while len(self._recent_ids) > self.RECENT_EVENT_IDS:
+                    self._recent_ids.popitem(last=False)
+        return True
+
+    def _run(self, work_queue: queue.Queue) -> None:
+        while True:
+            app, event, handler, enqueued_at = work_queue.get()
+            started = time.perf_counter()
+            failed = False
+            try:
+                with app.app_context():
+                    try:
+                        handler(event)
+                    except Exception:
+                        failed = True
+                        app.logger.exception(f"處理 Webhook 事件失敗: {event.get('type')}")
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._stats['failed' if failed else 'processed'] += 1
+                    self._wait_samples.append(started - enqueued_at)
+                    self._run_samples.append(finished - started)
+                work_queue.task_done()
+
+    def join(self, timeout: float = 5.0) -> bool:
+        """等待目前佇列中的事件處理完畢（用於測試與進程結束前），逾時回傳 False。"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            queues = list(self._queues) if self._pid == os.getpid() else []
+        for work_queue in queues:
+            while work_queue.unfinished_tasks:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+        return True
+
+    def stats(self) -> dict:
+        """佇列深度與延遲指標（毫秒）"""
+        with self._lock:
+            stats = dict(self._stats)
+            depths = [q.qsize() for q in self._queues] if self._pid == os.getpid() else []
+            wait_samples = sorted(self._wait_samples)
+            run_samples = sorted(self._run_samples)
+        stats.update({
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'depth': sum(depths),
+            'depth_per_worker': depths,
+            'wait_ms': _summarize(wait_samples),
+            'run_ms': _summarize(run_samples),
+        })
+        return stats
+
+def _summarize(samples):
+    if not samples:
+        return {'avg': 0.0, 'p95': 0.0, 'max': 0.0}
+    return {
+        'avg': sum(samples) / len(samples) * 1000,
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        'max': samples[-1] * 1000,
+    }
+
+webhook_queue = WebhookEventQueue()
+# 進程結束前盡量把已收到的事件處理完
+atexit.register(webhook_queue.join)
@@ -0,0 +1,315 @@
+"""
+database.py 熱門函式的效能基準測試
+
+以合成資料建立 1k / 100k / 1M 筆規模的資料庫（預約與發送紀錄各 N 筆、用戶 N/10 筆），
+逐一量測下列函式的延遲，結果存成 JSON，可用 --compare 與其他 commit 的結果比較：
+
+    get_appointments_by_date_range, get_closest_future_appointment, add_user,
+    add_appointment, get_message_stats, get_all_users, copy_slots
+
+合成資料庫只建立一次並快取在 --data-dir（預設為系統暫存目錄），每次量測都從快取複製一份工作副本，
+因此寫入類的量測不會累積影響下一次執行。
+
+用法：
+    python benchmark_db.py                                  # 1k、100k、1M 三種規模
+    python benchmark_db.py --sizes 1k,100k --output before.json
+    python benchmark_db.py --sizes 1k,100k --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import database as db
+
+# 合成資料的產生方式有變動時遞增，避免沿用舊的快取資料庫
+BENCH_DATA_VERSION = 1
+DEFAULT_SIZES = '1k,100k,1m'
+
+SURNAMES = '陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周徐蘇葉莊呂江何蕭羅高'
+GIVEN_NAMES = ('志明', '淑芬', '家豪', '美玲', '俊傑', '雅婷', '冠宇', '怡君', '建宏', '佩君', '宗翰', '欣怡', '承恩', '詩涵', '柏翰', '婉婷')
+SLOT_TIMES = tuple(f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(9 * 60, 18 * 60, 15))
+APPOINTMENT_TYPES = ('consultation', 'massage')
+MESSAGE_TYPES = ('reminder', 'date_selection', 'time_selection', 'booking_success', 'booking_error', 'appointment_list')
+
+def parse_size(text: str) -> int:
+    """'1k' -> 1000，'1m' -> 1000000"""
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+def size_label(rows: int) -> str:
+    if rows >= 1_000_000 and rows % 1_000_000 == 0:
+        return f"{rows // 1_000_000}m"
+    if rows >= 1_000 and rows % 1_000 == 0:
+        return f"{rows // 1_000}k"
+    return str(rows)
+
+# ============ 合成資料 ============
+
+def _user_rows(user_count: int, rng: random.Random):
+    zhuyin_cache = {}
+    for index in range(user_count):
+        name = f"{SURNAMES[index % len(SURNAMES)]}{GIVEN_NAMES[index // len(SURNAMES) % len(GIVEN_NAMES)]}"
+        if name not in zhuyin_cache:
+            zhuyin_cache[name] = db._name_to_zhuyin(name)
+        user_id = f"manual_bench_{index:08d}" if index % 20 == 19 else f"U{index:032x}"
+        created = datetime(2020, 1, 1) + timedelta(minutes=rng.randrange(5 * 365 * 24 * 60))
+        created_at = created.strftime('%Y-%m-%d %H:%M:%S')
+        yield (user_id, name, f"02{rng.randrange(10**8):08d}", f"09{rng.randrange(10**8):08d}", zhuyin_cache[name],
+               created_at, created_at, user_id.startswith('manual_'), index % 500 == 0,
+               'daily' if index % 7 == 0 else 'weekly')
+
+def _appointment_rows(rows: int, users: list, span_days: int, first_day: date, rng: random.Random):
+    """約八成為已確認（同類型同時段不重複），其餘為已取消"""
+    confirmed_count = rows * 4 // 5
+    slots_per_day = len(SLOT_TIMES) * len(APPOINTMENT_TYPES)
+    slot_ids = rng.sample(range(span_days * slots_per_day), confirmed_count)
+    for index in range(rows):
+        slot_id = slot_ids[index] if index < confirmed_count else rng.randrange(span_days * slots_per_day)
+        day, rest = divmod(slot_id, slots_per_day)
+        slot_time = SLOT_TIMES[rest // len(APPOINTMENT_TYPES)]
+        slot_type = APPOINTMENT_TYPES[rest % len(APPOINTMENT_TYPES)]
+        user_id, name = users[rng.randrange(len(users))]
+        apt_date = first_day + timedelta(days=day)
+        created_at = f"{(apt_date - timedelta(days=rng.randrange(1, 15))).isoformat()} 08:00:00"
+        yield (user_id, name, apt_date.isoformat(), slot_time, 'confirmed' if index < confirmed_count else 'cancelled',
+               slot_type, created_at)
+
+def _message_rows(rows: int, users: list, span_days: int, today: date, rng: random.Random):
+    for _ in range(rows):
+        user_id, name = users[rng.randrange(len(users))]
+        sent = datetime.combine(today, datetime.min.time()) - timedelta(seconds=rng.randrange(span_days * 86400))
+        failed = rng.random() < 0.05
+        yield (user_id, name, MESSAGE_TYPES[rng.randrange(len(MESSAGE_TYPES))], 'failed' if failed else 'success',
+               'Error 500: stub' if failed else None, '預約提醒', sent.strftime('%Y-%m-%d %H:%M:%S'))
+
+def _span_days(rows: int) -> int:
+    # 已確認預約約佔所有時段的六成，日期以今天為中心前後分布
+    return max(60, math.ceil(rows * 4 / 5 / (len(SLOT_TIMES) * len(APPOINTMENT_TYPES)) / 0.6))
+
+def build_database(path: str, rows: int, seed: int, today: date) -> None:
+    """以 init_database 建立結構後，直接批次寫入合成資料"""
+    rng = random.Random(seed)
+    original_db_file = db.DB_FILE
+    db.DB_FILE = path
+    try:
+        db.init_database()
+        for weekday in range(7):
+            for slot_type in APPOINTMENT_TYPES:
+                db.add_available_slot(weekday, '09:00', '12:00', type=slot_type)
+                db.add_available_slot(weekday, '14:00', '17:45', type=slot_type)
+
+        span_days = _span_days(rows)
+        conn = sqlite3.connect(path)
+        with conn:
+            users = []
+            for row in _user_rows(max(100, rows // 10), rng):
+                users.append((row[0], row[1]))
+                conn.execute('''
+                    INSERT INTO users (user_id, name, phone, phone2, zhuyin, created_at, updated_at, manual_update, is_admin, reminder_schedule)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', row)
+            conn.executemany('''
+                INSERT INTO appointments (user_id, user_name, date, time, status, type, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', _appointment_rows(rows, users, span_days, today - timedelta(days=span_days // 2), rng))
+            conn.executemany('''
+                INSERT INTO message_log (user_id, target_name, message_type, status, error_message, message_excerpt, send_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', _message_rows(rows, users, span_days, today, rng))
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.close()
+        db.rebuild_message_stats_daily()
+        conn = db.get_db()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.close()
+    finally:
+        db.DB_FILE = original_db_file
+
+def template_database(data_dir: str, rows: int, seed: int, today: date, rebuild: bool = False) -> str:
+    """回傳指定規模的快取資料庫路徑，不存在（或要求重建）時才建立"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"bench_{size_label(rows)}_s{seed}_{today.isoformat()}_v{BENCH_DATA_VERSION}.db")
+    if rebuild or not os.path.exists(path):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        started = time.perf_counter()
+        build_database(path + '.tmp', rows, seed, today)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + '.tmp' + suffix):
+                os.remove(path + '.tmp' + suffix)
+        os.replace(path + '.tmp', path)
+        print(f"  已建立 {size_label(rows)} 合成資料庫（{time.perf_counter() - started:.1f} 秒）：{path}")
+    return path
+
+# ============ 量測 ============
+
+def _benchmarks(rows: int, today: date, users: list):
+    """回傳 (名稱, 以第 i 次呼叫為參數的函式)；寫入類每次使用不同的參數"""
+    week_start, week_end = today.isoformat(), (today + timedelta(days=6)).isoformat()
+    line_users = [user for user in users if not user['user_id'].startswith('manual_')]
+    first_free_day = today + timedelta(days=_span_days(rows) - _span_days(rows) // 2 + 1)
+    month = today.strftime('%Y-%m')
+
+    def pick(collection, i):
+        return collection[i * 7919 % len(collection)]
+
+    def free_slot(i):
+        day, rest = divmod(i, len(SLOT_TIMES))
+        return (first_free_day + timedelta(days=day)).isoformat(), SLOT_TIMES[rest]
+
+    def renamed(i):
+        user = pick(line_users, i)
+        return user['user_id'], f"{user['name']}{i}"
+
+    return [
+        ('get_appointments_by_date_range', lambda _i: db.get_appointments_by_date_range(week_start, week_end)),
+        ('get_closest_future_appointment', lambda i: db.get_closest_future_appointment(pick(users, i)['user_id'])),
+        ('add_user[insert]', lambda i: db.add_user(f"U_bench_new_{i:08d}", pick(users, i)['name'])),
+        ('add_user[unchanged]', lambda i: db.add_user(pick(line_users, i)['user_id'], pick(line_users, i)['name'])),
+        ('add_user[renamed]', lambda i: db.add_user(*renamed(i))),
+        ('add_appointment', lambda i: db.add_appointment(pick(users, i)['user_id'], *free_slot(i))),
+        ('get_message_stats[month]', lambda _i: db.get_message_stats(month=month)),
+        ('get_message_stats[user]', lambda i: db.get_message_stats(user_id=pick(users, i)['user_id'])),
+        ('get_all_users', lambda _i: db.get_all_users()),
+        ('copy_slots', lambda _i: db.copy_slots(1, [2, 3, 4, 5])),
+    ]
+
+def measure(func, repeat: int, warmup: int, max_seconds: float) -> dict:
+    """先暖身 warmup 次，再最多呼叫 repeat 次（超過 max_seconds 即停止，但至少 3 次）"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(warmup):
+            func(-1 - i)
+        samples = []
+        deadline = time.perf_counter() + max_seconds
+        for i in range(repeat):
+            started = time.perf_counter()
+            func(i)
+            samples.append(time.perf_counter() - started)
+            if len(samples) >= 3 and time.perf_counter() > deadline:
+                break
+    samples.sort()
+    mean = statistics.fmean(samples)
+    return {
+        'n': len(samples),
+        'min_ms': round(samples[0] * 1000, 4),
+        'median_ms': round(statistics.median(samples) * 1000, 4),
+        'mean_ms': round(mean * 1000, 4),
+        'p95_ms': round(samples[min(len(samples) - 1, math.ceil(len(samples) * 0.95) - 1)] * 1000, 4),
+        'max_ms': round(samples[-1] * 1000, 4),
+        'ops_per_sec': round(1 / mean, 1) if mean else None,
+    }
+
+def run_size(rows: int, args, today: date) -> dict:
+    template = template_database(args.data_dir, rows, args.seed, today, args.rebuild)
+    work_dir = tempfile.mkdtemp(prefix='bench_work_')
+    original_db_file = db.DB_FILE
+    db.DB_FILE = os.path.join(work_dir, 'appointments.db')
+    try:
+        shutil.copyfile(template, db.DB_FILE)
+        # 與應用程式啟動時相同：套用結構升級與索引（不計時）
+        db.init_database()
+        conn = db.get_db()
+        users = [dict(row) for row in conn.execute('SELECT user_id, name FROM users ORDER BY user_id')]
+        conn.close()
+
+        results = {}
+        for name, func in _benchmarks(rows, today, users):
+            results[name] = measure(func, args.repeat, args.warmup, args.max_seconds)
+            print(f"  {name:<34}{results[name]['median_ms']:>12.3f} ms{results[name]['p95_ms']:>12.3f} ms{results[name]['n']:>6}")
+        return results
+    finally:
+        db.DB_FILE = original_db_file
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(args) -> dict:
+    today = date.today()
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'data_version': BENCH_DATA_VERSION,
+        },
+        'results': {},
+    }
+    for rows in [parse_size(size) for size in args.sizes.split(',') if size.strip()]:
+        print(f"\n▶ {size_label(rows)}（預約與發送紀錄各 {rows} 筆）{'median':>18}{'p95':>15}{'n':>6}")
+        report['results'][size_label(rows)] = run_size(rows, args, today)
+    return report
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """列出與基準結果的中位數差異，回傳變慢超過 threshold% 的項目"""
+    regressions = []
+    print(f"\n與 {baseline['meta'].get('commit')} 比較（中位數）：")
+    for size, benchmarks in report['results'].items():
+        for name, stats in benchmarks.items():
+            base = baseline['results'].get(size, {}).get(name)
+            if not base or not base['median_ms']:
+                continue
+            change = (stats['median_ms'] - base['median_ms']) / base['median_ms'] * 100
+            flag = ''
+            if change > threshold:
+                flag = ' ⚠️'
+                regressions.append({'size': size, 'name': name, 'change_pct': round(change, 1)})
+            print(f"  {size:<5}{name:<34}{base['median_ms']:>12.3f} →{stats['median_ms']:>10.3f} ms{change:>+9.1f}%{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='database.py 熱門函式的效能基準測試')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'資料規模，以逗號分隔（預設 {DEFAULT_SIZES}）')
+    parser.add_argument('--repeat', type=int, default=50, help='每個函式最多量測次數')
+    parser.add_argument('--warmup', type=int, default=3, help='量測前的暖身次數')
+    parser.add_argument('--max-seconds', type=float, default=10.0, help='每個函式的量測時間上限（秒）')
+    parser.add_argument('--seed', type=int, default=1, help='合成資料的亂數種子')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'appointments_bench'), help='合成資料庫的快取目錄')
+    parser.add_argument('--rebuild', action='store_true', help='重新建立合成資料庫')
+    parser.add_argument('--output', help='結果 JSON 的路徑（預設為 bench_results/<commit>.json）')
+    parser.add_argument('--compare', help='要比較的基準結果 JSON')
+    parser.add_argument('--threshold', type=float, default=20.0, help='中位數變慢超過此百分比即視為退步')
+    args = parser.parse_args(argv)
+
+    report = run_suite(args)
+
+    output = args.output or os.path.join('bench_results', f"{report['meta']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果已寫入 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} 項變慢超過 {args.threshold}%")
+            return 1
+        print("✅ 沒有明顯退步")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
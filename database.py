@@ -1,37 +1,369 @@
+import atexit
+import contextlib
+import gzip
+import json
+import os
 import sqlite3
-from typing import List, Dict, Optional
-from pypinyin import pinyin, Style
-from datetime import datetime
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional
+
 import pytz
+from pypinyin import Style, pinyin
 
 DB_FILE = 'appointments.db'
 
+# 連線池大小（每個進程），可透過環境變數調整
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '16'))
+# 連線池已滿時，等待其他執行緒歸還連線的最長秒數
+DB_POOL_CHECKOUT_TIMEOUT = 30
+
+# 每條實體連線建立時只套用一次的 PRAGMA
+_CONNECTION_PRAGMAS = (
+    # 必須在 journal_mode 之前：切換 WAL 會寫入檔頭，之後新資料庫就無法再改 auto_vacuum。
+    # 新資料庫因此直接採用增量 VACUUM；既有資料庫不受影響，由 compact_database 轉換一次
+    'PRAGMA auto_vacuum=INCREMENTAL',
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-8000',    # 約 8MB 頁面快取
+    'PRAGMA mmap_size=67108864',  # 64MB 記憶體映射讀取
+    'PRAGMA busy_timeout=30000',
+)
+
+# 姓名→注音的快取筆數（同名或重複計算同一姓名時不再呼叫 pypinyin）
+ZHUYIN_CACHE_SIZE = int(os.getenv('ZHUYIN_CACHE_SIZE', '4096'))
+
+@lru_cache(maxsize=ZHUYIN_CACHE_SIZE)
+def _zhuyin_initials(name: str) -> str:
+    """姓名的注音首字母（以 LRU 快取）；轉換失敗時拋出例外，失敗結果不會被快取"""
+    # 使用 pypinyin 生成注音，Style.BOPOMOFO 返回注音列表
+    zhuyin_list = pinyin(name, style=Style.BOPOMOFO)
+    # 提取每个字的第一个注音符号并连接
+    return "".join([item[0][0] for item in zhuyin_list if item and item[0]])
+
 def _name_to_zhuyin(name: str) -> str:
-    """将中文姓名转换为注音首字母字符串，例如 '郭欽方' -> 'ㄍㄑㄈ'"""
+    """将中文姓名转换为注音首字母字符串，例如 '郭欽方' -> 'ㄍㄑㄈ'（成功的結果以 LRU 快取）"""
     if not name:
         return ""
     try:
-        # 使用 pypinyin 生成注音，Style.BOPOMOFO 返回注音列表
-        zhuyin_list = pinyin(name, style=Style.BOPOMOFO)
-        # 提取每个字的第一个注音符号并连接
-        initials = "".join([item[0][0] for item in zhuyin_list if item and item[0]])
-        return initials
+        return _zhuyin_initials(name)
     except Exception as e:
         print(f"注音转换失败 for name '{name}': {e}")
         return ""
 
+def warm_up_zhuyin() -> float:
+    """
+    預先載入 pypinyin 的字典與分詞器（第一次轉換時才會延遲載入），避免第一個請求承擔載入時間。
+    直接呼叫 pinyin 而不經過快取，回傳耗費的秒數。
+    """
+    started = time.perf_counter()
+    try:
+        pinyin('預約掛號', style=Style.BOPOMOFO)
+    except Exception as e:
+        print(f"注音字典預載失敗: {e}")
+    return time.perf_counter() - started
+
+# ==================== 連線池 ====================
+
+class _ConnectionPool:
+    """SQLite 連線池。
+
+    實體連線只在第一次需要時建立並套用 PRAGMA，之後歸還到池中重複使用，
+    避免每個資料庫函式都重新 connect / close。
+    """
+
+    def __init__(self, db_file: str, max_size: int):
+        self.db_file = db_file
+        self.max_size = max_size
+        self.pid = os.getpid()
+        self._idle: List[sqlite3.Connection] = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            'connections_created': 0,
+            'checkouts': 0,
+            'reused': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'connect_time_total': 0.0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        started = time.perf_counter()
+        # 連線會在不同執行緒之間借用，但同一時間只會由一個執行緒持有
+        conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in _CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._cond:
+            self.stats['connections_created'] += 1
+            self.stats['connect_time_total'] += time.perf_counter() - started
+        return conn
+
+    def checkout(self) -> sqlite3.Connection:
+        started = time.perf_counter()
+        waited = False
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = DB_POOL_CHECKOUT_TIMEOUT - (time.perf_counter() - started)
+                if remaining <= 0:
+                    raise sqlite3.OperationalError("資料庫連線池已滿，等待可用連線逾時")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_time = time.perf_counter() - started
+            self.stats['checkouts'] += 1
+            if waited:
+                self.stats['waits'] += 1
+                self.stats['wait_time_total'] += wait_time
+                self.stats['wait_time_max'] = max(self.stats['wait_time_max'], wait_time)
+
+            if self._idle:
+                self.stats['reused'] += 1
+                return self._idle.pop()
+            # 先佔位再於鎖外建立連線，避免建立連線時阻塞其他執行緒
+            self._size += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, conn: sqlite3.Connection) -> None:
+        try:
+            # 未提交的交易一律回滾，與直接 close() 的行為一致
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def discard(self, conn: sqlite3.Connection) -> None:
+        with contextlib.suppress(sqlite3.Error):
+            conn.close()
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close_idle(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            with contextlib.suppress(sqlite3.Error):
+                conn.close()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update({
+                'db_file': self.db_file,
+                'pid': self.pid,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            })
+        stats['avg_wait_ms'] = (stats['wait_time_total'] / stats['waits'] * 1000) if stats['waits'] else 0.0
+        stats['avg_connect_ms'] = (stats['connect_time_total'] / stats['connections_created'] * 1000) if stats['connections_created'] else 0.0
+        return stats
+
+
+class _PooledConnection:
+    """
+    池中連線的包裝，close() 只會把連線交還給目前執行緒的持有者，而不是真正關閉。
+
+    巢狀呼叫共用同一條連線；若取得時外層已有未結束的交易，內層改在 SAVEPOINT 中執行，
+    內層的 commit() / rollback() 只釋放或回滾自己的 SAVEPOINT，不會提交或回滾外層的部分交易。
+    忘記 close()（提早 return 或拋出例外）時，包裝被回收即自動 close()。
+    """
+
+    def __init__(self, holder):
+        self._holder = holder
+        self._conn = holder.conn
+        self._closed = False
+        self._thread = threading.get_ident()
+        self._savepoint = None
+        if self._conn.in_transaction:
+            holder.savepoints += 1
+            self._savepoint = f"nested_{holder.savepoints}"
+            self._conn.execute(f"SAVEPOINT {self._savepoint}")
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        if self._savepoint is None:
+            self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._savepoint is None:
+            return self._conn.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def commit(self):
+        if self._savepoint is None:
+            self._conn.commit()
+        else:
+            # 內層的變更併入外層交易，由外層決定提交
+            self._end_savepoint(rollback=False)
+
+    def rollback(self):
+        if self._savepoint is None:
+            self._conn.rollback()
+        else:
+            self._end_savepoint(rollback=True)
+
+    def _end_savepoint(self, rollback: bool) -> None:
+        savepoint, self._savepoint = self._savepoint, None
+        if savepoint is None or not self._conn.in_transaction:
+            return
+        if rollback:
+            self._conn.execute(f"ROLLBACK TO {savepoint}")
+        self._conn.execute(f"RELEASE {savepoint}")
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            # 與最外層相同：未提交的內層變更一律回滾
+            with contextlib.suppress(sqlite3.Error):
+                self._end_savepoint(rollback=True)
+            _release_ref(self._holder)
+
+    def __del__(self):
+        # 只在持有連線的執行緒中自動歸還；其他執行緒的回收交給持有者在執行緒結束時處理
+        if not self._closed and self._thread == threading.get_ident():
+            with contextlib.suppress(Exception):
+                self.close()
+
+
+_pool: Optional[_ConnectionPool] = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_pool() -> _ConnectionPool:
+    """取得目前進程與 DB_FILE 對應的連線池；fork 後（如 gunicorn --preload）或切換資料庫檔案時會重建。"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid() and pool.db_file == DB_FILE:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid() or _pool.db_file != DB_FILE:
+            if _pool is not None and _pool.pid == os.getpid():
+                _pool.close_idle()
+            _pool = _ConnectionPool(DB_FILE, DB_POOL_SIZE)
+        return _pool
+
+
+class _ConnectionHolder:
+    """
+    單一執行緒的連線持有狀態：conn 為借出的連線，refs 為尚未 close 的 get_db() 次數，holds 為 app context 層數，
+    savepoints 為巢狀 SAVEPOINT 的命名序號。
+    持有者存放在 threading.local 中，執行緒結束（例如 ThreadPoolExecutor / Timer 的執行緒）時被回收，連線隨之歸還連線池。
+    """
+    __slots__ = ('conn', 'pool', 'refs', 'holds', 'savepoints')
+
+    def __init__(self):
+        self.conn = None
+        self.pool = None
+        self.refs = 0
+        self.holds = 0
+        self.savepoints = 0
+
+    def __del__(self):
+        with contextlib.suppress(Exception):
+            _return_connection(self)
+
+
+def _thread_holder() -> _ConnectionHolder:
+    holder = getattr(_local, 'holder', None)
+    if holder is None:
+        holder = _local.holder = _ConnectionHolder()
+    return holder
+
+
+def _return_connection(holder) -> None:
+    conn, pool = holder.conn, holder.pool
+    holder.conn = None
+    holder.pool = None
+    holder.refs = 0
+    if conn is None:
+        return
+    if pool is _pool and pool.pid == os.getpid():
+        pool.checkin(conn)
+    elif pool is not None and pool.pid == os.getpid():
+        # 連線池已因切換資料庫檔案而重建，舊連線直接關閉
+        with contextlib.suppress(sqlite3.Error):
+            conn.close()
+
+
+def _release_ref(holder) -> None:
+    holder.refs = max(0, holder.refs - 1)
+    if holder.refs > 0:
+        return
+    if holder.holds == 0:
+        _return_connection(holder)
+    elif holder.conn is not None and holder.conn.in_transaction:
+        # app context 仍保留連線時，最外層呼叫者未提交的交易同樣回滾，不留給下一個函式
+        with contextlib.suppress(sqlite3.Error):
+            holder.conn.rollback()
+
+
 def get_db():
-    """获取数据库连接"""
-    # 增加 timeout 到 30 秒，以減少 database is locked 錯誤
-    conn = sqlite3.connect(DB_FILE, timeout=30)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """从连接池获取数据库连接（同一執行緒內的巢狀呼叫共用同一條連線）"""
+    holder = _thread_holder()
+    pool = _get_pool()
+    if holder.conn is not None and holder.pool is not pool:
+        # fork 之後或資料庫檔案已切換，不可沿用舊連線
+        if holder.pool is not None and holder.pool.pid == os.getpid():
+            _return_connection(holder)
+        holder.conn = None
+        holder.refs = 0
+    if holder.conn is None:
+        holder.conn = pool.checkout()
+        holder.pool = pool
+    holder.refs += 1
+    return _PooledConnection(holder)
+
+
+def hold_connection() -> None:
+    """在 app context（請求或排程任務）期間保留目前執行緒借出的連線，供多次 get_db() 重複使用。"""
+    _thread_holder().holds += 1
+
+
+def release_connection() -> None:
+    """app context 結束時呼叫：把目前執行緒持有的連線歸還連線池。"""
+    holder = _thread_holder()
+    holder.holds = max(0, holder.holds - 1)
+    if holder.holds == 0:
+        # 即使有函式忘記 close()，context 結束時也會強制歸還
+        _return_connection(holder)
+
+
+def get_pool_stats() -> Dict:
+    """獲取連線池指標（連線數、重複使用次數與等待時間）"""
+    return _get_pool().snapshot()
 
 def init_database():
     """初始化数据库结构，并安全地添加新字段"""
+    # WAL、auto_vacuum 等 PRAGMA 已在連線池建立連線時套用
     conn = get_db()
-    # 啟用 WAL 模式以提高並發性能
-    conn.execute('PRAGMA journal_mode=WAL')
     cursor = conn.cursor()
     
     # 用户表
@@ -217,20 +549,600 @@ def init_database():
             FOREIGN KEY (user_id) REFERENCES users(user_id)
         )
     ''')
-    
-    # 新增紀錄發送訊息函數
-def log_message_send(user_id: str, target_name: str, message_type: str, status: str, error_message: Optional[str] = None, message_excerpt: Optional[str] = None):
+
+    # 已刪除用戶的紀錄，供用戶目錄增量同步時通知前端移除
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deleted_users (
+            user_id TEXT PRIMARY KEY,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 資料版本表：每次寫入相關資料表時遞增，用於 ETag / 變更偵測（跨 gunicorn worker 共用）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.executemany(
+        'INSERT OR IGNORE INTO data_versions (scope, version) VALUES (?, 0)',
+        [(scope,) for scope in DATA_VERSION_SCOPES]
+    )
+
+    # 變更事件表：預約、回覆狀態、備取、休診等寫入時新增一筆，供 SSE 推播給管理介面
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            payload TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 發送統計日彙總表：message_log 寫入時同步累加，統計頁直接讀取
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_stats_daily (
+            day TEXT NOT NULL,
+            message_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, message_type, status)
+        )
+    ''')
+    # 新建立的彙總表要先由既有的 message_log 回填
+    cursor.execute('SELECT 1 FROM message_stats_daily LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute('SELECT 1 FROM message_log LIMIT 1')
+        if cursor.fetchone() is not None:
+            _rebuild_message_stats_daily(cursor)
+
+    _ensure_indexes(cursor)
+
+    conn.commit()
+    conn.close()
+
+# ==================== 索引 ====================
+
+# 索引組的版本，記錄在 PRAGMA user_version；調整 INDEXES 時請一併遞增
+INDEX_SET_VERSION = 3
+
+# (索引名稱, 建立語法)；對應 HOT_QUERIES 中的查詢路徑
+INDEXES = [
+    # 同一時段、同一類型只能有一筆已確認的預約（取代 fix_db_index.py）
+    ('idx_confirmed_slot', "CREATE UNIQUE INDEX idx_confirmed_slot ON appointments(date, time, type) WHERE status = 'confirmed'"),
+    # 週/日排程、提醒：依日期範圍查詢並依日期、時間排序
+    ('idx_appointments_date_time', 'CREATE INDEX idx_appointments_date_time ON appointments(date, time)'),
+    # 用戶的預約與最近一筆未來預約
+    ('idx_appointments_user_status_date', 'CREATE INDEX idx_appointments_user_status_date ON appointments(user_id, status, date, time)'),
+    # 發送紀錄：最近紀錄、依用戶、依類型統計
+    # 統計頁依月份（send_time 範圍）彙整時不需回表
+    ('idx_message_log_send_time_cover', 'CREATE INDEX idx_message_log_send_time_cover ON message_log(send_time, message_type, status)'),
+    ('idx_message_log_user_time', 'CREATE INDEX idx_message_log_user_time ON message_log(user_id, send_time)'),
+    ('idx_message_log_type_time', 'CREATE INDEX idx_message_log_type_time ON message_log(message_type, send_time)'),
+    # 排程訊息：每分鐘查詢待發送的排程
+    ('idx_schedules_status_send_time', 'CREATE INDEX idx_schedules_status_send_time ON schedules(status, send_time)'),
+    # 備取名單：依日期範圍查詢
+    ('idx_waiting_list_date', 'CREATE INDEX idx_waiting_list_date ON waiting_list(date, created_at)'),
+    # 用戶目錄增量同步：依 updated_at 取出變更的用戶
+    ('idx_users_updated_at', 'CREATE INDEX idx_users_updated_at ON users(updated_at)'),
+    ('idx_deleted_users_deleted_at', 'CREATE INDEX idx_deleted_users_deleted_at ON deleted_users(deleted_at)'),
+]
+
+# 已不再使用、升級時要刪除的索引
+RETIRED_INDEXES = ['idx_message_log_send_time']
+
+# 必須走索引的熱門查詢：(名稱, SQL, 範例參數)；check_hot_query_plans 會以 EXPLAIN QUERY PLAN 驗證
+HOT_QUERIES = [
+    ('week_appointments', '''
+        SELECT a.*, u.reminder_schedule, u.is_admin
+        FROM appointments a
+        LEFT JOIN users u ON a.user_id = u.user_id
+        WHERE a.date BETWEEN ? AND ?
+        ORDER BY a.date, a.time
+    ''', ('2025-01-06', '2025-01-12')),
+    ('confirmed_slot', "SELECT * FROM appointments WHERE date = ? AND time = ? AND status = 'confirmed'", ('2025-01-06', '09:00')),
+    ('booked_times', '''
+        SELECT date, time FROM appointments
+        WHERE date BETWEEN ? AND ? AND type = ? AND status = 'confirmed'
+    ''', ('2025-01-06', '2025-01-12', 'consultation')),
+    ('closest_future_appointment', '''
+        SELECT * FROM appointments
+        WHERE user_id = ? AND status = 'confirmed'
+        AND (date > ? OR (date = ? AND time >= ?))
+        ORDER BY date ASC, time ASC
+        LIMIT 1
+    ''', ('U0', '2025-01-06', '2025-01-06', '09:00')),
+    ('user_appointments', 'SELECT * FROM appointments WHERE user_id = ? ORDER BY date, time', ('U0',)),
+    ('recent_message_logs', 'SELECT * FROM message_log ORDER BY send_time DESC LIMIT ?', (20,)),
+    ('message_log_by_user', 'SELECT COUNT(*) FROM message_log WHERE user_id = ?', ('U0',)),
+    ('message_log_by_type', 'SELECT COUNT(*) FROM message_log WHERE message_type = ?', ('reminder_week',)),
+    ('message_stats_month', '''
+        SELECT substr(send_time, 1, 10) as send_date, message_type, COUNT(*),
+               SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END)
+        FROM message_log
+        WHERE send_time >= ? AND send_time < ?
+        GROUP BY send_date, message_type
+    ''', ('2025-01-01', '2025-02-01')),
+    ('message_stats_daily_month', '''
+        SELECT day, message_type, SUM(count)
+        FROM message_stats_daily
+        WHERE day >= ? AND day < ?
+        GROUP BY day, message_type
+    ''', ('2025-01-01', '2025-02-01')),
+    ('message_errors_month', '''
+        SELECT send_time, target_name, message_type, error_message, message_excerpt
+        FROM message_log
+        WHERE send_time >= ? AND send_time < ? AND status = 'failed'
+        ORDER BY send_time DESC
+        LIMIT 10
+    ''', ('2025-01-01', '2025-02-01')),
+    ('pending_schedules', "SELECT * FROM schedules WHERE status = 'pending' AND send_time <= ?", ('2025-01-06 00:00:00',)),
+    ('waiting_list_range', 'SELECT * FROM waiting_list WHERE date BETWEEN ? AND ? ORDER BY date, created_at', ('2025-01-06', '2025-01-12')),
+    ('users_changed_since', 'SELECT user_id, name, zhuyin, is_admin, updated_at FROM users WHERE updated_at >= ?', ('2025-01-06 00:00:00',)),
+    ('users_deleted_since', 'SELECT user_id, deleted_at FROM deleted_users WHERE deleted_at >= ?', ('2025-01-06 00:00:00',)),
+]
+
+def _normalize_sql(sql: Optional[str]) -> str:
+    return " ".join((sql or '').split()).lower()
+
+def _ensure_indexes(cursor) -> None:
+    """依 INDEX_SET_VERSION 建立或更新索引；版本相同時不做任何事"""
+    cursor.execute('PRAGMA user_version')
+    if cursor.fetchone()[0] >= INDEX_SET_VERSION:
+        return
+
+    for name in RETIRED_INDEXES:
+        cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+    complete = True
+    for name, sql in INDEXES:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (name,))
+        row = cursor.fetchone()
+        if row and _normalize_sql(row[0]) == _normalize_sql(sql):
+            continue
+        # 刪除舊索引與建立新索引放在同一個 savepoint，建立失敗時連同刪除一起還原
+        cursor.execute('SAVEPOINT ensure_index')
+        try:
+            if row:
+                # 名稱相同但定義不同（例如舊版 fix_db_index.py 建立的索引），重新建立
+                cursor.execute(f'DROP INDEX {name}')
+            cursor.execute(sql)
+            cursor.execute('RELEASE ensure_index')
+            print(f"已建立索引 {name}")
+        except sqlite3.IntegrityError as e:
+            # 既有資料違反唯一限制時保留舊索引，下次啟動再試
+            cursor.execute('ROLLBACK TO ensure_index')
+            cursor.execute('RELEASE ensure_index')
+            complete = False
+            print(f"警告：無法建立索引 {name}，請先清理重複資料: {e}")
+
+    if complete:
+        cursor.execute(f'PRAGMA user_version = {INDEX_SET_VERSION}')
+
+def check_hot_query_plans() -> List[Dict]:
+    """
+    對 HOT_QUERIES 執行 EXPLAIN QUERY PLAN，回傳每個查詢的計畫與是否有全表掃描。
+
+    Returns:
+        List[Dict]: name、plan（計畫明細列表）、full_scan（是否出現未使用索引的 SCAN）
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    results = []
+    for name, sql, params in HOT_QUERIES:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        plan = [row[3] for row in cursor.fetchall()]
+        full_scan = any(
+            detail.startswith('SCAN ') and ' INDEX ' not in f'{detail} ' and 'USING INTEGER PRIMARY KEY' not in detail
+            for detail in plan
+        )
+        results.append({'name': name, 'plan': plan, 'full_scan': full_scan})
+    conn.close()
+    return results
+
+# ==================== 資料版本 ====================
+
+# schedule: appointments / waiting_list / closed_days / available_slots
+# users: users 表
+# configs: configs 表
+# slots: available_slots 表（時段異動時與 schedule 一併遞增）
+DATA_VERSION_SCOPES = ('schedule', 'users', 'configs', 'slots')
+# change_events 表保留的事件筆數
+CHANGE_EVENT_RETENTION = 1000
+
+def _bump_data_version(cursor, *scopes: str) -> int:
+    """在目前交易中遞增指定範圍的資料版本，需在寫入後、commit 前呼叫；回傳最後一個範圍的新版本"""
+    for scope in scopes:
+        cursor.execute('''
+            INSERT INTO data_versions (scope, version) VALUES (?, 1)
+            ON CONFLICT(scope) DO UPDATE SET version = version + 1
+        ''', (scope,))
+    cursor.execute('SELECT version FROM data_versions WHERE scope = ?', (scopes[-1],))
+    return cursor.fetchone()[0]
+
+def _record_change(cursor, event: str, scope: str = 'schedule', **data) -> int:
+    """記錄一筆變更事件並遞增資料版本（與寫入在同一交易中），供管理介面的 SSE 即時推播；回傳新的版本號"""
+    new_version = _bump_data_version(cursor, scope)
+    cursor.execute(
+        'INSERT INTO change_events (event, scope, payload) VALUES (?, ?, ?)',
+        (event, scope, json.dumps(data, ensure_ascii=False, default=str))
+    )
+    # 只保留最近的事件，斷線重連時用 Last-Event-ID 補送即可
+    cursor.execute('DELETE FROM change_events WHERE id <= ?', (cursor.lastrowid - CHANGE_EVENT_RETENTION,))
+    return new_version
+
+def get_change_events_since(last_id: int, limit: int = 200) -> List[Dict]:
+    """獲取指定 ID 之後的變更事件"""
     conn = get_db()
     cursor = conn.cursor()
-    
     cursor.execute('''
-        INSERT INTO message_log 
-        (user_id, target_name, message_type, status, error_message, message_excerpt)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (user_id, target_name, message_type, status, error_message, message_excerpt))
-    
-    conn.commit()
+        SELECT id, event, scope, payload, created_at FROM change_events
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (last_id, limit))
+    events = []
+    for row in cursor.fetchall():
+        event = dict(row)
+        event['payload'] = json.loads(event['payload']) if event['payload'] else {}
+        events.append(event)
+    conn.close()
+    return events
+
+def get_latest_change_event_id() -> int:
+    """獲取最新一筆變更事件的 ID"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(id) FROM change_events')
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] or 0
+
+def get_data_versions() -> Dict[str, int]:
+    """獲取所有範圍目前的資料版本"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT scope, version FROM data_versions')
+    versions = {row['scope']: row['version'] for row in cursor.fetchall()}
+    conn.close()
+    return versions
+
+def get_data_version(scope: str) -> int:
+    """獲取單一範圍目前的資料版本"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT version FROM data_versions WHERE scope = ?', (scope,))
+    row = cursor.fetchone()
     conn.close()
+    return row['version'] if row else 0
+
+# 進程內快取多久向資料庫確認一次版本（秒）
+CACHE_VERSION_CHECK_INTERVAL = float(os.getenv('CACHE_VERSION_CHECK_INTERVAL', '1'))
+
+class _VersionedCache:
+    """
+    以 data_versions 驗證的進程內快取。
+
+    第一次讀取時由 loader 載入整份資料，之後最多每 check_interval 秒查詢一次該範圍的版本，
+    版本改變（其他 gunicorn worker 寫入）才重新載入。本進程寫入時以 apply() 直接更新快取。
+    """
+
+    def __init__(self, scope: str, loader, check_interval: float = CACHE_VERSION_CHECK_INTERVAL):
+        self.scope = scope
+        self.loader = loader
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._source = None
+        self._checked_at = 0.0
+        self.stats = {'hits': 0, 'version_checks': 0, 'loads': 0}
+
+    def get(self):
+        source = (DB_FILE, os.getpid())
+        # 命中時不取鎖：各屬性的讀取在 GIL 下是原子的，最壞情況只是多查一次版本
+        data = self._data
+        if data is not None and self._source == source and time.monotonic() - self._checked_at < self.check_interval:
+            self.stats['hits'] += 1  # 近似值，不需精確
+            return data
+        version = get_data_version(self.scope)
+        with self._lock:
+            self.stats['version_checks'] += 1
+            if self._data is not None and self._source == source and self._version == version:
+                self._checked_at = time.monotonic()
+                return self._data
+        # 先讀版本再載入資料：期間若有寫入，下次檢查時版本不符會再重新載入
+        data = self.loader()
+        with self._lock:
+            self.stats['loads'] += 1
+            self._data, self._version, self._source = data, version, source
+            self._checked_at = time.monotonic()
+        return data
+
+    def apply(self, new_version: int, mutate) -> None:
+        """本進程寫入並 commit 後呼叫：若快取正好落後一版，直接以 mutate(data) 更新，否則捨棄快取"""
+        with self._lock:
+            if self._data is not None and self._source == (DB_FILE, os.getpid()) and self._version == new_version - 1:
+                mutate(self._data)
+                self._version = new_version
+            else:
+                self._data = None
+
+    def is_loaded(self) -> bool:
+        """本進程是否已載入目前 DB_FILE 的資料（不會觸發載入）"""
+        return self._data is not None and self._source == (DB_FILE, os.getpid())
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._data = None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, version=self._version, loaded=self._data is not None)
+
+# ==================== 發送紀錄 ====================
+
+# 發送紀錄先暫存在記憶體，累積到一定筆數或時間後再以單一交易寫入
+MESSAGE_LOG_FLUSH_SIZE = int(os.getenv('MESSAGE_LOG_FLUSH_SIZE', '200'))
+MESSAGE_LOG_FLUSH_INTERVAL = float(os.getenv('MESSAGE_LOG_FLUSH_INTERVAL', '2'))
+# 寫入持續失敗時緩衝區最多保留的筆數，超過時捨棄最舊的紀錄，避免記憶體無限成長
+MESSAGE_LOG_MAX_PENDING = int(os.getenv('MESSAGE_LOG_MAX_PENDING', '10000'))
+
+class _MessageLogBuffer:
+    """
+    message_log 的寫入緩衝區。
+
+    rows 達到 flush_size 筆時立即寫入；否則在第一筆進入後 flush_interval 秒由計時器寫入。
+    send_time 在加入緩衝區時就決定，因此延後寫入不影響紀錄時間。
+    寫入失敗時紀錄放回緩衝區並重新排程，最多保留 max_pending 筆。
+    """
+
+    def __init__(self, flush_size: int, flush_interval: float, max_pending: int = MESSAGE_LOG_MAX_PENDING):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._rows = []
+        self._timer = None
+        self._pid = os.getpid()
+
+    def _schedule_locked(self) -> None:
+        # 需在持有 self._lock 時呼叫
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def add(self, rows: list) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 之後不寫入父進程留下的紀錄，避免重複
+                self._pid = os.getpid()
+                self._rows = []
+                self._timer = None
+            self._rows.extend(rows)
+            should_flush = len(self._rows) >= self.flush_size
+            if not should_flush:
+                self._schedule_locked()
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> int:
+        """將緩衝區內的紀錄寫入資料庫，回傳寫入筆數"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not rows or self._pid != os.getpid():
+                return 0
+            conn = None
+            try:
+                conn = get_db()
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO message_log 
+                    (user_id, target_name, message_type, status, error_message, message_excerpt, send_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                _add_to_message_stats_daily(cursor, rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"寫入發送紀錄失敗，共 {len(rows)} 筆: {e}")
+                if conn is not None:
+                    conn.rollback()
+                with self._lock:
+                    self._rows[:0] = rows
+                    overflow = len(self._rows) - self.max_pending
+                    if overflow > 0:
+                        del self._rows[:overflow]
+                        self.dropped += overflow
+                        print(f"發送紀錄緩衝區已滿，捨棄最舊的 {overflow} 筆")
+                    # 沒有新的 add() 時也要再試一次
+                    self._schedule_locked()
+                return 0
+            finally:
+                if conn is not None:
+                    conn.close()
+            return len(rows)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+_message_log_buffer = _MessageLogBuffer(MESSAGE_LOG_FLUSH_SIZE, MESSAGE_LOG_FLUSH_INTERVAL)
+atexit.register(_message_log_buffer.flush)
+
+def _message_log_row(user_id, target_name, message_type, status, error_message=None, message_excerpt=None):
+    # 與 CURRENT_TIMESTAMP 相同的 UTC 格式
+    send_time = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    return (user_id, target_name, message_type, status, error_message, message_excerpt, send_time)
+
+def log_message_send(user_id: str, target_name: str, message_type: str, status: str, error_message: Optional[str] = None, message_excerpt: Optional[str] = None):
+    """記錄一筆發送紀錄（先寫入緩衝區）"""
+    _message_log_buffer.add([_message_log_row(user_id, target_name, message_type, status, error_message, message_excerpt)])
+
+def log_message_sends(rows: list):
+    """一次記錄多筆發送紀錄；rows 中每一項的欄位與 log_message_send 的參數相同"""
+    if not rows:
+        return
+    _message_log_buffer.add([
+        _message_log_row(row['user_id'], row['target_name'], row['message_type'], row['status'], row.get('error_message'), row.get('message_excerpt'))
+        for row in rows
+    ])
+
+def _add_to_message_stats_daily(cursor, rows: list) -> None:
+    """將剛寫入的發送紀錄累加到日彙總表（與寫入在同一交易中）"""
+    counts = {}
+    for row in rows:
+        # row 的欄位順序見 _message_log_row；send_time 前 10 碼即為日期
+        key = (row[6][:10], row[2], row[3])
+        counts[key] = counts.get(key, 0) + 1
+    cursor.executemany('''
+        INSERT INTO message_stats_daily (day, message_type, status, count) VALUES (?, ?, ?, ?)
+        ON CONFLICT(day, message_type, status) DO UPDATE SET count = count + excluded.count
+    ''', [(day, message_type, status, count) for (day, message_type, status), count in counts.items()])
+
+def _rebuild_message_stats_daily(cursor) -> None:
+    # 封存截止日（含）以前的紀錄已不在 message_log 中，只重建之後完整保留的日期，已封存日期的彙總維持不變
+    cursor.execute('SELECT value FROM configs WHERE key = ?', (MESSAGE_LOG_ARCHIVED_BEFORE_KEY,))
+    row = cursor.fetchone()
+    first_day = ''
+    if row and row[0]:
+        first_day = (datetime.strptime(row[0][:10], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    cursor.execute('DELETE FROM message_stats_daily WHERE day >= ?', (first_day,))
+    cursor.execute('''
+        INSERT INTO message_stats_daily (day, message_type, status, count)
+        SELECT substr(send_time, 1, 10), message_type, status, COUNT(*)
+        FROM message_log
+        WHERE send_time >= ?
+        GROUP BY substr(send_time, 1, 10), message_type, status
+    ''', (first_day,))
+
+def rebuild_message_stats_daily() -> int:
+    """由 message_log 重新計算日彙總表（已封存的日期除外），回傳彙總列數"""
+    flush_message_log()
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        _rebuild_message_stats_daily(cursor)
+        cursor.execute('SELECT COUNT(*) FROM message_stats_daily')
+        row_count = cursor.fetchone()[0]
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return row_count
+
+def flush_message_log() -> int:
+    """立即寫入緩衝區中的發送紀錄；讀取 message_log 或批次任務結束前呼叫"""
+    return _message_log_buffer.flush()
+
+def get_message_log_stats() -> Dict:
+    return {
+        'pending': _message_log_buffer.pending(),
+        'flush_size': _message_log_buffer.flush_size,
+        'flush_interval': _message_log_buffer.flush_interval,
+        'max_pending': _message_log_buffer.max_pending,
+        'dropped': _message_log_buffer.dropped,
+    }
+
+def _month_range(month: str) -> tuple:
+    """將 YYYY-MM 轉為 send_time 的半開區間 [當月一日, 次月一日)，讓查詢可以使用索引"""
+    year, mon = (int(part) for part in month.split('-'))
+    next_year, next_mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{year:04d}-{mon:02d}-01", f"{next_year:04d}-{next_mon:02d}-01"
+
+# ==================== 發送紀錄保存期限 ====================
+
+# 超過保存期限的發送紀錄會先封存到此目錄的 gzip JSONL 檔，再從資料庫刪除
+MESSAGE_LOG_ARCHIVE_DIR = os.getenv('MESSAGE_LOG_ARCHIVE_DIR', 'archive')
+# 每批搬移的筆數，避免長時間鎖住資料庫
+MESSAGE_LOG_ARCHIVE_BATCH = 5000
+# configs 中記錄目前封存截止時間的鍵；重建彙總表時不會覆寫此時間以前的日期
+MESSAGE_LOG_ARCHIVED_BEFORE_KEY = 'message_log_archived_before'
+
+def archive_message_log(retention_days: int, archive_dir: Optional[str] = None) -> Dict:
+    """
+    將 send_time 早於 retention_days 天前的發送紀錄封存並刪除。
+
+    每批先寫入並 fsync 封存檔，再於同一批次刪除對應紀錄，中途失敗也不會遺失資料。
+    message_stats_daily 不受影響，統計頁的歷史數字維持不變。
+
+    Returns:
+        Dict: archived（搬移筆數）、archive_file（封存檔路徑，無資料時為 None）、cutoff（UTC 截止時間）
+    """
+    flush_message_log()
+    cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - retention_days * 86400))
+    archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), MESSAGE_LOG_ARCHIVE_DIR)
+    archive_file = os.path.join(archive_dir, f"message_log_before_{cutoff[:10]}.jsonl.gz")
+
+    archived = 0
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute('''
+                SELECT * FROM message_log WHERE send_time < ? ORDER BY id LIMIT ?
+            ''', (cutoff, MESSAGE_LOG_ARCHIVE_BATCH))
+            rows = [dict(row) for row in cursor.fetchall()]
+            if not rows:
+                break
+            os.makedirs(archive_dir, exist_ok=True)
+            # gzip 可直接附加新的成員，同一天重複執行會寫入同一個檔案
+            with gzip.open(archive_file, 'at', encoding='utf-8') as archive:
+                for row in rows:
+                    archive.write(json.dumps(row, ensure_ascii=False) + "\n")
+                archive.flush()
+                os.fsync(archive.fileno())
+            cursor.executemany('DELETE FROM message_log WHERE id = ?', [(row['id'],) for row in rows])
+            # 與刪除在同一個交易中記錄封存截止時間（只會往後移）
+            cursor.execute('''
+                INSERT INTO configs (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(key) DO UPDATE SET value = max(value, excluded.value), updated_at = CURRENT_TIMESTAMP
+            ''', (MESSAGE_LOG_ARCHIVED_BEFORE_KEY, cutoff))
+            _bump_data_version(cursor, 'configs')
+            conn.commit()
+            archived += len(rows)
+    finally:
+        conn.close()
+    if archived:
+        _config_cache.invalidate()
+    return {'archived': archived, 'archive_file': archive_file if archived else None, 'cutoff': cutoff}
+
+def compact_database(max_pages: int = 2000) -> Dict:
+    """
+    歸還刪除資料後的空頁。
+
+    已啟用增量 VACUUM 的資料庫每次最多釋放 max_pages 頁；舊資料庫第一次執行時
+    會切換為 INCREMENTAL 並做一次完整 VACUUM（請在離峰時段執行）。
+    """
+    conn = get_db()
+    try:
+        conn.commit()
+        freelist_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            mode = 'full'
+        else:
+            conn.execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
+            mode = 'incremental'
+        conn.commit()
+        # 截斷 WAL 檔，讓釋放的空間真正回到檔案系統
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        freelist_after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    finally:
+        conn.close()
+    return {'mode': mode, 'freed_pages': max(0, freelist_before - freelist_after), 'free_pages': freelist_after}
 
 def get_message_stats(month: Optional[str] = None, user_id: Optional[str] = None, message_type: Optional[str] = None):
     """獲取訊息統計資料
@@ -243,16 +1155,18 @@ def get_message_stats(month: Optional[str] = None, user_id: Optional[str] = None
     Returns:
         Dict: 包含統計資料的字典
     """
+    flush_message_log()
     conn = get_db()
     cursor = conn.cursor()
     
     conditions = []
     params = []
     
-    # 建立 SQL WHERE 條件
+    # 建立 SQL WHERE 條件（月份以 send_time 範圍比對，才能使用索引）
     if month:
-        conditions.append("strftime('%Y-%m', send_time) = ?")
-        params.append(month)
+        month_start, month_end = _month_range(month)
+        conditions.append("send_time >= ? AND send_time < ?")
+        params.extend([month_start, month_end])
     if user_id:
         conditions.append("user_id = ?")
         params.append(user_id)
@@ -273,61 +1187,44 @@ def get_message_stats(month: Optional[str] = None, user_id: Optional[str] = None
         "errors": []
     }
     
-    # 統計總數和成功/失敗數
-    cursor.execute(f'''
-        SELECT 
-            COUNT(*) as total,
-            SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success,
-            SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed
-        FROM message_log
-        {where_clause}
-    ''', params)
-    row = cursor.fetchone()
-    if row and row[0] > 0:
-        stats["total_messages"] = row[0]
-        stats["success_count"] = row[1]
-        stats["failed_count"] = row[2]
-        stats["success_rate"] = (row[1] / row[0] * 100)
+    if user_id:
+        # 日彙總表不分用戶，指定用戶時才從原始紀錄計算（一次掃描取得 日期 × 類型 的計數）
+        cursor.execute(f'''
+            SELECT 
+                substr(send_time, 1, 10) as send_date,
+                message_type,
+                COUNT(*) as count,
+                SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success_count,
+                SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed_count
+            FROM message_log
+            {where_clause}
+            GROUP BY send_date, message_type
+        ''', params)
     else:
-        stats["success_rate"] = 'N/A'
-    
-    # 按訊息類型統計
-    cursor.execute(f'''
-        SELECT 
-            message_type,
-            COUNT(*) as count,
-            SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success_count
-        FROM message_log
-        {where_clause}
-        GROUP BY message_type
-    ''', params)
-    for row in cursor.fetchall():
-        stats["message_types"][row[0]] = {
-            "total": row[1],
-            "success": row[2],
-            "success_rate": (row[2] / row[1] * 100) if row[1] > 0 else 'N/A'
-        }
-    
-    # 按日期統計
-    cursor.execute(f'''
-        SELECT 
-            date(send_time) as send_date,
-            COUNT(*) as count,
-            SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success_count
-        FROM message_log
-        {where_clause}
-        GROUP BY date(send_time)
-        ORDER BY send_date
-    ''', params)
-    for row in cursor.fetchall():
-        stats["daily_stats"].append({
-            "date": row[0],
-            "total": row[1],
-            "success": row[2],
-            "success_rate": (row[2] / row[1] * 100) if row[1] > 0 else 'N/A'
-        })
+        rollup_conditions = []
+        rollup_params = []
+        if month:
+            rollup_conditions.append("day >= ? AND day < ?")
+            rollup_params.extend(_month_range(month))
+        if message_type:
+            rollup_conditions.append("message_type = ?")
+            rollup_params.append(message_type)
+        rollup_where = " WHERE " + " AND ".join(rollup_conditions) if rollup_conditions else ""
+        cursor.execute(f'''
+            SELECT 
+                day,
+                message_type,
+                SUM(count),
+                SUM(CASE WHEN status = 'success' THEN count ELSE 0 END),
+                SUM(CASE WHEN status = 'failed' THEN count ELSE 0 END)
+            FROM message_stats_daily
+            {rollup_where}
+            GROUP BY day, message_type
+        ''', rollup_params)
+    _fill_message_stats(stats, cursor.fetchall())
     
     # 獲取最近的錯誤
+    error_conditions = conditions + ["status = 'failed'"]
     cursor.execute(f'''
         SELECT 
             send_time,
@@ -336,8 +1233,7 @@ def get_message_stats(month: Optional[str] = None, user_id: Optional[str] = None
             error_message,
             message_excerpt
         FROM message_log
-        {where_clause}
-        AND status = 'failed'
+        WHERE {" AND ".join(error_conditions)}
         ORDER BY send_time DESC
         LIMIT 10
     ''', params)
@@ -353,8 +1249,44 @@ def get_message_stats(month: Optional[str] = None, user_id: Optional[str] = None
     conn.close()
     return stats
 
+def _fill_message_stats(stats: Dict, rows) -> None:
+    """由 (日期, 類型, 總數, 成功數, 失敗數) 的分組計數填入 stats 的總數、類型與每日統計"""
+    type_totals = {}
+    daily_totals = {}
+    for send_date, msg_type, count, success_count, failed_count in rows:
+        stats["total_messages"] += count
+        stats["success_count"] += success_count
+        stats["failed_count"] += failed_count
+        type_total = type_totals.setdefault(msg_type, [0, 0])
+        type_total[0] += count
+        type_total[1] += success_count
+        daily_total = daily_totals.setdefault(send_date, [0, 0])
+        daily_total[0] += count
+        daily_total[1] += success_count
+
+    if stats["total_messages"] > 0:
+        stats["success_rate"] = (stats["success_count"] / stats["total_messages"] * 100)
+    else:
+        stats["success_rate"] = 'N/A'
+    for msg_type in sorted(type_totals):
+        total, success = type_totals[msg_type]
+        stats["message_types"][msg_type] = {
+            "total": total,
+            "success": success,
+            "success_rate": (success / total * 100) if total > 0 else 'N/A'
+        }
+    for send_date in sorted(daily_totals):
+        total, success = daily_totals[send_date]
+        stats["daily_stats"].append({
+            "date": send_date,
+            "total": total,
+            "success": success,
+            "success_rate": (success / total * 100) if total > 0 else 'N/A'
+        })
+
 def get_recent_message_logs(limit: int = 20):
     """獲取最近的發送記錄"""
+    flush_message_log()
     conn = get_db()
     cursor = conn.cursor()
     
@@ -379,6 +1311,87 @@ def get_recent_message_logs(limit: int = 20):
 
 # ==================== 用户管理 ====================
 
+# 用戶目錄的精簡紀錄：權限檢查、用戶列表與 add_user 的變更比對只需要這些欄位
+UserRecord = namedtuple('UserRecord', ['user_id', 'name', 'zhuyin', 'is_admin', 'phone', 'phone2', 'reminder_schedule', 'picture_url', 'manual_update'])
+
+_USER_RECORD_COLUMNS = 'user_id, name, zhuyin, is_admin, phone, phone2, reminder_schedule, picture_url, manual_update'
+
+def _user_record_from_row(row) -> UserRecord:
+    return UserRecord(row['user_id'], row['name'], row['zhuyin'], bool(row['is_admin']), row['phone'], row['phone2'],
+                      row['reminder_schedule'], row['picture_url'], bool(row['manual_update']))
+
+def _load_user_directory() -> Dict:
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {_USER_RECORD_COLUMNS} FROM users ORDER BY created_at DESC')
+    records = tuple(_user_record_from_row(row) for row in cursor.fetchall())
+    conn.close()
+    return {'records': records, 'by_id': {record.user_id: record for record in records}}
+
+def _upsert_user_record(record: UserRecord):
+    """回傳給 _user_directory.apply() 的 mutate：新增的用戶排在最前面（依建立時間由新到舊）"""
+    def mutate(directory):
+        if record.user_id in directory['by_id']:
+            directory['records'] = tuple(record if r.user_id == record.user_id else r for r in directory['records'])
+        else:
+            directory['records'] = (record,) + directory['records']
+        directory['by_id'][record.user_id] = record
+    return mutate
+
+# 用戶目錄：users 版本改變（任一 worker 修改用戶）後才重新載入；本進程修改用戶後捨棄（add_user 則直接更新該筆）
+_user_directory = _VersionedCache('users', _load_user_directory)
+
+def get_user_directory() -> tuple:
+    """获取所有用户的精簡紀錄（UserRecord，依建立時間由新到舊，由進程內快取提供）"""
+    return _user_directory.get()['records']
+
+def get_user_record(user_id: str) -> Optional[UserRecord]:
+    """通过 user_id 获取用户的精簡紀錄（由進程內快取提供）"""
+    return _user_directory.get()['by_id'].get(user_id)
+
+def _record_user_deleted(cursor, user_id: str) -> None:
+    cursor.execute('INSERT OR REPLACE INTO deleted_users (user_id, deleted_at) VALUES (?, CURRENT_TIMESTAMP)', (user_id,))
+
+def get_user_changes(since: Optional[str] = None) -> Dict:
+    """
+    用戶目錄的增量同步。
+
+    since 為上一次回傳的 sync_token（users.updated_at 的時間字串）；未提供時回傳全部用戶。
+    updated_at 只精確到秒，因此以 >= 比對，同一秒內的變更可能重複送出，前端以 user_id 覆蓋即可。
+    前端應先套用 deleted 再套用 users（刪除後又重新建立的用戶兩邊都會出現）。
+
+    Returns:
+        Dict: users（變更的用戶：user_id、name、zhuyin、is_admin）、deleted（已刪除的 user_id）、
+              sync_token（下次同步時帶入）、full（是否為完整列表）
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    if since:
+        cursor.execute('''
+            SELECT user_id, name, zhuyin, is_admin, updated_at FROM users
+            WHERE updated_at >= ? ORDER BY updated_at
+        ''', (since,))
+    else:
+        cursor.execute('SELECT user_id, name, zhuyin, is_admin, updated_at FROM users ORDER BY created_at DESC')
+    rows = cursor.fetchall()
+    deleted = []
+    if since:
+        cursor.execute('SELECT user_id, deleted_at FROM deleted_users WHERE deleted_at >= ?', (since,))
+        deleted = cursor.fetchall()
+    conn.close()
+    timestamps = [row['updated_at'] for row in rows if row['updated_at']] + [row['deleted_at'] for row in deleted]
+    if since:
+        timestamps.append(since)
+    return {
+        'users': [
+            {'user_id': row['user_id'], 'name': row['name'], 'zhuyin': row['zhuyin'], 'is_admin': bool(row['is_admin'])}
+            for row in rows
+        ],
+        'deleted': [row['user_id'] for row in deleted],
+        'sync_token': max(timestamps, default=None),
+        'full': not since,
+    }
+
 def get_all_users() -> List[Dict]:
     """获取所有用户"""
     conn = get_db()
@@ -399,32 +1412,46 @@ def get_user_by_id(user_id: str) -> Optional[Dict]:
     conn.close()
     return dict(user) if user else None
 
-def add_user(user_id: str, name: str, picture_url: Optional[str] = None, phone: Optional[str] = None, phone2: Optional[str] = None, address: Optional[str] = None) -> None:
-    """新增或更新用户，如果用户已存在，则更新姓名"""
+def add_user(user_id: str, name: str, picture_url: Optional[str] = None, phone: Optional[str] = None, phone2: Optional[str] = None, address: Optional[str] = None) -> bool:
+    """
+    新增或更新用户，如果用户已存在，则更新姓名与头像。
+
+    每次 Webhook 事件與登入都會呼叫，因此先與用戶目錄快取比對：姓名（未手動修改時）與頭像都沒變就直接返回，
+    不查詢也不寫入；快取尚未載入時只查詢這一位用戶，不為此載入整份目錄。
+    注音只在新增用戶或姓名確實改變時才計算，寫入後直接更新快取中的這一筆。
+
+    Returns:
+        bool: 是否寫入了 users 表
+    """
+    if _user_directory.is_loaded():
+        record = get_user_record(user_id)
+        if record is not None and record.picture_url == picture_url and (record.manual_update or record.name == name):
+            return False
+
+    # 快取可能落後其他 worker 最多 CACHE_VERSION_CHECK_INTERVAL 秒，寫入前仍以資料庫中的紀錄為準
     conn = get_db()
     cursor = conn.cursor()
-    
-    # 检查用户是否存在
     cursor.execute('SELECT name, picture_url, manual_update FROM users WHERE user_id = ?', (user_id,))
     existing_user = cursor.fetchone()
-    
-    zhuyin = _name_to_zhuyin(name)
+    new_version = None
 
     if existing_user:
         # 關鍵商業邏輯：如果用戶名稱是手動更新過的 (manual_update=True)，
         # 則只更新頭像，不覆蓋手動設定的名稱，以保護管理員的修改。
-        if existing_user['manual_update']:
+        if existing_user['manual_update'] or existing_user['name'] == name:
             if existing_user['picture_url'] != picture_url:
                 cursor.execute('''
                     UPDATE users SET picture_url = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
                 ''', (picture_url, user_id))
-        # 否則，正常更新姓名和頭像
-        elif existing_user['name'] != name or existing_user['picture_url'] != picture_url:
+                new_version = _record_change(cursor, 'user_updated', 'users', user_id=user_id)
+        # 否則，正常更新姓名、注音和頭像
+        else:
             cursor.execute('''
                 UPDATE users 
                 SET name = ?, zhuyin = ?, picture_url = ?, updated_at = CURRENT_TIMESTAMP 
                 WHERE user_id = ?
-            ''', (name, zhuyin, picture_url, user_id))
+            ''', (name, _name_to_zhuyin(name), picture_url, user_id))
+            new_version = _record_change(cursor, 'user_updated', 'users', user_id=user_id)
             print(f"Updated user {user_id}'s info (name: {name}, picture_url: {picture_url})")
 
     else:
@@ -432,11 +1459,20 @@ def add_user(user_id: str, name: str, picture_url: Optional[str] = None, phone:
         cursor.execute('''
             INSERT INTO users (user_id, name, picture_url, phone, phone2, zhuyin, address)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, name, picture_url, phone, phone2, zhuyin, address))
+        ''', (user_id, name, picture_url, phone, phone2, _name_to_zhuyin(name), address))
+        new_version = _record_change(cursor, 'user_added', 'users', user_id=user_id)
         print(f"Added new user: {name} ({user_id})")
-        
+
+    if new_version is None:
+        conn.close()
+        return False
+    cursor.execute(f'SELECT {_USER_RECORD_COLUMNS} FROM users WHERE user_id = ?', (user_id,))
+    record = _user_record_from_row(cursor.fetchone())
     conn.commit()
     conn.close()
+    # 快取正好落後一版時直接更新這一筆，不必重新載入整份目錄
+    _user_directory.apply(new_version, _upsert_user_record(record))
+    return True
 
 def update_user_name(user_id: str, new_name: str) -> bool:
     """更新用戶名和注音，並同步更新所有相關的預約記錄。"""
@@ -462,9 +1498,12 @@ def update_user_name(user_id: str, new_name: str) -> bool:
         cursor.execute('''
             UPDATE appointments SET user_name = ? WHERE user_id = ?
         ''', (new_name, user_id))
+        _record_change(cursor, 'user_renamed', 'users', user_id=user_id)
+        _bump_data_version(cursor, 'schedule')
 
         # 提交交易
         conn.commit()
+        _user_directory.invalidate()
         return True
     except Exception as e:
         conn.rollback() # 如果任何一步出錯，就回滾所有操作
@@ -479,8 +1518,13 @@ def delete_user(user_id: str) -> bool:
     cursor = conn.cursor()
     cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
     deleted = cursor.rowcount > 0
+    if deleted:
+        _record_user_deleted(cursor, user_id)
+        _record_change(cursor, 'user_deleted', 'users', user_id=user_id)
     conn.commit()
     conn.close()
+    if deleted:
+        _user_directory.invalidate()
     return deleted
 
 def add_manual_user(user_id: str, name: str) -> Optional[Dict]:
@@ -493,7 +1537,9 @@ def add_manual_user(user_id: str, name: str) -> Optional[Dict]:
             INSERT INTO users (user_id, name, zhuyin, manual_update, is_admin)
             VALUES (?, ?, ?, TRUE, FALSE)
         """, (user_id, name, zhuyin))
+        _record_change(cursor, 'user_added', 'users', user_id=user_id)
         conn.commit()
+        _user_directory.invalidate()
         print(f"Added new manual user: {name} ({user_id})")
         # 查詢並返回剛剛新增的使用者
         cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
@@ -507,6 +1553,8 @@ def add_manual_user(user_id: str, name: str) -> Optional[Dict]:
 
 def merge_users(source_user_id: str, target_user_id: str) -> bool:
     """將 source_user 的資料合併到 target_user，然後刪除 source_user"""
+    # 先寫入緩衝中的發送紀錄，才能一併搬移到 target_user
+    flush_message_log()
     conn = get_db()
     cursor = conn.cursor()
     try:
@@ -537,7 +1585,7 @@ def merge_users(source_user_id: str, target_user_id: str) -> bool:
             set_clause = ", ".join([f"{field} = ?" for field in updates.keys()])
             params = list(updates.values())
             params.append(target_user_id)
-            cursor.execute(f"UPDATE users SET {set_clause} WHERE user_id = ?", tuple(params))
+            cursor.execute(f"UPDATE users SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?", tuple(params))
             print(f"Merged user fields {list(updates.keys())} from {source_user_id} to {target_user_id}")
 
 
@@ -561,9 +1609,13 @@ def merge_users(source_user_id: str, target_user_id: str) -> bool:
 
         # 4. 刪除 source_user
         cursor.execute("DELETE FROM users WHERE user_id = ?", (source_user_id,))
+        _record_user_deleted(cursor, source_user_id)
         print(f"Deleted source user {source_user_id}")
+        _record_change(cursor, 'users_merged', 'users', source_user_id=source_user_id, target_user_id=target_user_id)
+        _bump_data_version(cursor, 'schedule')
 
         conn.commit()
+        _user_directory.invalidate()
         return True
     except Exception as e:
         conn.rollback()
@@ -577,9 +1629,13 @@ def update_user_admin_status(user_id: str, is_admin: bool) -> bool:
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute('UPDATE users SET is_admin = ? WHERE user_id = ?', (is_admin, user_id))
+        cursor.execute('UPDATE users SET is_admin = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (is_admin, user_id))
         updated = cursor.rowcount > 0
+        if updated:
+            _record_change(cursor, 'user_updated', 'users', user_id=user_id)
         conn.commit()
+        if updated:
+            _user_directory.invalidate()
         return updated
     except Exception as e:
         print(f"更新管理員狀態時發生錯誤: {e}")
@@ -592,9 +1648,13 @@ def update_user_reminder_schedule(user_id: str, schedule_type: str) -> bool:
     conn = get_db()
     cursor = conn.cursor()
     try:
-        cursor.execute('UPDATE users SET reminder_schedule = ? WHERE user_id = ?', (schedule_type, user_id))
+        cursor.execute('UPDATE users SET reminder_schedule = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (schedule_type, user_id))
         updated = cursor.rowcount > 0
+        if updated:
+            _record_change(cursor, 'user_updated', 'users', user_id=user_id)
         conn.commit()
+        if updated:
+            _user_directory.invalidate()
         return updated
     except Exception as e:
         print(f"更新用戶提醒排程時發生錯誤: {e}")
@@ -677,61 +1737,112 @@ def update_schedule_send_time(schedule_id: int, new_send_time: datetime) -> bool
 
 # ==================== 预约管理 ====================
 
-def add_appointment(user_id: str, date: str, time: str, notes: Optional[str] = None, user_name: Optional[str] = None, type: str = 'consultation') -> Optional[int]:
-    """新增預約。
-    
-    為了確保資料一致性，此函數會優先從 users 表中查詢最新的 user_name。
-    前端傳遞的 user_name 僅作為備用，以相容舊的呼叫方式。
+# 預約結果狀態
+BOOKING_BOOKED = 'booked'
+BOOKING_CONFLICT = 'conflict'
+BOOKING_UNKNOWN_USER = 'unknown_user'
+BOOKING_ERROR = 'error'
+
+# 參數名稱 time 會遮蔽 time 模組，預約函式改用此計時函式
+_booking_clock = time.perf_counter
+_booking_stats_lock = threading.Lock()
+_booking_stats = {'attempts': 0, 'booked': 0, 'conflicts': 0, 'errors': 0, 'lock_time_total': 0.0, 'lock_time_max': 0.0}
+
+def _record_booking_stats(status: str, lock_time: float) -> None:
+    with _booking_stats_lock:
+        _booking_stats['attempts'] += 1
+        key = {BOOKING_BOOKED: 'booked', BOOKING_CONFLICT: 'conflicts'}.get(status, 'errors')
+        _booking_stats[key] += 1
+        _booking_stats['lock_time_total'] += lock_time
+        _booking_stats['lock_time_max'] = max(_booking_stats['lock_time_max'], lock_time)
+
+def get_booking_stats() -> Dict:
+    """預約的成功/衝突次數與寫入鎖持有時間"""
+    with _booking_stats_lock:
+        stats = dict(_booking_stats)
+    stats['avg_lock_ms'] = (stats['lock_time_total'] / stats['attempts'] * 1000) if stats['attempts'] else 0.0
+    return stats
+
+def book_appointment(user_id: str, date: str, time: str, type: str = 'consultation', user_name: Optional[str] = None, notes: Optional[str] = None) -> Dict:
+    """
+    在單一 BEGIN IMMEDIATE 交易中檢查時段並新增預約。
+
+    user_name 一律以 users 表中的最新姓名為準，傳入的 user_name 只在找不到用戶時作為備用；
+    找不到的 manual_ 用戶會以備用姓名在同一交易中重新建立。
+    時段已被同類型的已確認預約佔用時不會寫入任何資料。
+
+    Returns:
+        Dict: status（booked / conflict / unknown_user / error）、appointment_id（成功時）、
+              holder_user_id（衝突時目前佔用該時段的用戶）、error（錯誤訊息）
     """
     conn = get_db()
     cursor = conn.cursor()
+    result = {'status': BOOKING_ERROR, 'appointment_id': None, 'holder_user_id': None, 'error': None}
+    created_user = False
+    started = None
     try:
-        # 1. 查詢最新的用戶姓名，確保資料正確性
-        # 1. 查詢最新的用戶姓名，確保資料正確性
+        # 一開始就取得寫入鎖，檢查與新增之間不會有其他寫入插隊；
+        # 在外層交易中呼叫時已位於 SAVEPOINT 內，沿用外層交易
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        started = _booking_clock()
         cursor.execute('SELECT name FROM users WHERE user_id = ?', (user_id,))
         user_row = cursor.fetchone()
-        
-        final_user_name = user_name
-
-        # 如果找不到用戶
-        if not user_row:
-            if user_id.startswith('manual_') and user_name:
-                # 自動修復：如果手動用戶不存在但有提供名稱，則重新建立
-                print(f"[APPOINTMENT INFO] 自動建立缺失的手動用戶: {user_name} ({user_id})")
-                zhuyin = _name_to_zhuyin(user_name)
-                try:
-                    cursor.execute("""
-                        INSERT INTO users (user_id, name, zhuyin, manual_update, is_admin)
-                        VALUES (?, ?, ?, TRUE, FALSE)
-                    """, (user_id, user_name, zhuyin))
-                except sqlite3.IntegrityError:
-                    pass # 應該不會發生，因為剛查過不存在
-                final_user_name = user_name
-            elif not user_name:
-                print(f"[APPOINTMENT ERROR] 新增預約失敗：找不到用戶 user_id={user_id}，備用名稱={user_name}")
-                return None
-        else:
-            final_user_name = user_row['name']
-
-        print(f"[APPOINTMENT DEBUG] 嘗試新增預約：user_id={user_id}, user_name={final_user_name}, date={date}, time={time}")
+        if user_row is None and user_id.startswith('manual_') and user_name:
+            # 自動修復：手動用戶不存在但有提供名稱時重新建立
+            cursor.execute('''
+                INSERT INTO users (user_id, name, zhuyin, manual_update, is_admin)
+                VALUES (?, ?, ?, TRUE, FALSE)
+            ''', (user_id, user_name, _name_to_zhuyin(user_name)))
+            _record_change(cursor, 'user_added', 'users', user_id=user_id)
+            created_user = True
+        elif user_row is None and not user_name:
+            conn.rollback()
+            result['status'] = BOOKING_UNKNOWN_USER
+            return result
+        final_user_name = user_row['name'] if user_row else user_name
+
+        # 條件式新增：同類型同時段沒有已確認的預約時才寫入
         cursor.execute('''
             INSERT INTO appointments (user_id, user_name, date, time, notes, type)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, final_user_name, date, time, notes, type))
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM appointments WHERE date = ? AND time = ? AND type = ? AND status = 'confirmed'
+            )
+        ''', (user_id, final_user_name, date, time, notes, type, date, time, type))
+        if cursor.rowcount == 0:
+            cursor.execute(
+                "SELECT user_id FROM appointments WHERE date = ? AND time = ? AND type = ? AND status = 'confirmed'",
+                (date, time, type)
+            )
+            holder = cursor.fetchone()
+            conn.rollback()
+            result.update(status=BOOKING_CONFLICT, holder_user_id=holder['user_id'] if holder else None)
+            return result
         new_id = cursor.lastrowid
+        _record_change(cursor, 'appointment_saved', id=new_id, user_id=user_id, date=date, time=time, type=type)
         conn.commit()
-        print(f"[APPOINTMENT SUCCESS] 預約成功建立：appointment_id={new_id}, {date} {time}")
-        return new_id
+        result.update(status=BOOKING_BOOKED, appointment_id=new_id)
+        if created_user:
+            _user_directory.invalidate()
+        return result
     except sqlite3.IntegrityError as e:
-        # 唯一性约束失败 - 通常表示此 (user_id, date, time) 的時段已被預約
-        print(f"[APPOINTMENT CONFLICT] 唯一性約束失敗（該時段可能已被預約）：user_id={user_id}, date={date}, time={time}, type={type}, detail={str(e)}")
-        return None
-    except Exception as e:
-        # 其他異常
-        print(f"[APPOINTMENT ERROR] 新增預約時發生異常：{type(e).__name__}: {str(e)}")
-        return None
+        # 唯一索引是最後一道防線（例如其他程式繞過此函式寫入）
+        conn.rollback()
+        result.update(status=BOOKING_CONFLICT, error=str(e))
+        return result
+    except sqlite3.Error as e:
+        conn.rollback()
+        result['error'] = f"{e.__class__.__name__}: {e}"
+        return result
     finally:
         conn.close()
+        if started is not None:
+            _record_booking_stats(result['status'], _booking_clock() - started)
+
+def add_appointment(user_id: str, date: str, time: str, notes: Optional[str] = None, user_name: Optional[str] = None, type: str = 'consultation') -> Optional[int]:
+    """新增預約，成功時回傳預約 ID，時段衝突、找不到用戶或發生錯誤時回傳 None（詳細結果請用 book_appointment）"""
+    return book_appointment(user_id, date, time, type=type, user_name=user_name, notes=notes)['appointment_id']
 
 def get_appointments_by_date_range(start_date: str, end_date: str) -> List[Dict]:
     """获取指定日期范围内的预约，并包含用户的提醒设置"""
@@ -751,6 +1862,70 @@ def get_appointments_by_date_range(start_date: str, end_date: str) -> List[Dict]
     conn.close()
     return appointments
 
+def get_week_snapshot(start_date: str, end_date: str) -> Dict:
+    """一次取得週排程所需的所有資料（預約、休診日、備取名單），固定只查詢三次；時段由 get_slot_template 提供
+
+    Returns:
+        Dict: appointments 為日期範圍內的預約（含用戶提醒設定），
+              closed_days 為範圍內的休診日集合，waiting_lists 為以日期為 key 的備取名單
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT 
+            a.*, 
+            u.reminder_schedule,
+            u.is_admin
+        FROM appointments a
+        LEFT JOIN users u ON a.user_id = u.user_id
+        WHERE a.date BETWEEN ? AND ?
+        ORDER BY a.date, a.time
+    ''', (start_date, end_date))
+    appointments = [dict(row) for row in cursor.fetchall()]
+
+    cursor.execute('SELECT date FROM closed_days WHERE date BETWEEN ? AND ?', (start_date, end_date))
+    closed_days = {row['date'] for row in cursor.fetchall()}
+
+    cursor.execute('''
+        SELECT * FROM waiting_list 
+        WHERE date BETWEEN ? AND ?
+        ORDER BY date, created_at
+    ''', (start_date, end_date))
+    waiting_lists = {}
+    for row in cursor.fetchall():
+        row_dict = dict(row)
+        waiting_lists.setdefault(row_dict['date'], []).append(row_dict)
+
+    conn.close()
+    return {
+        'appointments': appointments,
+        'closed_days': closed_days,
+        'waiting_lists': waiting_lists
+    }
+
+def get_booked_times(start_date: str, end_date: str, type: str = 'consultation') -> Dict[str, List[str]]:
+    """獲取日期範圍內指定類型已確認預約的時間，回傳以日期為 key 的字典（只讀 idx_confirmed_slot，不回表）"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT date, time FROM appointments
+        WHERE date BETWEEN ? AND ? AND type = ? AND status = 'confirmed'
+    ''', (start_date, end_date, type))
+    booked = {}
+    for apt_date, apt_time in cursor.fetchall():
+        booked.setdefault(apt_date, []).append(apt_time)
+    conn.close()
+    return booked
+
+def get_closed_days_between(start_date: str, end_date: str) -> set:
+    """獲取日期範圍內的休診日集合"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT date FROM closed_days WHERE date BETWEEN ? AND ?', (start_date, end_date))
+    closed_days = {row['date'] for row in cursor.fetchall()}
+    conn.close()
+    return closed_days
+
 def get_appointment_by_id(appointment_id: int) -> Optional[Dict]:
     """透過 ID 獲取單筆預約"""
     conn = get_db()
@@ -829,7 +2004,10 @@ WHERE id = ?
         cursor.execute('UPDATE appointments SET reply_status = ? WHERE id = ?', (status, appointment_id))
 
     updated = cursor.rowcount > 0
+    if updated:
+        _record_change(cursor, 'reply_status_changed', id=appointment_id, reply_status=status)
     conn.commit()
+    conn.close()
     return updated
 
 def get_active_slots_by_weekday(weekday: int, type: Optional[str] = None) -> List[Dict]:
@@ -929,6 +2107,7 @@ def add_closed_day(date: str, reason: Optional[str] = None) -> bool:
     cursor = conn.cursor()
     try:
         cursor.execute('INSERT INTO closed_days (date, reason) VALUES (?, ?)', (date, reason))
+        _record_change(cursor, 'closed_day_set', date=date)
         conn.commit()
         return True
     except sqlite3.IntegrityError:
@@ -942,6 +2121,8 @@ def delete_closed_day(date: str) -> bool:
     cursor = conn.cursor()
     cursor.execute('DELETE FROM closed_days WHERE date = ?', (date,))
     deleted = cursor.rowcount > 0
+    if deleted:
+        _record_change(cursor, 'closed_day_removed', date=date)
     conn.commit()
     conn.close()
     return deleted
@@ -1110,6 +2291,8 @@ def update_user_day_reply_status(user_id: str, date: str, status: str) -> bool:
         ''', (status, user_id, date))
     
     updated = cursor.rowcount > 0
+    if updated:
+        _record_change(cursor, 'reply_status_changed', user_id=user_id, date=date, reply_status=status)
     conn.commit()
     conn.close()
     return updated
@@ -1131,6 +2314,8 @@ def cancel_appointment(date: str, time: str, type: str = 'consultation') -> bool
     cursor = conn.cursor()
     cursor.execute("DELETE FROM appointments WHERE date = ? AND time = ? AND type = ?", (date, time, type))
     deleted = cursor.rowcount > 0
+    if deleted:
+        _record_change(cursor, 'appointment_cancelled', date=date, time=time, type=type)
     conn.commit()
     conn.close()
     return deleted
@@ -1142,6 +2327,8 @@ def cancel_user_appointment(appointment_id: int, user_id: str) -> bool:
     # 確保只有本人可以刪除自己的預約
     cursor.execute("DELETE FROM appointments WHERE id = ? AND user_id = ?", (appointment_id, user_id))
     deleted = cursor.rowcount > 0
+    if deleted:
+        _record_change(cursor, 'appointment_cancelled', id=appointment_id)
     conn.commit()
     conn.close()
     return deleted
@@ -1174,6 +2361,7 @@ def set_closed_day(date: str, reason: str) -> int:
     cursor.execute('INSERT OR REPLACE INTO closed_days (date, reason) VALUES (?, ?)', (date, reason))
     cursor.execute("DELETE FROM appointments WHERE date = ?", (date,))
     cancelled_count = cursor.rowcount
+    _record_change(cursor, 'closed_day_set', date=date, cancelled=cancelled_count)
     conn.commit()
     conn.close()
     return cancelled_count
@@ -1184,6 +2372,8 @@ def remove_closed_day(date: str) -> bool:
     cursor = conn.cursor()
     cursor.execute('DELETE FROM closed_days WHERE date = ?', (date,))
     removed = cursor.rowcount > 0
+    if removed:
+        _record_change(cursor, 'closed_day_removed', date=date)
     conn.commit()
     conn.close()
     return removed
@@ -1212,6 +2402,40 @@ def get_active_slots_by_weekday(weekday: int, type: str = 'consultation') -> Lis
     conn.close()
     return slots
 
+def _time_to_minutes(value: str) -> int:
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def expand_slot_settings(slot_settings: List[Dict], type: str = 'consultation') -> tuple:
+    """將時段設定（start_time ~ end_time，含結束時間）展開為排序後、不重複的時間點"""
+    # 根據類型設定時段間隔：看診15分鐘，推拿30分鐘
+    interval = 30 if type == 'massage' else 15
+    minutes = set()
+    for setting in slot_settings:
+        minutes.update(range(_time_to_minutes(setting['start_time']), _time_to_minutes(setting['end_time']) + 1, interval))
+    return tuple(f"{m // 60:02d}:{m % 60:02d}" for m in sorted(minutes))
+
+def _load_slot_templates() -> Dict[tuple, tuple]:
+    """讀取所有啟用的時段設定，並預先展開成 {(weekday, type): 時間點}"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT weekday, start_time, end_time, type FROM available_slots WHERE active = TRUE')
+    settings = {}
+    for row in cursor.fetchall():
+        # 與原本以 type = ? 查詢的行為一致：type 為 NULL 的時段不屬於任何類型
+        if row['type'] is None:
+            continue
+        settings.setdefault((row['weekday'], row['type']), []).append(row)
+    conn.close()
+    return {key: expand_slot_settings(rows, key[1]) for key, rows in settings.items()}
+
+# 時段範本：只在時段設定異動（slots 版本改變）後才重新展開
+_slot_template_cache = _VersionedCache('slots', _load_slot_templates)
+
+def get_slot_template(weekday: int, type: str = 'consultation') -> tuple:
+    """獲取指定星期與類型的所有時間點（已排序的不可變 tuple，由進程內快取提供）"""
+    return _slot_template_cache.get().get((weekday, type), ())
+
 def add_available_slot(weekday: int, start_time: str, end_time: str, note: Optional[str] = None, type: str = 'consultation') -> bool:
     """新增一個可預約時段"""
     conn = get_db()
@@ -1221,12 +2445,15 @@ def add_available_slot(weekday: int, start_time: str, end_time: str, note: Optio
             INSERT INTO available_slots (weekday, start_time, end_time, note, type)
             VALUES (?, ?, ?, ?, ?)
         ''', (weekday, start_time, end_time, note, type))
+        _record_change(cursor, 'slots_changed', weekday=weekday)
+        _bump_data_version(cursor, 'slots')
         conn.commit()
-        return True
     except sqlite3.IntegrityError:
         return False # 時段已存在
     finally:
         conn.close()
+    _slot_template_cache.invalidate()
+    return True
 
 def update_available_slot(slot_id: int, weekday: int, start_time: str, end_time: str, active: bool, note: Optional[str], type: str = 'consultation') -> bool:
     """更新一個可預約時段"""
@@ -1237,8 +2464,13 @@ def update_available_slot(slot_id: int, weekday: int, start_time: str, end_time:
         WHERE id=?
     ''', (weekday, start_time, end_time, active, note, type, slot_id))
     updated = cursor.rowcount > 0
+    if updated:
+        _record_change(cursor, 'slots_changed', slot_id=slot_id)
+        _bump_data_version(cursor, 'slots')
     conn.commit()
     conn.close()
+    if updated:
+        _slot_template_cache.invalidate()
     return updated
 
 def delete_available_slot(slot_id: int) -> bool:
@@ -1247,8 +2479,13 @@ def delete_available_slot(slot_id: int) -> bool:
     cursor = conn.cursor()
     cursor.execute('DELETE FROM available_slots WHERE id=?', (slot_id,))
     deleted = cursor.rowcount > 0
+    if deleted:
+        _record_change(cursor, 'slots_changed', slot_id=slot_id)
+        _bump_data_version(cursor, 'slots')
     conn.commit()
     conn.close()
+    if deleted:
+        _slot_template_cache.invalidate()
     return deleted
 
 def copy_slots(source_weekday: int, target_weekdays: List[int], types: List[str] = None) -> tuple[int, int]:
@@ -1295,7 +2532,10 @@ def copy_slots(source_weekday: int, target_weekdays: List[int], types: List[str]
         
         cursor.executemany('INSERT INTO available_slots (weekday, start_time, end_time, active, note, type) VALUES (?, ?, ?, ?, ?, ?)', slots_to_insert)
         inserted_count = cursor.rowcount
+        _record_change(cursor, 'slots_changed', weekdays=list(target_weekdays))
+        _bump_data_version(cursor, 'slots')
         conn.commit()
+        _slot_template_cache.invalidate()
         return inserted_count, deleted_count # 回傳新增數量和刪除數量
     except Exception as e:
         conn.rollback()
@@ -1310,10 +2550,14 @@ def update_user_zhuyin(user_id: str, zhuyin: str) -> bool:
     """更新用户注音"""
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('UPDATE users SET zhuyin = ? WHERE user_id = ?', (zhuyin, user_id))
+    cursor.execute('UPDATE users SET zhuyin = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (zhuyin, user_id))
     updated = cursor.rowcount > 0
+    if updated:
+        _record_change(cursor, 'user_updated', 'users', user_id=user_id)
     conn.commit()
     conn.close()
+    if updated:
+        _user_directory.invalidate()
     return updated
 
 def update_user_phone_field(user_id: str, field: str, phone: str) -> bool:
@@ -1322,10 +2566,14 @@ def update_user_phone_field(user_id: str, field: str, phone: str) -> bool:
         return False
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute(f'UPDATE users SET {field} = ? WHERE user_id = ?', (phone, user_id))
+    cursor.execute(f'UPDATE users SET {field} = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (phone, user_id))
     updated = cursor.rowcount > 0
+    if updated:
+        _record_change(cursor, 'user_updated', 'users', user_id=user_id)
     conn.commit()
     conn.close()
+    if updated:
+        _user_directory.invalidate()
     return updated
 
 def update_user_address(user_id: str, address: str) -> bool:
@@ -1334,8 +2582,12 @@ def update_user_address(user_id: str, address: str) -> bool:
     cursor = conn.cursor()
     cursor.execute('UPDATE users SET address = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (address, user_id))
     updated = cursor.rowcount > 0
+    if updated:
+        _record_change(cursor, 'user_updated', 'users', user_id=user_id)
     conn.commit()
     conn.close()
+    if updated:
+        _user_directory.invalidate()
     return updated
 
 def get_pending_schedules_to_send(current_time: datetime) -> List[Dict]:
@@ -1372,14 +2624,74 @@ def generate_and_save_zhuyin(user_id: str) -> Optional[str]:
         return new_zhuyin
     return None
 
+def regenerate_all_zhuyin(only_missing: bool = False) -> Dict:
+    """
+    重新計算所有用戶的注音，並在單一交易中批次寫回有變動的用戶。
+
+    Args:
+        only_missing: 只處理尚未有注音的用戶
+
+    Returns:
+        Dict: users（處理的用戶數）、names（不重複的姓名數）、updated（實際更新數）、
+              compute_seconds / write_seconds（計算與寫入耗時）、users_per_second
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        query = 'SELECT user_id, name, zhuyin FROM users'
+        if only_missing:
+            query += " WHERE zhuyin IS NULL OR zhuyin = ''"
+        cursor.execute(query)
+        users = cursor.fetchall()
+
+        started = time.perf_counter()
+        # 同名的用戶只計算一次（_name_to_zhuyin 本身也有快取）
+        zhuyin_by_name = {name: _name_to_zhuyin(name) for name in {user['name'] for user in users}}
+        changes = [
+            (zhuyin_by_name[user['name']], user['user_id'], user['name'])
+            for user in users if zhuyin_by_name[user['name']] != user['zhuyin']
+        ]
+        compute_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        updated = 0
+        if changes:
+            cursor.execute('BEGIN IMMEDIATE')
+            # 計算期間沒有鎖住資料庫，只寫回姓名仍與讀取時相同的用戶，不覆蓋期間改名者的注音
+            cursor.executemany('''
+                UPDATE users SET zhuyin = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ? AND name = ?
+            ''', changes)
+            updated = cursor.rowcount
+            if updated:
+                _record_change(cursor, 'users_zhuyin_regenerated', 'users', count=updated)
+            conn.commit()
+        write_seconds = time.perf_counter() - started
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if updated:
+        _user_directory.invalidate()
+
+    total_seconds = compute_seconds + write_seconds
+    return {
+        'users': len(users),
+        'names': len(zhuyin_by_name),
+        'updated': updated,
+        'compute_seconds': compute_seconds,
+        'write_seconds': write_seconds,
+        'users_per_second': len(users) / total_seconds if total_seconds else 0.0,
+    }
+
 def get_or_create_user_by_phone(phone: str) -> Optional[Dict]:
     """通过电话号码获取或创建用户"""
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM users WHERE phone = ? OR phone2 = ?', (phone, phone))
     user = cursor.fetchone()
+    conn.close()
     if user:
-        conn.close()
         return dict(user)
     else:
         # 如果用户不存在，创建一个新用户
@@ -1399,14 +2711,19 @@ def get_all_configs() -> List[Dict]:
     conn.close()
     return configs
 
-def get_config(key: str, default: Optional[str] = None) -> Optional[str]:
-    """获取单个系统配置值"""
+def _load_configs() -> Dict[str, str]:
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT value FROM configs WHERE key = ?', (key,))
-    row = cursor.fetchone()
+    cursor.execute('SELECT key, value FROM configs')
+    configs = {row['key']: row['value'] for row in cursor.fetchall()}
     conn.close()
-    return row['value'] if row else default
+    return configs
+
+_config_cache = _VersionedCache('configs', _load_configs)
+
+def get_config(key: str, default: Optional[str] = None) -> Optional[str]:
+    """获取单个系统配置值（由進程內快取提供，其他 worker 的修改最多延遲 CACHE_VERSION_CHECK_INTERVAL 秒）"""
+    return _config_cache.get().get(key, default)
 
 def set_config(key: str, value: str, description: Optional[str] = None) -> bool:
     """设置或更新系统配置"""
@@ -1421,9 +2738,20 @@ def set_config(key: str, value: str, description: Optional[str] = None) -> bool:
         updated_at = CURRENT_TIMESTAMP
     ''', (key, value, description))
     updated = cursor.rowcount > 0
+    new_version = _bump_data_version(cursor, 'configs')
     conn.commit()
     conn.close()
+    _config_cache.apply(new_version, lambda configs: configs.__setitem__(key, value))
     return updated
+
+def get_cache_stats() -> Dict:
+    """進程內快取的命中與載入次數"""
+    return {
+        'configs': _config_cache.get_stats(),
+        'slot_templates': _slot_template_cache.get_stats(),
+        'users': _user_directory.get_stats(),
+        'zhuyin': _zhuyin_initials.cache_info()._asdict(),
+    }
 # ==================== 備取名單管理 ====================
 
 def get_waiting_lists_by_date_range(start_date: str, end_date: str) -> Dict[str, List[Dict]]:
@@ -1457,6 +2785,7 @@ def add_to_waiting_list(date: str, user_id: str, user_name: str) -> Optional[Dic
             VALUES (?, ?, ?)
         ''', (date, user_id, user_name))
         item_id = cursor.lastrowid
+        _record_change(cursor, 'waiting_list_added', id=item_id, date=date)
         conn.commit()
         # 返回新增的項目
         return {"id": item_id, "date": date, "user_id": user_id, "user_name": user_name}
@@ -1472,6 +2801,8 @@ def remove_from_waiting_list(item_id: int) -> bool:
     cursor = conn.cursor()
     cursor.execute('DELETE FROM waiting_list WHERE id = ?', (item_id,))
     deleted = cursor.rowcount > 0
+    if deleted:
+        _record_change(cursor, 'waiting_list_removed', id=item_id)
     conn.commit()
     conn.close()
     return deleted
@@ -0,0 +1,370 @@
+"""
+預約搶位壓力測試
+
+模擬診所開放新一週預約時，大量 LINE 用戶同時透過 Webhook postback（選日期、選時間、確認預約）
+與預約頁（/api/availability、/api/book_appointment）搶同一批熱門時段：
+
+- 在暫存目錄建立全新的 appointments.db，並建立測試用戶與看診時段（結束後刪除，--keep 可保留）
+- 以本機 HTTP 伺服器模擬 api.line.me（個人資料與推播），透過 LINE_API_BASE_URL 導向
+- Webhook 內容以 LINE_CHANNEL_SECRET 計算有效的 X-Line-Signature
+- 以多執行緒的 werkzeug 伺服器啟動 app，依指定並行數送出真實 HTTP 請求
+
+結束後輸出各端點的 p50/p95/p99 延遲、吞吐量、SQLITE_BUSY（database is locked）次數與重複預約數；
+發現重複預約時以非零狀態碼結束。相同的參數與 --seed 會產生相同的請求序列。
+
+用法：
+    python load_test.py --users 300 --concurrency 50 --hot-slots 4
+    python load_test.py --users 1000 --concurrency 100 --webhook-async --json load_result.json
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CHANNEL_SECRET = 'load-test-channel-secret'
+BUSY_MARKERS = ('database is locked', 'database is busy', 'SQLITE_BUSY')
+
+# ============ 模擬 LINE API ============
+
+class _LineStubHandler(BaseHTTPRequestHandler):
+    """回應個人資料查詢與推播，其餘請求一律回傳空物件"""
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self):
+        endpoint = self.path.split('?')[0]
+        if endpoint.startswith('/v2/bot/profile/'):
+            endpoint = '/v2/bot/profile'
+        with self.server.lock:
+            self.server.counts[endpoint] += 1
+        return endpoint
+
+    def do_GET(self):
+        if self._count() == '/v2/bot/profile':
+            user_id = self.path.rsplit('/', 1)[-1]
+            self._reply({'userId': user_id, 'displayName': f'壓測{user_id[-4:]}', 'pictureUrl': ''})
+        else:
+            self._reply({})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self._count()
+        self._reply({})
+
+    def log_message(self, format, *args):
+        pass
+
+def start_line_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _LineStubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.counts = defaultdict(int)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ============ SQLITE_BUSY 計數 ============
+
+class BusyCounter(logging.Handler):
+    """
+    統計 database is locked 的次數。
+    app 的錯誤會寫入 logger（含例外堆疊），database.py 的部分函式則直接 print，
+    因此同時作為 logging handler 與 stdout 的包裝使用。
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(logging.WARNING)
+        self.stream = stream
+        self.count = 0
+        self._count_lock = threading.Lock()
+
+    def _check(self, text):
+        if text and any(marker in text for marker in BUSY_MARKERS):
+            with self._count_lock:
+                self.count += 1
+
+    def emit(self, record):
+        text = record.getMessage()
+        if record.exc_info:
+            text += ' ' + logging.Formatter().formatException(record.exc_info)
+        self._check(text)
+
+    def write(self, text):
+        self._check(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+# ============ 請求產生 ============
+
+def percentile(sorted_samples, pct):
+    """最近排名法的百分位數"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+def sign_body(body: bytes) -> str:
+    return base64.b64encode(hmac.new(CHANNEL_SECRET.encode('utf-8'), body, hashlib.sha256).digest()).decode('utf-8')
+
+def postback_body(user_id: str, data: str) -> bytes:
+    event = {
+        'type': 'postback',
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'webhookEventId': uuid.uuid4().hex,
+        'replyToken': uuid.uuid4().hex,
+        'source': {'type': 'user', 'userId': user_id},
+        'postback': {'data': data},
+    }
+    return json.dumps({'destination': 'U_load_bot', 'events': [event]}, ensure_ascii=False).encode('utf-8')
+
+class LoadRunner:
+    def __init__(self, base_url, session_cookie, targets, args):
+        import requests
+        self.requests = requests
+        self.base_url = base_url
+        self.session_cookie = session_cookie
+        self.targets = targets
+        self.args = args
+        self.samples = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.api_bookings = defaultdict(int)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _http(self):
+        if not hasattr(self.local, 'http'):
+            self.local.http = self.requests.Session()
+        return self.local.http
+
+    def _hit(self, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self._http().request(method, self.base_url + path, timeout=self.args.timeout, **kwargs)
+            status = response.status_code
+        except self.requests.RequestException:
+            response, status = None, None
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples[name].append(elapsed)
+            # 409 是搶位失敗的正常結果，不算錯誤
+            if status is None or (status >= 400 and status != 409):
+                self.failures[name] += 1
+        return response
+
+    def _webhook(self, name, user_id, data):
+        body = postback_body(user_id, data)
+        headers = {'Content-Type': 'application/json', 'X-Line-Signature': sign_body(body)}
+        return self._hit(name, 'POST', '/webhook', data=body, headers=headers)
+
+    def run_user(self, index):
+        """一位用戶的完整預約流程；依 --liff-percent 決定走預約頁或 LINE 聊天室確認"""
+        rng = random.Random(self.args.seed * 1_000_003 + index)
+        user_id = f"U_load_{index:05d}"
+        date, day_name, slot_time = rng.choice(self.targets)
+        via_liff = rng.random() * 100 < self.args.liff_percent
+        cookie = {'Cookie': f"{self.session_cookie[0]}={self.session_cookie[1][user_id]}"}
+
+        self._webhook('webhook select_date', user_id, f"action=select_date&date={date}&day_name={day_name}")
+        if via_liff:
+            self._hit('GET /api/availability', 'GET', '/api/availability', headers=cookie)
+        self._webhook('webhook select_time', user_id, f"action=select_time&date={date}&day_name={day_name}&time={slot_time}")
+        if via_liff:
+            response = self._hit('POST /api/book_appointment', 'POST', '/api/book_appointment',
+                                 json={'date': date, 'time': slot_time}, headers=cookie)
+            if response is not None and response.status_code == 200:
+                with self.lock:
+                    self.api_bookings[(date, slot_time)] += 1
+        else:
+            self._webhook('webhook confirm_booking', user_id, f"action=confirm_booking&date={date}&time={slot_time}")
+
+def find_double_bookings(conn):
+    rows = conn.execute('''
+        SELECT date, time, type, COUNT(*) AS count FROM appointments
+        WHERE status = 'confirmed'
+        GROUP BY date, time, type
+        HAVING COUNT(*) > 1
+    ''').fetchall()
+    return [dict(row) for row in rows]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='預約搶位壓力測試')
+    parser.add_argument('--users', type=int, default=200, help='模擬的 LINE 用戶數（每位走一次完整預約流程）')
+    parser.add_argument('--concurrency', type=int, default=50, help='同時進行的用戶數')
+    parser.add_argument('--hot-slots', type=int, default=4, help='所有用戶搶的熱門時段數')
+    parser.add_argument('--days', type=int, default=1, help='熱門時段分布在下週的前幾天')
+    parser.add_argument('--liff-percent', type=float, default=50, help='走預約頁 /api/book_appointment 的用戶比例（%%），其餘以 LINE 確認')
+    parser.add_argument('--webhook-async', action='store_true', help='Webhook 事件交給背景佇列處理（正式環境的預設）')
+    parser.add_argument('--push-rate', default='0', help='LINE 推播每秒上限，0 為不限制')
+    parser.add_argument('--timeout', type=float, default=60, help='單一請求逾時秒數')
+    parser.add_argument('--seed', type=int, default=1, help='亂數種子')
+    parser.add_argument('--json', dest='json_path', help='將結果另存為 JSON')
+    parser.add_argument('--keep', action='store_true', help='保留暫存目錄（資料庫與 app.log）供事後檢查')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='load_test_')
+    original_cwd = os.getcwd()
+    try:
+        return run(args, work_dir)
+    finally:
+        os.chdir(original_cwd)
+        if args.keep:
+            print(f"暫存目錄已保留：{work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def run(args, work_dir):
+    line_stub = start_line_stub()
+
+    # line_client 在匯入時讀取這些環境變數，必須在匯入 app 之前設定
+    os.environ['LINE_API_BASE_URL'] = f"http://127.0.0.1:{line_stub.server_port}"
+    os.environ['LINE_PUSH_RATE'] = str(args.push_rate)
+    os.environ['LINE_CHANNEL_SECRET'] = CHANNEL_SECRET
+    os.environ['LINE_CHANNEL_TOKEN'] = 'load-test-channel-token'
+    os.environ['FLASK_SECRET_KEY'] = 'load-test-secret-key'
+    os.environ['WEBHOOK_ASYNC'] = 'true' if args.webhook_async else 'false'
+    os.environ['WEBHOOK_MAX_PENDING'] = str(max(1000, args.users * 3))
+    sys.path.insert(0, ROOT_DIR)
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    # app.log 寫在暫存目錄，不污染專案目錄
+    os.chdir(work_dir)
+
+    import database as db
+    db.DB_FILE = os.path.join(work_dir, 'appointments.db')
+
+    from flask.logging import default_handler
+    from werkzeug.serving import make_server
+
+    from app import create_app
+    from app.utils.helpers import get_week_dates
+    from app.utils.webhook_queue import webhook_queue
+
+    app = create_app(start_scheduler=False)
+    app.logger.removeHandler(default_handler)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    busy_counter = BusyCounter(sys.stdout)
+    app.logger.addHandler(busy_counter)
+
+    # 建立用戶、每天 09:00–12:00 的看診時段，熱門時段取下週前幾天的前幾個時段
+    with app.app_context():
+        for weekday in range(7):
+            db.add_available_slot(weekday, '09:00', '12:00')
+        for index in range(args.users):
+            db.add_user(f"U_load_{index:05d}", f"壓測用戶{index}")
+        targets = []
+        for day in get_week_dates(1)[:max(1, args.days)]:
+            times = db.get_slot_template(day['weekday'])[:max(1, args.hot_slots)]
+            targets.extend((day['date'], day['day_name'], slot_time) for slot_time in times)
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    session_values = {
+        f"U_load_{index:05d}": serializer.dumps({'user': {
+            'user_id': f"U_load_{index:05d}", 'name': f"壓測用戶{index}", 'picture_url': None, 'is_admin': False
+        }})
+        for index in range(args.users)
+    }
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    runner = LoadRunner(f"http://127.0.0.1:{server.server_port}",
+                        (app.config['SESSION_COOKIE_NAME'], session_values), targets, args)
+
+    print(f"▶ {args.users} 位用戶、並行 {args.concurrency}、搶 {len(targets)} 個時段"
+          f"（Webhook {'非同步' if args.webhook_async else '同步'}處理），資料庫：{db.DB_FILE}")
+    original_stdout = sys.stdout
+    sys.stdout = busy_counter
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(runner.run_user, range(args.users)))
+        drained = webhook_queue.join(timeout=args.timeout) if args.webhook_async else True
+        elapsed = time.perf_counter() - started
+    finally:
+        sys.stdout = original_stdout
+        server.shutdown()
+        line_stub.shutdown()
+
+    conn = db.get_db()
+    double_bookings = find_double_bookings(conn)
+    confirmed = conn.execute("SELECT COUNT(*) FROM appointments WHERE status = 'confirmed'").fetchone()[0]
+    conn.close()
+    api_double = {f"{date} {slot_time}": count for (date, slot_time), count in runner.api_bookings.items() if count > 1}
+
+    endpoints = {}
+    for name, samples in sorted(runner.samples.items()):
+        samples = sorted(samples)
+        endpoints[name] = {
+            'requests': len(samples),
+            'errors': runner.failures[name],
+            'p50_ms': round(percentile(samples, 50) * 1000, 1),
+            'p95_ms': round(percentile(samples, 95) * 1000, 1),
+            'p99_ms': round(percentile(samples, 99) * 1000, 1),
+            'max_ms': round(samples[-1] * 1000, 1),
+        }
+    total_requests = sum(stats['requests'] for stats in endpoints.values())
+    report = {
+        'config': vars(args),
+        'elapsed_seconds': round(elapsed, 3),
+        'total_requests': total_requests,
+        'throughput_rps': round(total_requests / elapsed, 1) if elapsed else 0.0,
+        'endpoints': endpoints,
+        'sqlite_busy': busy_counter.count,
+        'bookings': db.get_booking_stats(),
+        'confirmed_appointments': confirmed,
+        'contested_slots': len(targets),
+        'double_bookings': double_bookings,
+        'api_double_bookings': api_double,
+        'webhook_queue': webhook_queue.stats() if args.webhook_async else None,
+        'webhook_queue_drained': drained,
+        'line_stub_requests': dict(line_stub.counts),
+    }
+
+    print(f"\n{'端點':<28}{'請求':>8}{'錯誤':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in endpoints.items():
+        print(f"{name:<28}{stats['requests']:>8}{stats['errors']:>8}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    bookings = report['bookings']
+    print(f"\n總計 {total_requests} 個請求，耗時 {report['elapsed_seconds']} 秒，吞吐量 {report['throughput_rps']} req/s")
+    print(f"預約：成功 {bookings['booked']}、衝突 {bookings['conflicts']}、錯誤 {bookings['errors']}，"
+          f"寫入鎖平均 {bookings['avg_lock_ms']:.2f} ms / 最長 {bookings['lock_time_max'] * 1000:.2f} ms")
+    print(f"已確認預約 {confirmed} 筆（熱門時段 {len(targets)} 個）")
+    print(f"SQLITE_BUSY：{busy_counter.count} 次")
+    if not drained:
+        print("⚠️ Webhook 佇列未在逾時內處理完，結果可能不完整")
+    if double_bookings or api_double:
+        print(f"❌ 重複預約：{double_bookings or api_double}")
+    else:
+        print("✅ 沒有重複預約")
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入 {json_path}")
+
+    return 1 if double_bookings or api_double else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
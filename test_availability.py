@@ -0,0 +1,118 @@
+import os
+import tempfile
+from datetime import datetime
+
+import database as db
+from app import create_app
+from app.utils.availability import compute_day_mask, get_availability
+
+
+def test_day_mask():
+    times = ('09:00', '09:15', '09:30', '09:45')
+    # 已預約的時段被遮掉，不在範本中的時間忽略
+    assert compute_day_mask(times, ['09:15', '12:00'], False, '2025-01-07', '2025-01-06', '10:00') == (0b1101, 0b0010)
+    # 今天：現在時刻（含）之前的時段不可預約
+    assert compute_day_mask(times, [], False, '2025-01-07', '2025-01-07', '09:15') == (0b1100, 0)
+    # 休診日與過去的日期整天不可預約，但仍保留已預約的位元
+    assert compute_day_mask(times, ['09:00'], True, '2025-01-07', '2025-01-06', '10:00') == (0, 0b0001)
+    assert compute_day_mask(times, [], False, '2025-01-06', '2025-01-07', '10:00') == (0, 0)
+
+def test_week_availability():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'availability_test.db')
+        try:
+            db.init_database()
+            # 2025-01-07 為週二（weekday=1）
+            db.add_available_slot(1, '09:00', '09:30')
+            db.add_available_slot(1, '09:00', '10:00', type='massage')
+            db.add_available_slot(2, '09:00', '09:15')
+            db.add_user("U_availability", "可預約測試")
+            db.add_appointment("U_availability", "2025-01-07", "09:15")
+            db.add_closed_day("2025-01-08")
+
+            now = datetime(2025, 1, 6, 12, 0)
+            week = get_availability('2025-01-07', '2025-01-09', now)
+            assert week['2025-01-07'].available_times() == ['09:00', '09:30']
+            assert not week['2025-01-07'].is_available('09:15')
+            assert week['2025-01-08'].closed and week['2025-01-08'].available_count() == 0
+            assert week['2025-01-09'].times == ()
+
+            # 不同類型的預約互不影響
+            massage = get_availability('2025-01-07', '2025-01-07', now, 'massage')['2025-01-07']
+            assert massage.available_times() == ['09:00', '09:30', '10:00']
+        finally:
+            db.DB_FILE = original_db_file
+
+def test_availability_horizon_endpoint():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'availability_api_test.db')
+        try:
+            app = create_app(start_scheduler=False)
+            client = app.test_client()
+            db.set_config('booking_window_weeks', '3')
+            for weekday in range(1, 6):
+                db.add_available_slot(weekday, '09:00', '09:30')
+
+            # 1. 一次回傳整個預約週數，每天帶各類型的遮罩
+            response = client.get('/api/availability')
+            assert response.status_code == 200
+            data = response.get_json()
+            assert [week['week_offset'] for week in data['weeks']] == [0, 1, 2]
+            day = data['weeks'][1]['days'][0]
+            assert data['templates']['consultation'][str(day['weekday'])] == ['09:00', '09:15', '09:30']
+            assert day['masks']['consultation'] == '7'
+            assert day['masks']['massage'] == '0'
+
+            # 2. 資料未變動時回傳 304（同一分鐘內）
+            etag = response.headers.get('ETag')
+            response = client.get('/api/availability', headers={'If-None-Match': etag})
+            assert response.status_code in (200, 304)
+
+            # 3. 預約後下一週同一天的第二個時段被遮掉
+            db.add_user("U_horizon", "多週測試")
+            db.add_appointment("U_horizon", day['date'], "09:15")
+            data = client.get('/api/availability').get_json()
+            assert data['weeks'][1]['days'][0]['masks']['consultation'] == '5'
+        finally:
+            db.DB_FILE = original_db_file
+
+def test_booking_page_masks():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'booking_page_test.db')
+        try:
+            app = create_app(start_scheduler=False)
+            client = app.test_client()
+            for weekday in range(1, 6):
+                db.add_available_slot(weekday, '09:00', '09:15')
+                db.add_available_slot(weekday, '09:00', '09:30', type='massage')
+            db.add_user("U_page", "預約頁測試")
+            with client.session_transaction() as sess:
+                sess['user'] = {'user_id': 'U_page', 'name': '預約頁測試'}
+
+            # 1. 上一週全部是過去的時段，與舊版逐一比較時間的結果相同
+            html = client.get('/?week_offset=-1').get_data(as_text=True)
+            assert 'time-slot available' not in html
+            assert html.count('time-slot unavailable') == 10
+
+            # 2. 推拿預約不佔用同一時間的看診時段（與唯一索引一致），看診預約才會
+            html = client.get('/?week_offset=1').get_data(as_text=True)
+            date = html.split("confirmBooking('", 1)[1].split("'", 1)[0]
+            db.add_appointment("U_page", date, "09:00", type='massage')
+            html = client.get('/?week_offset=1').get_data(as_text=True)
+            assert f"confirmBooking('{date}', '09:00')" in html
+            db.add_appointment("U_page", date, "09:00")
+            html = client.get('/?week_offset=1').get_data(as_text=True)
+            assert f"confirmBooking('{date}', '09:00')" not in html
+            assert f"confirmBooking('{date}', '09:15')" in html
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_day_mask()
+    test_week_availability()
+    test_availability_horizon_endpoint()
+    test_booking_page_masks()
+    print("✅ 可預約時段測試通過")
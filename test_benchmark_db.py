@@ -0,0 +1,35 @@
+import json
+import os
+import tempfile
+
+import benchmark_db
+import database as db
+
+
+def test_benchmark_smoke():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, 'bench.json')
+        args = ['--sizes', '300', '--repeat', '3', '--warmup', '1', '--data-dir', tmp_dir, '--output', output]
+        assert benchmark_db.main(args) == 0
+        # 第二次執行沿用快取的合成資料庫，並可與上一次的結果比較
+        assert benchmark_db.main(args[:-1] + [output + '.2', '--compare', output, '--threshold', '100000']) == 0
+
+        with open(output, encoding='utf-8') as f:
+            report = json.load(f)
+        results = report['results']['300']
+        assert {'get_appointments_by_date_range', 'get_closest_future_appointment', 'add_user[insert]',
+                'add_appointment', 'get_message_stats[month]', 'get_all_users', 'copy_slots'} <= set(results)
+        assert all(stats['n'] == 3 and stats['median_ms'] > 0 for stats in results.values())
+        # 量測在工作副本上進行，快取的資料庫與原本的 DB_FILE 都不受影響
+        assert original_db_file == db.DB_FILE
+        assert len([name for name in os.listdir(tmp_dir) if name.endswith('.db')]) == 1
+
+def test_parse_size():
+    assert [benchmark_db.parse_size(size) for size in ('1k', '100k', '1m', '250')] == [1000, 100000, 1000000, 250]
+    assert benchmark_db.size_label(1_000_000) == '1m'
+
+if __name__ == '__main__':
+    test_benchmark_smoke()
+    test_parse_size()
+    print("✅ 效能基準測試通過")
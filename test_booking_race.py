@@ -0,0 +1,54 @@
+import os
+import tempfile
+import threading
+
+import database as db
+
+
+def test_concurrent_bookings_for_same_slot():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'booking_race_test.db')
+        try:
+            db.init_database()
+            for i in range(20):
+                db.add_user(f"U_race_{i}", f"搶位測試{i}")
+
+            # 1. 20 位用戶同時搶同一個時段，只有一位成功，其餘都是衝突
+            results = []
+            barrier = threading.Barrier(20)
+
+            def book(i):
+                barrier.wait()
+                results.append(db.book_appointment(f"U_race_{i}", "2025-12-02", "10:00"))
+
+            threads = [threading.Thread(target=book, args=(i,)) for i in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            statuses = [r['status'] for r in results]
+            assert statuses.count(db.BOOKING_BOOKED) == 1
+            assert statuses.count(db.BOOKING_CONFLICT) == 19
+            winner = next(r for r in results if r['status'] == db.BOOKING_BOOKED)
+            assert all(r['holder_user_id'] == db.get_appointment_by_id(winner['appointment_id'])['user_id']
+                       for r in results if r['status'] == db.BOOKING_CONFLICT)
+
+            # 2. 不同類型的同一時段可以預約；找不到用戶且沒有備用名稱時不寫入
+            assert db.book_appointment("U_race_0", "2025-12-02", "10:00", type='massage')['status'] == db.BOOKING_BOOKED
+            assert db.book_appointment("U_missing", "2025-12-02", "11:00")['status'] == db.BOOKING_UNKNOWN_USER
+
+            # 3. 缺失的手動用戶在同一交易中重新建立，姓名以 users 表為準
+            result = db.book_appointment("manual_race", "2025-12-02", "11:00", user_name="手動搶位")
+            assert result['status'] == db.BOOKING_BOOKED
+            assert db.get_user_record("manual_race").name == "手動搶位"
+
+            stats = db.get_booking_stats()
+            assert stats['booked'] >= 3 and stats['conflicts'] >= 19
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_concurrent_bookings_for_same_slot()
+    print("✅ 同時搶位測試通過")
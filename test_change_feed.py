@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+import database as db
+from app.utils.change_feed import ChangeFeed
+
+
+def test_resubscribe_registers_before_replay():
+    original_db_file = db.DB_FILE
+    original_get_events = db.get_change_events_since
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'change_feed_test.db')
+        try:
+            db.init_database()
+            feed = ChangeFeed(poll_interval=3600)
+            db.set_closed_day('2025-01-07', '測試')
+            last_id = db.get_latest_change_event_id()
+            db.set_closed_day('2025-01-08', '測試')
+
+            # 讀取補送事件時訂閱必須已經登記，之後提交的事件才會由廣播送達
+            registered = []
+
+            def recording_get_events(since, limit=200):
+                registered.append(len(feed._subscribers))
+                return original_get_events(since, limit)
+
+            db.get_change_events_since = recording_get_events
+            subscription = feed.subscribe(last_id)
+            db.get_change_events_since = original_get_events
+            assert registered == [1]
+
+            replayed = subscription.get_nowait()
+            assert [event['id'] for event in replayed] == [last_id + 1]
+            feed.unsubscribe(subscription)
+            assert feed.subscriber_count() == 0
+        finally:
+            db.get_change_events_since = original_get_events
+            db.DB_FILE = original_db_file
+
+if __name__ == "__main__":
+    test_resubscribe_registers_before_replay()
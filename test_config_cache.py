@@ -0,0 +1,41 @@
+import os
+import sqlite3
+import tempfile
+
+import database as db
+
+
+def test_config_cache_coherence():
+    original_db_file = db.DB_FILE
+    original_interval = db._config_cache.check_interval
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'config_test.db')
+        try:
+            db.init_database()
+
+            # 1. 預設值與本進程寫入（直接更新快取，不需重新載入）
+            assert db.get_config('booking_window_weeks', '2') == '2'
+            loads = db._config_cache.stats['loads']
+            db.set_config('booking_window_weeks', '4')
+            assert db.get_config('booking_window_weeks') == '4'
+            assert db._config_cache.stats['loads'] == loads
+
+            # 2. 模擬其他 worker 直接寫入資料庫並遞增版本
+            conn = sqlite3.connect(db.DB_FILE)
+            conn.execute("UPDATE configs SET value = '6' WHERE key = 'booking_window_weeks'")
+            conn.execute("UPDATE data_versions SET version = version + 1 WHERE scope = 'configs'")
+            conn.commit()
+            conn.close()
+
+            # 版本檢查間隔內仍讀到舊值，間隔到期後重新載入
+            db._config_cache.check_interval = 3600
+            assert db.get_config('booking_window_weeks') == '4'
+            db._config_cache.check_interval = 0
+            assert db.get_config('booking_window_weeks') == '6'
+        finally:
+            db._config_cache.check_interval = original_interval
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_config_cache_coherence()
+    print("✅ 設定快取測試通過")
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+import database as db
+
+
+def test_hot_queries_use_indexes():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'index_test.db')
+        try:
+            # 1. 模擬舊資料庫：由 fix_db_index.py 建立、不含 type 的唯一索引
+            db.init_database()
+            conn = db.get_db()
+            conn.execute('DROP INDEX idx_confirmed_slot')
+            conn.execute("CREATE UNIQUE INDEX idx_confirmed_slot ON appointments(date, time) WHERE status = 'confirmed'")
+            conn.execute('PRAGMA user_version = 0')
+            conn.commit()
+            conn.close()
+
+            # 2. 重新初始化後索引會升級到目前版本
+            db.init_database()
+            conn = db.get_db()
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == db.INDEX_SET_VERSION
+            index_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_confirmed_slot'").fetchone()[0]
+            assert 'type' in index_sql
+            conn.close()
+
+            # 3. 同一時段可同時有看診與推拿，但同類型不可重複
+            db.add_user('U_index', '索引測試')
+            conn = db.get_db()
+            insert = "INSERT INTO appointments (user_id, user_name, date, time, type) VALUES ('U_index', '索引測試', '2025-01-06', '09:00', ?)"
+            conn.execute(insert, ('consultation',))
+            conn.execute(insert, ('massage',))
+            try:
+                conn.execute(insert, ('massage',))
+                pytest.fail("重複的已確認預約應被唯一索引擋下")
+            except sqlite3.IntegrityError:
+                pass
+            conn.rollback()
+            conn.close()
+
+            # 4. 既有資料違反新索引的唯一限制時，舊索引保留不動
+            conn = db.get_db()
+            conn.execute('DROP INDEX idx_confirmed_slot')
+            old_sql = "CREATE UNIQUE INDEX idx_confirmed_slot ON appointments(date, time, type, user_id) WHERE status = 'confirmed'"
+            conn.execute(old_sql)
+            duplicate = "INSERT INTO appointments (user_id, user_name, date, time, type) VALUES (?, '重複', '2025-01-06', '09:00', 'consultation')"
+            conn.execute(duplicate, ('U_dup_1',))
+            conn.execute(duplicate, ('U_dup_2',))
+            conn.execute('PRAGMA user_version = 0')
+            conn.commit()
+            conn.close()
+            db.init_database()
+            conn = db.get_db()
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+            assert conn.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_confirmed_slot'").fetchone()[0] == old_sql
+            conn.execute("DELETE FROM appointments WHERE user_id = 'U_dup_2'")
+            conn.commit()
+            conn.close()
+            db.init_database()
+
+            # 5. 所有熱門查詢都不能出現全表掃描
+            results = db.check_hot_query_plans()
+            for result in results:
+                print(f"{result['name']}: {result['plan']}")
+            assert not [result['name'] for result in results if result['full_scan']]
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_hot_queries_use_indexes()
+    print("✅ 索引測試通過")
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+
+import database as db
+
+
+def test_connection_pool_reuse():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'pool_test.db')
+        try:
+            db.init_database()
+
+            # 1. 同一執行緒連續呼叫只會建立一條實體連線
+            for i in range(20):
+                db.add_user(f"U_pool_{i}", f"連線池測試{i}")
+                db.get_user_by_id(f"U_pool_{i}")
+            stats = db.get_pool_stats()
+            print(f"Pool stats (single thread): {stats}")
+            assert stats['connections_created'] == 1
+            assert stats['reused'] >= 40
+            assert stats['in_use'] == 0
+
+            # 2. PRAGMA 只在建立連線時套用一次
+            conn = db.get_db()
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+            conn.close()
+
+            # 3. 巢狀呼叫共用同一條連線，hold 期間不歸還
+            db.hold_connection()
+            outer = db.get_db()
+            inner = db.get_db()
+            assert outer._conn is inner._conn
+            inner.close()
+            outer.close()
+            assert db.get_pool_stats()['in_use'] == 1
+            db.release_connection()
+            assert db.get_pool_stats()['in_use'] == 0
+
+            # 4. 多執行緒並行時，連線數不超過執行緒數
+            def worker():
+                for _ in range(10):
+                    db.get_all_users()
+            threads = [threading.Thread(target=worker) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            stats = db.get_pool_stats()
+            print(f"Pool stats (threads): {stats}")
+            assert stats['size'] <= 5
+            assert stats['in_use'] == 0
+        finally:
+            db.DB_FILE = original_db_file
+
+def test_connection_pool_release():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'pool_release_test.db')
+        try:
+            db.init_database()
+
+            # 1. 忘記 close() 的連線在包裝被回收時歸還
+            def leaky():
+                conn = db.get_db()
+                conn.execute('SELECT 1')
+            leaky()
+            assert db.get_pool_stats()['in_use'] == 0
+            db.add_user("U_pool_phone", "電話用戶", phone='0911000111')
+            assert db.get_or_create_user_by_phone('0911000111')['user_id'] == "U_pool_phone"
+            assert db.get_pool_stats()['in_use'] == 0
+
+            # 2. 執行緒結束時，未歸還的連線回到連線池
+            held = []
+            def worker():
+                held.append(db.get_db())
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+            held.clear()
+            assert db.get_pool_stats()['in_use'] == 0
+
+            # 3. 內層的 commit / rollback 不影響外層尚未提交的交易
+            outer = db.get_db()
+            outer.execute("INSERT INTO closed_days (date, reason) VALUES ('2030-01-01', 'outer')")
+            inner = db.get_db()
+            inner.execute("INSERT INTO closed_days (date, reason) VALUES ('2030-01-02', 'inner')")
+            inner.rollback()
+            inner.close()
+            inner = db.get_db()
+            inner.execute("INSERT INTO closed_days (date, reason) VALUES ('2030-01-03', 'inner')")
+            inner.commit()
+            inner.close()
+            assert outer.in_transaction
+            outer.rollback()
+            outer.close()
+            conn = db.get_db()
+            assert conn.execute("SELECT COUNT(*) FROM closed_days WHERE date LIKE '2030-%'").fetchone()[0] == 0
+            conn.close()
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == "__main__":
+    test_connection_pool_reuse()
+    test_connection_pool_release()
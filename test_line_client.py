@@ -0,0 +1,17 @@
+from app.utils.line_client import LineClient
+
+
+def test_post_retries_only_with_retry_key():
+    client = LineClient(base_url='http://127.0.0.1:9')
+    default_retry = client._get_session().get_adapter('https://api.line.me').max_retries
+    push_retry = client._get_session(retry_post=True).get_adapter('https://api.line.me').max_retries
+
+    # 一般請求（OAuth 授權碼交換、ID token 驗證）只重試冪等方法
+    assert not default_retry.is_retry('POST', 503)
+    assert default_retry.is_retry('GET', 503)
+    # 帶 X-Line-Retry-Key 的推播連 POST 也重試
+    assert push_retry.is_retry('POST', 503)
+    assert client._get_session() is client._get_session()
+
+if __name__ == "__main__":
+    test_post_retries_only_with_retry_key()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import time
+
+import database as db
+
+
+def test_message_stats_rollup():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'stats_test.db')
+        try:
+            db.init_database()
+            # send_time 以 UTC 記錄
+            month = time.strftime('%Y-%m', time.gmtime())
+
+            for i in range(30):
+                db.log_message_send(f"U_stats_{i % 3}", f"統計測試{i}", 'reminder_week' if i % 2 else 'custom_schedule',
+                                    'success' if i % 5 else 'failed', error_message=None if i % 5 else 'Error 500')
+            db.flush_message_log()
+
+            # 1. 彙總表與原始紀錄（指定用戶時走原始紀錄）的結果一致
+            stats = db.get_message_stats(month)
+            assert stats['total_messages'] == 30
+            assert stats['failed_count'] == 6
+            assert stats['message_types']['reminder_week']['total'] == 15
+            assert len(stats['errors']) == 6
+            per_user = [db.get_message_stats(month, f"U_stats_{i}")['total_messages'] for i in range(3)]
+            assert sum(per_user) == 30
+
+            # 2. 不指定條件時也能查詢
+            assert db.get_message_stats()['total_messages'] == 30
+            assert db.get_message_stats(month, message_type='custom_schedule')['success_count'] == 12
+
+            # 3. 重建彙總表後結果不變
+            before = db.get_message_stats(month)
+            db.rebuild_message_stats_daily()
+            assert db.get_message_stats(month) == before
+
+            # 4. 封存舊紀錄後重建彙總表，已封存日期的統計不會被清除
+            conn = db.get_db()
+            conn.execute("UPDATE message_log SET send_time = '2020-01-15 10:00:00' WHERE id IN (SELECT id FROM message_log ORDER BY id LIMIT 10)")
+            conn.commit()
+            conn.close()
+            db.rebuild_message_stats_daily()
+            assert db.get_message_stats('2020-01')['total_messages'] == 10
+            assert db.archive_message_log(30, archive_dir=tmp_dir)['archived'] == 10
+            db.rebuild_message_stats_daily()
+            assert db.get_message_stats('2020-01')['total_messages'] == 10
+            assert db.get_message_stats(month)['total_messages'] == 20
+
+            # 5. 新資料庫建立時已是增量 VACUUM，compact_database 不需要完整 VACUUM
+            assert db.compact_database()['mode'] == 'incremental'
+        finally:
+            db.DB_FILE = original_db_file
+
+def test_message_log_flush_retry():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'flush_retry_test.db')
+        try:
+            db.init_database()
+            conn = db.get_db()
+            conn.execute('ALTER TABLE message_log RENAME TO message_log_offline')
+            conn.commit()
+            conn.close()
+
+            # 1. 寫入失敗：紀錄放回緩衝區（超過上限的最舊紀錄捨棄），並重新排程
+            buffer = db._MessageLogBuffer(flush_size=100, flush_interval=0.05, max_pending=3)
+            buffer.add([db._message_log_row(f"U_retry_{i}", "重試測試", 'custom', 'success') for i in range(5)])
+            assert buffer.flush() == 0
+            assert (buffer.pending(), buffer.dropped) == (3, 2)
+            assert buffer._timer is not None
+
+            # 2. 資料庫恢復後，不需要新的 add() 也會由計時器寫入
+            conn = db.get_db()
+            conn.execute('ALTER TABLE message_log_offline RENAME TO message_log')
+            conn.commit()
+            conn.close()
+            deadline = time.monotonic() + 5
+            while buffer.pending() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert buffer.pending() == 0
+            conn = db.get_db()
+            user_ids = [row[0] for row in conn.execute('SELECT user_id FROM message_log ORDER BY id')]
+            conn.close()
+            assert user_ids == ['U_retry_2', 'U_retry_3', 'U_retry_4']
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_message_stats_rollup()
+    test_message_log_flush_retry()
+    print("✅ 訊息統計測試通過")
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import threading
+
+from flask import current_app
+
+import app.utils.push_dispatcher as push_dispatcher
+import database as db
+from app import create_app
+
+
+def test_send_day_reminders_route():
+    original_db_file = db.DB_FILE
+    original_send = push_dispatcher.send_line_message
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'reminder_test.db')
+        sent = []
+        lock = threading.Lock()
+
+        def fake_send_line_message(user_id, **_push):
+            # 工作執行緒中必須有 app context，否則讀取 current_app 會失敗
+            assert current_app.config['LINE_CHANNEL_TOKEN'] == 'test-token'
+            with lock:
+                sent.append(user_id)
+            return True
+
+        push_dispatcher.send_line_message = fake_send_line_message
+        try:
+            app = create_app(start_scheduler=False)
+            app.config['ADMIN_API_TOKEN'] = 'admin-token'
+            app.config['LINE_CHANNEL_TOKEN'] = 'test-token'
+            app.config['PUSH_WORKERS'] = 4
+            client = app.test_client()
+            headers = {'X-Admin-Token': 'admin-token'}
+
+            # 1. 多位用戶各有一筆預約，訊息內容不同，會分成多個批次並行發送
+            user_ids = [f"U_reminder_{i}" for i in range(6)]
+            for i, user_id in enumerate(user_ids):
+                db.add_user(user_id, f"提醒測試{i}")
+                db.add_appointment(user_id, "2025-12-02", f"{10 + i}:00", user_name=f"提醒測試{i}")
+
+            response = client.post('/api/admin/send_appointment_reminders', json={'type': 'day', 'date': '2025-12-02'}, headers=headers)
+            assert response.status_code == 200
+            result = response.get_json()
+            assert result['done'] is True
+            assert result['sent_count'] == len(user_ids)
+            assert result['failed_count'] == 0
+            assert sorted(sent) == sorted(user_ids)
+
+            # 2. 等待時間為 0 時先回應 202，之後可查詢背景任務的結果
+            app.config['REMINDER_RESPONSE_WAIT'] = 0
+            response = client.post('/api/admin/send_appointment_reminders', json={'type': 'day', 'date': '2025-12-02'}, headers=headers)
+            assert response.status_code in (200, 202)
+            job_id = response.get_json()['job_id']
+            response = client.get(f'/api/admin/reminder_jobs/{job_id}?wait=5', headers=headers)
+            assert response.status_code == 200
+            assert response.get_json()['sent_count'] == len(user_ids)
+
+            response = client.get('/api/admin/reminder_jobs/unknown', headers=headers)
+            assert response.status_code == 404
+        finally:
+            push_dispatcher.send_line_message = original_send
+            db.DB_FILE = original_db_file
+
+if __name__ == "__main__":
+    test_send_day_reminders_route()
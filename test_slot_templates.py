@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+import database as db
+
+
+def test_slot_template_invalidation():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'slot_template_test.db')
+        try:
+            db.init_database()
+
+            # 1. 展開結果與舊版 strptime 迴圈相同：含結束時間、去除重疊、排序
+            assert db.expand_slot_settings([
+                {'start_time': '10:00', 'end_time': '10:30'},
+                {'start_time': '09:45', 'end_time': '10:15'},
+            ]) == ('09:45', '10:00', '10:15', '10:30')
+            assert db.expand_slot_settings([{'start_time': '14:00', 'end_time': '15:00'}], 'massage') == ('14:00', '14:30', '15:00')
+
+            # 2. 重複查詢只展開一次
+            assert db.add_available_slot(2, '09:00', '09:30')
+            assert db.get_slot_template(2) == ('09:00', '09:15', '09:30')
+            loads = db._slot_template_cache.stats['loads']
+            for _ in range(10):
+                db.get_slot_template(2)
+                db.get_slot_template(2, 'massage')
+            assert db._slot_template_cache.stats['loads'] == loads
+
+            # 3. 新增、更新、複製、刪除時段後立即反映
+            assert db.add_available_slot(2, '14:00', '15:00', type='massage')
+            assert db.get_slot_template(2, 'massage') == ('14:00', '14:30', '15:00')
+
+            slot_id = next(s['id'] for s in db.get_all_available_slots() if s['type'] == 'consultation')
+            assert db.update_available_slot(slot_id, 2, '09:00', '09:15', True, None)
+            assert db.get_slot_template(2) == ('09:00', '09:15')
+
+            db.copy_slots(2, [3, 4])
+            assert db.get_slot_template(3) == ('09:00', '09:15')
+            assert db.get_slot_template(4, 'massage') == ('14:00', '14:30', '15:00')
+
+            assert db.delete_available_slot(slot_id)
+            assert db.get_slot_template(2) == ()
+
+            # 4. type 為 NULL 的時段不屬於看診或推拿
+            conn = db.get_db()
+            conn.execute("INSERT INTO available_slots (weekday, start_time, end_time, type) VALUES (5, '09:00', '09:30', NULL)")
+            conn.commit()
+            conn.close()
+            db._slot_template_cache.invalidate()
+            assert db.get_slot_template(5) == ()
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_slot_template_invalidation()
+    print("✅ 時段範本測試通過")
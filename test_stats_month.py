@@ -0,0 +1,34 @@
+import os
+import tempfile
+from datetime import datetime
+
+import database as db
+from app import create_app
+
+
+def test_invalid_stats_month_falls_back():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'stats_month_test.db')
+        try:
+            app = create_app(start_scheduler=False)
+            app.config['ADMIN_API_TOKEN'] = 'admin-token'
+            client = app.test_client()
+            headers = {'X-Admin-Token': 'admin-token'}
+
+            # 格式不正確的月份改用本月，不回傳 500
+            for month in ('2025-13', 'abc', '2025'):
+                response = client.get(f'/api/admin/message_stats?month={month}', headers=headers)
+                assert response.status_code == 200
+
+            with app.app_context():
+                from app.utils.helpers import get_stats_month
+                current_month = datetime.now(app.config['TAIPEI_TZ']).strftime('%Y-%m')
+                assert get_stats_month('2025-2') == '2025-02'
+                assert get_stats_month('bad') == current_month
+                assert get_stats_month(None) == current_month
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == "__main__":
+    test_invalid_stats_month_falls_back()
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import tempfile
+
+import database as db
+
+
+def test_user_directory_invalidation():
+    original_db_file = db.DB_FILE
+    original_interval = db._user_directory.check_interval
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'user_directory_test.db')
+        try:
+            db.init_database()
+            db.add_user("U_dir_1", "目錄測試一")
+            db.add_user("U_dir_2", "目錄測試二", picture_url="https://example.com/a.png")
+
+            # 1. 重複讀取只載入一次；沒有實際變更的 add_user 不會捨棄快取
+            assert {u.user_id for u in db.get_user_directory()} == {"U_dir_1", "U_dir_2"}
+            loads = db._user_directory.stats['loads']
+            db.add_user("U_dir_2", "目錄測試二", picture_url="https://example.com/a.png")
+            for _ in range(10):
+                db.get_user_record("U_dir_1")
+            assert db._user_directory.stats['loads'] == loads
+
+            # 2. 各種用戶異動後立即反映
+            assert db.update_user_admin_status("U_dir_1", True)
+            assert db.get_user_record("U_dir_1").is_admin is True
+            assert db.update_user_phone_field("U_dir_1", 'phone2', '0912345678')
+            assert db.get_user_record("U_dir_1").phone2 == '0912345678'
+            assert db.update_user_name("U_dir_2", "改名測試")
+            assert db.get_user_record("U_dir_2").name == "改名測試"
+            assert db.delete_user("U_dir_2")
+            assert db.get_user_record("U_dir_2") is None
+
+            # 3. 其他 worker 的修改在版本檢查後反映
+            conn = sqlite3.connect(db.DB_FILE)
+            conn.execute("UPDATE users SET is_admin = FALSE WHERE user_id = 'U_dir_1'")
+            conn.execute("UPDATE data_versions SET version = version + 1 WHERE scope = 'users'")
+            conn.commit()
+            conn.close()
+            db._user_directory.check_interval = 0
+            assert db.get_user_record("U_dir_1").is_admin is False
+        finally:
+            db._user_directory.check_interval = original_interval
+            db.DB_FILE = original_db_file
+
+def test_add_user_skips_unchanged():
+    original_db_file = db.DB_FILE
+    original_zhuyin = db._name_to_zhuyin
+    calls = []
+
+    def counting_zhuyin(name):
+        calls.append(name)
+        return original_zhuyin(name)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'add_user_test.db')
+        db._name_to_zhuyin = counting_zhuyin
+        try:
+            db.init_database()
+            assert db.add_user("U_upsert", "變更測試", picture_url="https://example.com/a.png") is True
+            assert calls == ["變更測試"]
+
+            # 1. 姓名與頭像都沒變：不寫入、不遞增版本，也不計算注音
+            version = db.get_data_version('users')
+            for _ in range(5):
+                assert db.add_user("U_upsert", "變更測試", picture_url="https://example.com/a.png") is False
+            assert db.get_data_version('users') == version
+            assert calls == ["變更測試"]
+
+            # 2. 只換頭像時不重新計算注音
+            assert db.add_user("U_upsert", "變更測試", picture_url="https://example.com/b.png") is True
+            assert calls == ["變更測試"]
+            assert db.get_user_record("U_upsert").picture_url == "https://example.com/b.png"
+
+            # 3. 改名時才計算注音
+            assert db.add_user("U_upsert", "改名測試", picture_url="https://example.com/b.png") is True
+            assert calls == ["變更測試", "改名測試"]
+            assert db.get_user_record("U_upsert").zhuyin == original_zhuyin("改名測試")
+
+            # 4. 手動修改過姓名的用戶：LINE 名稱不同也不寫入
+            assert db.update_user_name("U_upsert", "手動姓名")
+            assert db.add_user("U_upsert", "LINE 名稱", picture_url="https://example.com/b.png") is False
+            assert db.get_user_record("U_upsert").name == "手動姓名"
+
+            # 5. 快取未載入時只查詢單一用戶，不載入整份目錄；已載入時寫入後直接更新快取
+            db._user_directory.invalidate()
+            loads = db._user_directory.stats['loads']
+            assert db.add_user("U_upsert", "LINE 名稱", picture_url="https://example.com/b.png") is False
+            assert db.add_user("U_cold", "冷快取") is True
+            assert db._user_directory.stats['loads'] == loads
+            assert db.get_user_record("U_cold").name == "冷快取"
+            loads = db._user_directory.stats['loads']
+            assert db.add_user("U_warm", "熱快取") is True
+            assert db.add_user("U_cold", "冷快取", picture_url="https://example.com/c.png") is True
+            assert db.get_user_directory()[0].user_id == "U_warm"
+            assert db.get_user_record("U_cold").picture_url == "https://example.com/c.png"
+            assert db._user_directory.stats['loads'] == loads
+        finally:
+            db._name_to_zhuyin = original_zhuyin
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_user_directory_invalidation()
+    test_add_user_skips_unchanged()
+    print("✅ 用戶目錄測試通過")
@@ -0,0 +1,48 @@
+import os
+import sqlite3
+import tempfile
+
+import database as db
+
+
+def test_user_delta_sync():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'user_sync_test.db')
+        try:
+            db.init_database()
+            db.add_user("U_sync_1", "同步測試一")
+            db.add_user("U_sync_2", "同步測試二")
+
+            # 1. 第一次同步取得完整列表
+            full = db.get_user_changes()
+            assert full['full']
+            assert {u['user_id'] for u in full['users']} == {"U_sync_1", "U_sync_2"}
+            assert full['sync_token']
+
+            # 把既有資料的時間往前調，模擬之後才發生的變更
+            conn = sqlite3.connect(db.DB_FILE)
+            conn.execute("UPDATE users SET updated_at = '2020-01-01 00:00:00'")
+            conn.commit()
+            conn.close()
+            token = '2020-01-01 00:00:01'
+
+            # 2. 沒有變更時不回傳任何用戶
+            delta = db.get_user_changes(token)
+            assert not delta['full'] and delta['users'] == [] and delta['deleted'] == []
+            assert delta['sync_token'] == token
+
+            # 3. 只回傳修改過的用戶與刪除的 user_id
+            assert db.update_user_admin_status("U_sync_1", True)
+            assert db.delete_user("U_sync_2")
+            delta = db.get_user_changes(token)
+            assert [u['user_id'] for u in delta['users']] == ["U_sync_1"]
+            assert delta['users'][0]['is_admin'] is True
+            assert delta['deleted'] == ["U_sync_2"]
+            assert delta['sync_token'] > token
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_user_delta_sync()
+    print("✅ 用戶增量同步測試通過")
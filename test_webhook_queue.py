@@ -0,0 +1,46 @@
+import contextlib
+import logging
+import threading
+
+from app.utils.webhook_queue import WebhookEventQueue
+
+
+class _FakeApp:
+    logger = logging.getLogger('test_webhook_queue')
+
+    def app_context(self):
+        return contextlib.nullcontext()
+
+def _event(user_id, event_id):
+    return {'type': 'postback', 'webhookEventId': event_id, 'source': {'userId': user_id}}
+
+def test_full_queue_rejects_instead_of_reordering():
+    webhook_queue = WebhookEventQueue(workers=1, max_pending=1)
+    app = _FakeApp()
+    release = threading.Event()
+    started = threading.Event()
+    handled = []
+
+    def handler(event):
+        started.set()
+        release.wait(5)
+        handled.append(event['webhookEventId'])
+
+    # 1. 第一個事件佔住 worker，第二個填滿佇列，第三個等待逾時後被拒絕（不會在呼叫端直接處理）
+    assert webhook_queue.submit(app, _event('U1', 'e1'), handler)
+    started.wait(5)
+    assert webhook_queue.submit(app, _event('U1', 'e2'), handler)
+    assert not webhook_queue.submit(app, _event('U1', 'e3'), handler, timeout=0.05)
+    assert webhook_queue.stats()['rejected'] == 1
+
+    # 2. LINE 重送時，已放入佇列的事件略過，被拒絕的事件依序補上
+    release.set()
+    assert webhook_queue.submit(app, _event('U1', 'e2'), handler, timeout=5)
+    assert webhook_queue.submit(app, _event('U1', 'e3'), handler, timeout=5)
+    assert webhook_queue.join(timeout=5)
+    assert handled == ['e1', 'e2', 'e3']
+    assert webhook_queue.stats()['duplicates'] == 1
+
+if __name__ == '__main__':
+    test_full_queue_rejects_instead_of_reordering()
+    print("✅ Webhook 佇列測試通過")
@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import database as db
+from app import create_app
+
+
+def test_week_appointments_etag():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'etag_test.db')
+        try:
+            app = create_app(start_scheduler=False)
+            client = app.test_client()
+
+            # 1. 第一次請求取得 ETag
+            response = client.get('/api/admin/get_week_appointments')
+            assert response.status_code == 200
+            etag = response.headers.get('ETag')
+            print(f"First ETag: {etag}")
+            assert etag
+
+            # 2. 資料未變動時回傳 304
+            response = client.get('/api/admin/get_week_appointments', headers={'If-None-Match': etag})
+            assert response.status_code == 304
+
+            # 3. 寫入預約後版本前進，ETag 改變
+            version_before = db.get_data_version('schedule')
+            db.add_user("U_etag_test", "ETag Test User")
+            db.add_appointment("U_etag_test", "2025-12-02", "10:00", user_name="ETag Test User")
+            assert db.get_data_version('schedule') > version_before
+
+            response = client.get('/api/admin/get_week_appointments', headers={'If-None-Match': etag})
+            assert response.status_code == 200
+            assert response.headers.get('ETag') != etag
+
+            # 4. 沒有實際刪除任何資料時，版本不變
+            version_before = db.get_data_version('schedule')
+            db.remove_from_waiting_list(999999)
+            assert db.get_data_version('schedule') == version_before
+
+            # 5. 預設仍附上用戶列表（相容舊版前端）；users=0 時省略，且用戶變動不影響 ETag
+            response = client.get('/api/admin/get_week_appointments')
+            assert "U_etag_test" in {u['user_id'] for u in response.get_json()['users']}
+            response = client.get('/api/admin/get_week_appointments?users=0')
+            assert 'users' not in response.get_json()
+            etag = response.headers.get('ETag')
+            db.update_user_admin_status("U_etag_test", True)
+            response = client.get('/api/admin/get_week_appointments?users=0', headers={'If-None-Match': etag})
+            assert response.status_code == 304
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == "__main__":
+    test_week_appointments_etag()
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import tempfile
+
+import database as db
+
+
+def test_zhuyin_memo():
+    db._zhuyin_initials.cache_clear()
+    first = db._name_to_zhuyin("快取測試")
+    assert db._name_to_zhuyin("快取測試") == first
+    info = db._zhuyin_initials.cache_info()
+    assert info.misses == 1 and info.hits == 1
+    assert info.maxsize == db.ZHUYIN_CACHE_SIZE
+    assert db.get_cache_stats()['zhuyin']['hits'] == 1
+    assert db.warm_up_zhuyin() >= 0
+
+def test_zhuyin_failure_not_memoized():
+    original_pinyin = db.pinyin
+
+    def failing_pinyin(*_args, **_kwargs):
+        raise RuntimeError("dictionary unavailable")
+
+    db._zhuyin_initials.cache_clear()
+    db.pinyin = failing_pinyin
+    try:
+        assert db._name_to_zhuyin("失敗測試") == ""
+    finally:
+        db.pinyin = original_pinyin
+    # 轉換恢復正常後重新計算，不會沿用失敗時的空字串
+    assert db._name_to_zhuyin("失敗測試") == db._zhuyin_initials("失敗測試")
+    assert db._zhuyin_initials.cache_info().currsize == 1
+
+def test_regenerate_all_zhuyin():
+    original_db_file = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_FILE = os.path.join(tmp_dir, 'zhuyin_test.db')
+        try:
+            db.init_database()
+            db.add_user("U_zhuyin_1", "注音測試")
+            db.add_user("U_zhuyin_2", "注音測試")
+            db.add_user("U_zhuyin_3", "另一位")
+            expected = db._name_to_zhuyin("注音測試")
+
+            conn = sqlite3.connect(db.DB_FILE)
+            conn.execute("UPDATE users SET zhuyin = 'ㄨ' WHERE user_id = 'U_zhuyin_1'")
+            conn.execute("UPDATE users SET zhuyin = NULL WHERE user_id = 'U_zhuyin_3'")
+            conn.commit()
+            conn.close()
+
+            # 1. 只處理缺少注音的用戶
+            result = db.regenerate_all_zhuyin(only_missing=True)
+            assert (result['users'], result['updated']) == (1, 1)
+            assert db.get_user_record("U_zhuyin_3").zhuyin == db._name_to_zhuyin("另一位")
+
+            # 2. 全部重新計算：同名只計算一次，只寫回有變動的用戶
+            version = db.get_data_version('users')
+            result = db.regenerate_all_zhuyin()
+            assert (result['users'], result['names'], result['updated']) == (3, 2, 1)
+            assert db.get_user_record("U_zhuyin_1").zhuyin == expected
+            assert db.get_data_version('users') == version + 1
+
+            # 3. 計算期間改名的用戶不會被寫回舊姓名的注音
+            original_name_to_zhuyin = db._name_to_zhuyin
+
+            def rename_during_compute(_name):
+                rename = sqlite3.connect(db.DB_FILE)
+                rename.execute("UPDATE users SET name = '改名', zhuyin = 'ㄍㄇ' WHERE user_id = 'U_zhuyin_1'")
+                rename.commit()
+                rename.close()
+                return 'ㄨ'
+
+            db._name_to_zhuyin = rename_during_compute
+            try:
+                assert db.regenerate_all_zhuyin()['updated'] == 2
+            finally:
+                db._name_to_zhuyin = original_name_to_zhuyin
+            conn = sqlite3.connect(db.DB_FILE)
+            assert conn.execute("SELECT zhuyin FROM users WHERE user_id = 'U_zhuyin_1'").fetchone()[0] == 'ㄍㄇ'
+            conn.execute("UPDATE users SET name = '注音測試', zhuyin = ? WHERE user_id = 'U_zhuyin_1'", (expected,))
+            conn.commit()
+            conn.close()
+            db.regenerate_all_zhuyin()
+            version = db.get_data_version('users')
+
+            # 4. 沒有變動時不寫入
+            assert db.regenerate_all_zhuyin()['updated'] == 0
+            assert db.get_data_version('users') == version
+        finally:
+            db.DB_FILE = original_db_file
+
+if __name__ == '__main__':
+    test_zhuyin_memo()
+    test_zhuyin_failure_not_memoized()
+    test_regenerate_all_zhuyin()
+    print("✅ 注音測試通過")